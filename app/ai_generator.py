@@ -9,42 +9,72 @@ from pathlib import Path
 from typing import List, Optional
 from PIL import Image
 import gc
+import time
+from dataclasses import dataclass, field
+
+from .inference_backends import apply_inference_backend, inference_context, model_version_key
+from .metrics import CACHE_REQUESTS, MODEL_LOAD_SECONDS, StepTimer
+from .profiling import add_pipeline_spans, add_span, trace_span
+from .schedulers import build_scheduler, resolve_sampling
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class PreviewResult:
+    """Low-resolution preview pass kept in memory until it is refined."""
+    images: List[Image.Image]
+    latents: List[torch.Tensor]
+    seeds: List[int]
+    prompt_embeds: torch.Tensor
+    negative_prompt_embeds: Optional[torch.Tensor]
+    model_name: str
+    model_path: Optional[str] = None
+    metadata: dict = field(default_factory=dict)
+
+
 class AIImageGenerator:
     """
     Manages AI models for image generation.
     Supports Stable Diffusion and custom trained models (LoRA).
     """
     
-    def __init__(self, cache_dir: str = "./models_cache"):
+    def __init__(self, cache_dir: str = "./models_cache", backend: str = "eager", device: Optional[str] = None):
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         self.current_pipeline = None
         self.current_model_name = None
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.schedulers = {}  # scheduler instances for the current model, by registry name
+        self.base_scheduler_config = None
+        self.img2img_pipeline = None  # shares components with current_pipeline
+        self.backend = backend
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         
-        logger.info(f"AI Generator initialized on device: {self.device}")
+        logger.info(f"AI Generator initialized on device: {self.device} (backend: {self.backend})")
         if self.device == "cpu":
             logger.warning("GPU not available. Image generation will be slower on CPU.")
     
     def _load_pipeline(self, model_name: str, model_path: Optional[str] = None):
         """Load a Stable Diffusion pipeline."""
-        from diffusers import StableDiffusionPipeline, DPMSolverMultistepScheduler
+        from diffusers import StableDiffusionPipeline
         
         # Don't reload if already loaded
         if self.current_model_name == model_name and self.current_pipeline is not None:
+            CACHE_REQUESTS.inc(cache="pipeline", result="hit")
             return self.current_pipeline
+        CACHE_REQUESTS.inc(cache="pipeline", result="miss")
         
         # Clear previous pipeline
         if self.current_pipeline is not None:
             del self.current_pipeline
+            self.current_pipeline = None
+            self.img2img_pipeline = None
+            self.schedulers = {}
             gc.collect()
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
         
+        load_start = time.perf_counter()
         try:
             # Determine model identifier
             if model_path and Path(model_path).exists():
@@ -71,14 +101,18 @@ class AIImageGenerator:
                 safety_checker=None if os.getenv("DISABLE_SAFETY_CHECKER", "false").lower() == "true" else "default",
             )
             
-            # Use DPM++ solver for faster generation
-            pipeline.scheduler = DPMSolverMultistepScheduler.from_config(
-                pipeline.scheduler.config
-            )
-            
             # Move to device
             pipeline = pipeline.to(self.device)
             
+            # Apply the optional optimized backend (compiled/ONNX artifacts are cached on disk)
+            pipeline = apply_inference_backend(
+                pipeline,
+                self.backend,
+                artifacts_dir=self.cache_dir / "compiled",
+                model_key=model_version_key(model_id, pipeline.unet.dtype),
+                device=self.device,
+            )
+            
             # Enable memory optimizations
             if self.device == "cuda":
                 pipeline.enable_attention_slicing()
@@ -90,14 +124,28 @@ class AIImageGenerator:
             
             self.current_pipeline = pipeline
             self.current_model_name = model_name
+            # Keep the model's own scheduler config as the base for every registry scheduler
+            self.base_scheduler_config = pipeline.scheduler.config
             
-            logger.info(f"Model {model_name} loaded successfully")
+            load_seconds = time.perf_counter() - load_start
+            MODEL_LOAD_SECONDS.observe(load_seconds, backend=self.backend)
+            add_span("model_load", load_seconds)
+            logger.info(f"Model {model_name} loaded successfully in {load_seconds:.1f}s")
             return pipeline
             
         except Exception as e:
             logger.error(f"Failed to load model {model_name}: {e}", exc_info=True)
             raise
     
+    def _get_scheduler(self, name: str):
+        """Return the cached scheduler instance for the loaded model."""
+        if name not in self.schedulers:
+            CACHE_REQUESTS.inc(cache="scheduler", result="miss")
+            self.schedulers[name] = build_scheduler(name, self.base_scheduler_config)
+        else:
+            CACHE_REQUESTS.inc(cache="scheduler", result="hit")
+        return self.schedulers[name]
+    
     async def generate_images(
         self,
         prompt: str,
@@ -110,6 +158,8 @@ class AIImageGenerator:
         num_inference_steps: int = 30,
         guidance_scale: float = 7.5,
         seed: Optional[int] = None,
+        scheduler: Optional[str] = None,
+        quality: str = "standard",
     ) -> List[Image.Image]:
         """
         Generate images using Stable Diffusion.
@@ -125,6 +175,8 @@ class AIImageGenerator:
             num_inference_steps: Number of denoising steps
             guidance_scale: How strictly to follow the prompt (CFG scale)
             seed: Random seed for reproducibility
+            scheduler: Sampling scheduler name (see app.schedulers)
+            quality: "standard" or "fast" (few-step solver for previews)
             
         Returns:
             List of PIL Image objects
@@ -133,12 +185,25 @@ class AIImageGenerator:
             # Load the pipeline
             pipeline = self._load_pipeline(model_name, model_path)
             
+            # Select the scheduler, possibly reducing steps for the fast tier
+            scheduler_name, num_inference_steps = resolve_sampling(scheduler, num_inference_steps, quality)
+            pipeline.scheduler = self._get_scheduler(scheduler_name)
+            
             # Set up generator for reproducibility
             generator = None
             if seed is not None:
                 generator = torch.Generator(device=self.device).manual_seed(seed)
             
-            logger.info(f"Generating {num_outputs} image(s) with prompt: '{prompt[:50]}...'")
+            logger.info(
+                f"Generating {num_outputs} image(s) with {scheduler_name} ({num_inference_steps} steps), "
+                f"prompt: '{prompt[:50]}...'"
+            )
+            
+            # Encode the prompt once for all outputs
+            with trace_span("encode"), torch.no_grad():
+                prompt_embeds, negative_prompt_embeds = self._encode_prompt(
+                    pipeline, prompt, negative_prompt, guidance_scale
+                )
             
             # Generate images
             images = []
@@ -148,15 +213,20 @@ class AIImageGenerator:
                 if seed is not None and i > 0:
                     current_generator = torch.Generator(device=self.device).manual_seed(seed + i)
                 
-                result = pipeline(
-                    prompt=prompt,
-                    negative_prompt=negative_prompt,
-                    width=width,
-                    height=height,
-                    num_inference_steps=num_inference_steps,
-                    guidance_scale=guidance_scale,
-                    generator=current_generator,
-                )
+                step_timer = StepTimer(scheduler_name)
+                call_start = time.perf_counter()
+                with inference_context(self.backend, self.device):
+                    result = pipeline(
+                        prompt_embeds=prompt_embeds,
+                        negative_prompt_embeds=negative_prompt_embeds,
+                        width=width,
+                        height=height,
+                        num_inference_steps=num_inference_steps,
+                        guidance_scale=guidance_scale,
+                        generator=current_generator,
+                        callback_on_step_end=step_timer,
+                    )
+                add_pipeline_spans(call_start, step_timer.last)
                 
                 images.append(result.images[0])
                 logger.info(f"Generated image {i+1}/{num_outputs}")
@@ -167,12 +237,164 @@ class AIImageGenerator:
             logger.error(f"Image generation failed: {e}", exc_info=True)
             raise
     
+    def _encode_prompt(self, pipeline, prompt: str, negative_prompt: Optional[str], guidance_scale: float):
+        """Encode prompts once so both preview and refine passes can reuse them."""
+        prompt_embeds, negative_prompt_embeds = pipeline.encode_prompt(
+            prompt,
+            self.device,
+            num_images_per_prompt=1,
+            do_classifier_free_guidance=guidance_scale > 1.0,
+            negative_prompt=negative_prompt,
+        )
+        return prompt_embeds, negative_prompt_embeds
+    
+    async def generate_preview(
+        self,
+        prompt: str,
+        model_name: str = "stable-diffusion-1.5",
+        model_path: Optional[str] = None,
+        negative_prompt: Optional[str] = None,
+        seeds: Optional[List[int]] = None,
+        width: int = 256,
+        height: int = 256,
+        num_inference_steps: int = 30,
+        guidance_scale: float = 7.5,
+        scheduler: Optional[str] = None,
+    ) -> PreviewResult:
+        """
+        Run the fast preview pass of a preview-then-refine generation.
+        
+        Uses the "fast" quality tier at the given (low) resolution and keeps the
+        final latents and prompt embeddings so that ``refine_preview`` can
+        continue from them without re-encoding the prompt.
+        """
+        try:
+            pipeline = self._load_pipeline(model_name, model_path)
+            scheduler_name, num_inference_steps = resolve_sampling(scheduler, num_inference_steps, "fast")
+            pipeline.scheduler = self._get_scheduler(scheduler_name)
+            seeds = seeds or [0]
+            
+            logger.info(
+                f"Generating {len(seeds)} preview(s) at {width}x{height} with {scheduler_name} "
+                f"({num_inference_steps} steps)"
+            )
+            
+            with trace_span("encode"), torch.no_grad():
+                prompt_embeds, negative_prompt_embeds = self._encode_prompt(
+                    pipeline, prompt, negative_prompt, guidance_scale
+                )
+            
+            images = []
+            latents = []
+            for current_seed in seeds:
+                generator = torch.Generator(device=self.device).manual_seed(current_seed)
+                with inference_context(self.backend, self.device):
+                    with trace_span("denoise"):
+                        result = pipeline(
+                            prompt_embeds=prompt_embeds,
+                            negative_prompt_embeds=negative_prompt_embeds,
+                            width=width,
+                            height=height,
+                            num_inference_steps=num_inference_steps,
+                            guidance_scale=guidance_scale,
+                            generator=generator,
+                            output_type="latent",
+                            callback_on_step_end=StepTimer(scheduler_name),
+                        )
+                    with trace_span("decode"), torch.no_grad():
+                        decoded = pipeline.vae.decode(
+                            result.images / pipeline.vae.config.scaling_factor, return_dict=False
+                        )[0]
+                        image = pipeline.image_processor.postprocess(decoded, output_type="pil")[0]
+                latents.append(result.images)
+                images.append(image)
+            
+            return PreviewResult(
+                images=images,
+                latents=latents,
+                seeds=list(seeds),
+                prompt_embeds=prompt_embeds,
+                negative_prompt_embeds=negative_prompt_embeds,
+                model_name=model_name,
+                model_path=model_path,
+                metadata={"scheduler": scheduler_name, "steps": num_inference_steps, "width": width, "height": height},
+            )
+            
+        except Exception as e:
+            logger.error(f"Preview generation failed: {e}", exc_info=True)
+            raise
+    
+    async def refine_preview(
+        self,
+        preview: PreviewResult,
+        index: int = 0,
+        width: int = 512,
+        height: int = 512,
+        num_inference_steps: int = 30,
+        guidance_scale: float = 7.5,
+        strength: float = 0.5,
+        scheduler: Optional[str] = None,
+    ) -> Image.Image:
+        """
+        Refine one preview at full resolution.
+        
+        The preview latent is upscaled to the target latent size and denoised
+        again with img2img from ``strength``, reusing the preview's prompt
+        embeddings and seed.
+        """
+        from diffusers import StableDiffusionImg2ImgPipeline
+        
+        try:
+            pipeline = self._load_pipeline(preview.model_name, preview.model_path)
+            if self.img2img_pipeline is None:
+                self.img2img_pipeline = StableDiffusionImg2ImgPipeline(**pipeline.components)
+            img2img = self.img2img_pipeline
+            
+            scheduler_name, num_inference_steps = resolve_sampling(scheduler, num_inference_steps, "standard")
+            img2img.scheduler = self._get_scheduler(scheduler_name)
+            
+            vae_scale = pipeline.vae_scale_factor
+            upscaled = torch.nn.functional.interpolate(
+                preview.latents[index],
+                size=(height // vae_scale, width // vae_scale),
+                mode="bicubic",
+                align_corners=False,
+            )
+            generator = torch.Generator(device=self.device).manual_seed(preview.seeds[index])
+            
+            logger.info(
+                f"Refining preview {index} (seed {preview.seeds[index]}) at {width}x{height}, "
+                f"strength {strength}, {scheduler_name}"
+            )
+            
+            step_timer = StepTimer(scheduler_name)
+            call_start = time.perf_counter()
+            with inference_context(self.backend, self.device):
+                result = img2img(
+                    image=upscaled,
+                    prompt_embeds=preview.prompt_embeds,
+                    negative_prompt_embeds=preview.negative_prompt_embeds,
+                    strength=strength,
+                    num_inference_steps=num_inference_steps,
+                    guidance_scale=guidance_scale,
+                    generator=generator,
+                    callback_on_step_end=step_timer,
+                )
+            add_pipeline_spans(call_start, step_timer.last)
+            return result.images[0]
+            
+        except Exception as e:
+            logger.error(f"Preview refinement failed: {e}", exc_info=True)
+            raise
+    
     def cleanup(self):
         """Clean up resources."""
         if self.current_pipeline is not None:
             del self.current_pipeline
             self.current_pipeline = None
+            self.img2img_pipeline = None
             self.current_model_name = None
+            self.schedulers = {}
             gc.collect()
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
@@ -187,5 +409,10 @@ def get_ai_generator() -> AIImageGenerator:
     """Get or create the global AI generator instance."""
     global _generator
     if _generator is None:
-        _generator = AIImageGenerator()
+        from .config import get_settings
+        settings = get_settings()
+        _generator = AIImageGenerator(
+            cache_dir=settings.models_cache_dir,
+            backend=settings.inference_backend,
+        )
     return _generator
@@ -0,0 +1,251 @@
+"""
+Background archive extraction.
+
+Archives are extracted member by member in a worker thread instead of with
+``extractall`` inside the request handler. Members are filtered as they are
+read (unsupported extensions, directories, links, hidden/macOS metadata and
+paths escaping the target directory are skipped), zip members are
+decompressed in parallel across a thread pool, and progress is exposed
+through ``ExtractionTask`` so clients can poll it.
+"""
+import asyncio
+import hashlib
+import logging
+import tarfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+from typing import Awaitable, Callable, Collection, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 1024 * 1024
+SAMPLE_FILES = 20  # extracted file names echoed back in the summary
+MAX_TASKS = 200  # finished tasks kept for polling
+ZIP_WORKERS = 4
+
+
+@dataclass
+class ExtractionTask:
+    """Progress of one archive extraction."""
+    id: str
+    archive: str
+    destination: str
+    status: str = "pending"  # pending, running, indexing, completed, failed
+    total_members: int = 0  # grows while a tar is streamed; its progress comes from the bytes read
+    processed: int = 0
+    extracted: int = 0
+    bytes_written: int = 0
+    archive_bytes: int = 0  # tar only: archive size on disk and how much of it was read
+    archive_read: int = 0
+    skipped: Dict[str, int] = field(default_factory=dict)
+    sample_files: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    hashes: Dict[str, str] = field(default_factory=dict, repr=False)  # extracted path -> sha256, for the post-extraction hook
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def skip(self, reason: str) -> None:
+        with self._lock:
+            self.processed += 1
+            self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+    def done(self, name: str, target: Path, size: int, sha256: str) -> None:
+        with self._lock:
+            self.hashes[str(target)] = sha256
+            self.processed += 1
+            self.extracted += 1
+            self.bytes_written += size
+            if len(self.sample_files) < SAMPLE_FILES:
+                self.sample_files.append(name)
+
+    @property
+    def progress(self) -> float:
+        if self.archive_bytes:
+            return min(1.0, self.archive_read / self.archive_bytes)
+        return self.processed / self.total_members if self.total_members else 0.0
+
+    def summary(self) -> dict:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "task_id": self.id,
+            "status": self.status,
+            "progress": self.progress,
+            "total_members": self.total_members,
+            "processed": self.processed,
+            "extracted": self.extracted,
+            "bytes_written": self.bytes_written,
+            "archive_bytes": self.archive_bytes or None,
+            "archive_read": self.archive_read if self.archive_bytes else None,
+            "skipped": dict(self.skipped),
+            "sample_files": list(self.sample_files),
+            "error": self.error,
+            "elapsed_seconds": elapsed,
+        }
+
+
+tasks: Dict[str, ExtractionTask] = {}
+_running: Set[asyncio.Task] = set()  # strong references so tasks aren't garbage collected
+
+
+def _safe_target(name: str, destination: Path) -> Optional[Path]:
+    """Resolve a member name inside ``destination``, or None if it would escape it."""
+    member = PurePosixPath(name.replace("\\", "/"))
+    if member.is_absolute() or ".." in member.parts:
+        return None
+    return destination.joinpath(*member.parts)
+
+
+def _skip_reason(name: str, allowed_extensions: Collection[str]) -> Optional[str]:
+    parts = PurePosixPath(name.replace("\\", "/")).parts
+    if any(part.startswith(".") or part == "__MACOSX" for part in parts):
+        return "hidden"
+    if PurePosixPath(name).suffix.lower() not in allowed_extensions:
+        return "unsupported"
+    return None
+
+
+def _copy_member(source, target: Path) -> Tuple[int, str]:
+    """Stream a member to disk, hashing it on the way. Returns (size, sha256)."""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    with open(target, "wb") as out:
+        for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+    return size, digest.hexdigest()
+
+
+def _extract_zip(task: ExtractionTask, archive: Path, destination: Path,
+                 allowed_extensions: Collection[str], workers: int) -> None:
+    with zipfile.ZipFile(archive) as zf:
+        members = zf.infolist()
+    task.total_members = len(members)
+    local = threading.local()
+    handles: List[zipfile.ZipFile] = []
+
+    def extract(info: zipfile.ZipInfo) -> None:
+        if info.is_dir():
+            task.skip("directory")
+            return
+        reason = _skip_reason(info.filename, allowed_extensions)
+        target = _safe_target(info.filename, destination)
+        if reason or target is None:
+            task.skip(reason or "unsafe_path")
+            return
+        # One handle per thread: members decompress independently, in parallel
+        handle = getattr(local, "zip", None)
+        if handle is None:
+            handle = local.zip = zipfile.ZipFile(archive)
+            handles.append(handle)
+        with handle.open(info) as source:
+            task.done(info.filename, target, *_copy_member(source, target))
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="unzip") as pool:
+            for future in [pool.submit(extract, info) for info in members]:
+                future.result()
+    finally:
+        for handle in handles:
+            handle.close()
+
+
+def _extract_tar(task: ExtractionTask, archive: Path, destination: Path,
+                 allowed_extensions: Collection[str]) -> None:
+    # Stream mode reads the (possibly compressed) archive once, front to back;
+    # the member count isn't known upfront, so progress follows the file position
+    task.archive_bytes = archive.stat().st_size
+    with open(archive, "rb") as raw, tarfile.open(fileobj=raw, mode="r|*") as tf:
+        for member in tf:
+            task.archive_read = raw.tell()
+            task.total_members += 1
+            if not member.isfile():
+                task.skip("directory" if member.isdir() else "not_a_file")
+                continue
+            reason = _skip_reason(member.name, allowed_extensions)
+            target = _safe_target(member.name, destination)
+            if reason or target is None:
+                task.skip(reason or "unsafe_path")
+                continue
+            source = tf.extractfile(member)
+            task.done(member.name, target, *_copy_member(source, target))
+    task.archive_read = task.archive_bytes
+
+
+def extract_members(task: ExtractionTask, allowed_extensions: Collection[str], workers: int = ZIP_WORKERS) -> None:
+    """Extract an archive into the task's destination (blocking)."""
+    archive = Path(task.archive)
+    destination = Path(task.destination)
+    destination.mkdir(parents=True, exist_ok=True)
+    if archive.suffix.lower() == ".zip":
+        _extract_zip(task, archive, destination, allowed_extensions, workers)
+    elif archive.suffix.lower() in {".tar", ".gz", ".bz2", ".xz", ".tgz"}:
+        _extract_tar(task, archive, destination, allowed_extensions)
+    else:
+        raise ValueError(f"Unsupported archive format: {archive.suffix}")
+
+
+async def _run(task: ExtractionTask, allowed_extensions: Collection[str],
+               on_complete: Optional[Callable[[ExtractionTask], Awaitable[None]]]) -> None:
+    task.status = "running"
+    task.started_at = time.time()
+    extracted = False
+    try:
+        await asyncio.to_thread(extract_members, task, allowed_extensions)
+        extracted = True
+    except Exception as e:
+        logger.error(f"Extraction of {task.archive} failed: {e}", exc_info=True)
+        task.status = "failed"
+        task.error = str(e)
+    logger.info(
+        f"Extracted {task.extracted}/{task.total_members} member(s) of {task.archive} "
+        f"in {time.time() - task.started_at:.1f}s"
+    )
+    # Completed only once the hook (indexing the extracted files) is done too; it also runs
+    # after a failed extraction, for the files that made it out
+    if on_complete is not None:
+        if extracted:
+            task.status = "indexing"
+        try:
+            await on_complete(task)
+        except Exception as e:
+            logger.error(f"Post-extraction hook for {task.archive} failed: {e}", exc_info=True)
+            if extracted:
+                extracted = False
+                task.status = "failed"
+                task.error = f"Extracted, but processing the extracted files failed: {e}"
+    if extracted:
+        task.status = "completed"
+    task.finished_at = time.time()
+    task.hashes = {}
+
+
+def _prune_finished() -> None:
+    finished = [task for task in tasks.values() if task.status in ("completed", "failed")]
+    for task in sorted(finished, key=lambda t: t.finished_at or 0)[:max(0, len(tasks) - MAX_TASKS)]:
+        tasks.pop(task.id, None)
+
+
+def start_extraction(
+    archive: Path,
+    destination: Path,
+    allowed_extensions: Collection[str],
+    on_complete: Optional[Callable[[ExtractionTask], Awaitable[None]]] = None,
+) -> ExtractionTask:
+    """Schedule extraction of ``archive`` on the running event loop and return its task."""
+    _prune_finished()
+    task = ExtractionTask(id=uuid.uuid4().hex, archive=str(archive), destination=str(destination))
+    tasks[task.id] = task
+    runner = asyncio.create_task(_run(task, allowed_extensions, on_complete))
+    _running.add(runner)
+    runner.add_done_callback(_running.discard)
+    return task
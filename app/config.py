@@ -1,9 +1,13 @@
 from functools import lru_cache
 from pathlib import Path
+from typing import Literal
 
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
+# Names accepted by inference_backends.apply_inference_backend
+InferenceBackend = Literal["eager", "compile", "channels_last", "cpu_bf16", "onnx"]
+
 
 class Settings(BaseSettings):
     app_name: str = "AI Generator API"
@@ -11,10 +15,55 @@ class Settings(BaseSettings):
     output_dir: Path = Field(default=Path("outputs"))
     max_parallel_jobs: int = 1
     mock_generation_delay: float = 0.5
+    preview_ttl: float = Field(
+        default=900.0, description="Seconds an unconfirmed preview (no auto-refine) is kept before it expires"
+    )
+    max_pending_previews: int = Field(
+        default=16, description="Previews awaiting confirmation kept in memory; the oldest expires beyond this"
+    )
+    dashboard_cache_ttl: float = Field(default=2.0, description="Seconds monitoring responses may be served from cache")
+    metrics_enabled: bool = Field(default=True, description="Record request/job metrics and expose /metrics")
+    timeseries_path: Path = Field(default=Path("metrics/timeseries.bin"), description="File backing the metrics history")
+    timeseries_resolution: int = Field(default=60, description="Seconds per metrics history bucket")
+    timeseries_retention_hours: int = Field(default=168, description="Hours of metrics history to keep")
+    max_upload_mb: int = Field(default=5120, description="Largest accepted upload, enforced while streaming to disk")
+    dataset_reconcile_interval: float = Field(
+        default=3600.0, description="Seconds between dataset index reconciliation scans (0 disables)"
+    )
+    upload_session_ttl_hours: int = Field(default=24, description="Hours before unfinished resumable uploads are discarded")
+    profiler_max_seconds: float = Field(default=60.0, description="Longest profile /monitoring/profile may record")
+    ingest_workers: int = Field(
+        default=0, description="Processes inspecting ingested images in bulk (0 = one per CPU)"
+    )
+    training_cache_dir: Path = Field(
+        default=Path("cache/training"), description="Preprocessed (resized, VAE-encoded) training data"
+    )
+    dataset_shards_dir: Path = Field(
+        default=Path("cache/shards"), description="Datasets exported as sequential tar shards for streaming"
+    )
+    training_slots: int = Field(
+        default=1, description="Trainings allowed to run at once; further starts wait in a queue"
+    )
+    training_master_addr: str = Field(
+        default="127.0.0.1", description="Address of this node as seen by other nodes of a multi-node training"
+    )
+    training_master_port: int = Field(
+        default=29500, description="Rendezvous port of multi-node trainings (single-node ones pick a free port)"
+    )
+    training_progress_interval: float = Field(
+        default=1.0, description="Seconds between batched writes of training progress and logs"
+    )
+    near_duplicate_threshold: int = Field(
+        default=4, description="Max differing perceptual-hash bits (of 64) for two images to count as near-duplicates"
+    )
     
     # AI Generation Settings
     use_real_ai: bool = Field(default=True, description="Use real AI models instead of mock generation")
     models_cache_dir: str = Field(default="./models_cache", description="Directory to cache downloaded models")
+    inference_backend: InferenceBackend = Field(
+        default="eager",
+        description="Inference backend: eager, compile, channels_last, cpu_bf16 or onnx",
+    )
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,192 @@
+"""
+Streaming CSV label ingestion.
+
+Image-label CSVs are read row by row (the encoding is detected once, from a
+sample) and written in batches to a compact SQLite sidecar next to the CSV
+(``<name>.labels.db``: one ``filename -> label`` table keyed by file name).
+Training opens the sidecars read-only and looks labels up by file name, so
+neither side holds the full mapping in memory, even for million-row CSVs.
+"""
+import codecs
+import csv
+import logging
+import os
+import sqlite3
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CSV_IMAGE_COLUMN_NAMES = ['image', 'filename', 'file', 'img', 'path', 'image_path', 'file_name']
+CSV_LABEL_COLUMN_NAMES = ['label', 'class', 'category', 'tag', 'description', 'caption', 'text']
+
+SAMPLE_SIZE = 64 * 1024
+INSERT_BATCH = 10_000
+PREVIEW_ROWS = 20
+LABELS_SUFFIX = ".labels.db"
+
+
+class CSVLabelError(Exception):
+    """Raised when a CSV cannot be parsed into image-label mappings."""
+
+
+def labels_db_path(csv_path: Path) -> Path:
+    return csv_path.with_name(csv_path.stem + LABELS_SUFFIX)
+
+
+def detect_encoding(sample: bytes) -> str:
+    """Pick an encoding from the first bytes of a file (BOM, then strict UTF-8, then cp1252)."""
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    try:
+        # Incremental decoder: a multi-byte character cut at the sample boundary is not an error
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    try:
+        sample.decode("cp1252")
+        return "cp1252"
+    except UnicodeDecodeError:
+        return "latin-1"  # decodes any byte sequence
+
+
+def _pick_column(columns: List[str], names: List[str], default_index: int) -> Optional[str]:
+    for col in columns:
+        if col and col.lower() in names:
+            return col
+    return columns[default_index] if len(columns) > default_index else None
+
+
+def _label_key(image_name: str) -> str:
+    """Labels are keyed by bare file name, whatever directory the CSV mentions."""
+    return PurePosixPath(image_name.strip().replace("\\", "/")).name
+
+
+def _ingest(csv_path: Path, encoding: str, build_path: Path) -> Dict:
+    with open(csv_path, "r", encoding=encoding, newline="") as f:
+        sample = f.read(SAMPLE_SIZE)
+        f.seek(0)
+        try:
+            delimiter = csv.Sniffer().sniff(sample).delimiter
+        except csv.Error:
+            delimiter = ","
+
+        reader = csv.DictReader(f, delimiter=delimiter)
+        columns = list(reader.fieldnames or [])
+        image_col = _pick_column(columns, CSV_IMAGE_COLUMN_NAMES, 0)
+        label_col = _pick_column(columns, CSV_LABEL_COLUMN_NAMES, 1)
+
+        conn = sqlite3.connect(build_path)
+        try:
+            conn.executescript(
+                "PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;"
+                "CREATE TABLE labels (filename TEXT PRIMARY KEY, label TEXT NOT NULL) WITHOUT ROWID;"
+                "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);"
+            )
+            total_rows = 0
+            preview: Dict[str, str] = {}
+            batch = []
+            for row in reader:
+                total_rows += 1
+                image_name = row.get(image_col) if image_col else None
+                label = row.get(label_col) if label_col else None
+                if not image_name or not label:
+                    continue
+                key = _label_key(image_name)
+                batch.append((key, label))
+                if len(preview) < PREVIEW_ROWS:
+                    preview[key] = label
+                if len(batch) >= INSERT_BATCH:
+                    conn.executemany("INSERT OR REPLACE INTO labels VALUES (?, ?)", batch)
+                    batch.clear()
+            if batch:
+                conn.executemany("INSERT OR REPLACE INTO labels VALUES (?, ?)", batch)
+            mapped = conn.execute("SELECT COUNT(*) FROM labels").fetchone()[0]
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("source", csv_path.name),
+                ("encoding", encoding),
+                ("image_column", image_col or ""),
+                ("label_column", label_col or ""),
+            ])
+            conn.commit()
+        finally:
+            conn.close()
+
+    return {
+        'total_rows': total_rows,
+        'image_column': image_col,
+        'label_column': label_col,
+        'mapped_files': mapped,
+        'mappings': preview,  # first rows only; the full mapping is in labels_path
+        'columns': columns,
+        'encoding': encoding,
+    }
+
+
+def ingest_csv(csv_path: Path) -> Dict:
+    """Parse an image-label CSV into its SQLite sidecar and return a summary (blocking)."""
+    with open(csv_path, "rb") as f:
+        encoding = detect_encoding(f.read(SAMPLE_SIZE))
+
+    labels_path = labels_db_path(csv_path)
+    build_path = labels_path.with_name(f".{labels_path.name}.tmp")
+    build_path.unlink(missing_ok=True)
+    try:
+        try:
+            summary = _ingest(csv_path, encoding, build_path)
+        except UnicodeDecodeError:
+            # Non-UTF-8 bytes after the sample; latin-1 accepts anything
+            logger.warning(f"{csv_path.name} is not valid {encoding} past the sample, re-reading as latin-1")
+            build_path.unlink(missing_ok=True)
+            summary = _ingest(csv_path, "latin-1", build_path)
+        os.replace(build_path, labels_path)
+    except csv.Error as e:
+        raise CSVLabelError(
+            f"CSV parsing error: {str(e)}. Please ensure your CSV file is properly formatted "
+            f"with consistent delimiters and quoted fields."
+        )
+    finally:
+        build_path.unlink(missing_ok=True)
+
+    summary['labels_path'] = str(labels_path)
+    return summary
+
+
+class LabelStore:
+    """Read-only label lookup over one or more ``.labels.db`` sidecars."""
+
+    def __init__(self, paths: Iterable[Path]):
+        self.connections = []
+        for path in paths:
+            try:
+                self.connections.append(sqlite3.connect(f"file:{Path(path).as_posix()}?mode=ro", uri=True))
+            except sqlite3.Error as e:
+                logger.warning(f"Could not open label store {path}: {e}")
+
+    def get(self, filename: str, default: Optional[str] = None) -> Optional[str]:
+        key = _label_key(filename)
+        for conn in self.connections:
+            row = conn.execute("SELECT label FROM labels WHERE filename = ?", (key,)).fetchone()
+            if row:
+                return row[0]
+        return default
+
+    def __len__(self) -> int:
+        return sum(conn.execute("SELECT COUNT(*) FROM labels").fetchone()[0] for conn in self.connections)
+
+    def close(self) -> None:
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+
+
+def find_label_stores(directories: Iterable[Path]) -> List[Path]:
+    """Label sidecars in the given directories (non-recursive)."""
+    found = []
+    for directory in directories:
+        if directory.is_dir():
+            found.extend(sorted(directory.glob(f"*{LABELS_SUFFIX}")))
+    return found
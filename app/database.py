@@ -23,8 +23,29 @@ AsyncSessionLocal = sessionmaker(
     expire_on_commit=False,
 )
 
+# Separate engine and connection pool for background training, so long-running
+# jobs never hold connections that request handlers are waiting for
+training_engine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL,
+    echo=False,
+    future=True,
+)
+
+TrainingSessionLocal = sessionmaker(
+    training_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+)
+
 Base = declarative_base()
 
+# Columns added to existing tables since their creation: create_all only creates
+# missing tables, so these are added to older databases on startup.
+# (table, column, column DDL, indexed)
+ADDED_COLUMNS = [
+    ("training_jobs", "sweep_id", "VARCHAR(36) REFERENCES training_sweeps (id)", True),
+]
+
 
 async def get_db():
     """Dependency for getting database session."""
@@ -35,7 +56,17 @@ async def get_db():
             await session.close()
 
 
+def _add_missing_columns(conn) -> None:
+    for table, column, ddl, indexed in ADDED_COLUMNS:
+        existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+        if column not in existing:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+        if indexed:
+            conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})")
+
+
 async def init_db():
-    """Initialize database tables."""
+    """Initialize database tables, adding columns missing from older databases."""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
@@ -0,0 +1,489 @@
+"""
+Incremental per-dataset file index.
+
+Every file added to or removed from a dataset directory is recorded in the
+``dataset_files`` table, and the dataset's aggregates in ``dataset_stats``
+(``num_items``, total bytes, per-type and per-format counts, an image
+dimension histogram and duplicate counts) are adjusted by the same delta, so
+keeping them current costs O(files changed) instead of a directory walk and
+reading them is a primary-key lookup. Images are inspected on the way in
+(header metadata, corruption, ``FILE_TYPE_RULES``; see app.media_validation).
+``reconcile_dataset`` re-scans the directories with ``os.scandir`` to repair
+drift (files changed outside the API) and is run periodically.
+
+The counters are read, adjusted in Python and written back, so every update
+of a dataset's aggregates runs under that dataset's lock (``dataset_lock``);
+concurrent uploads would otherwise overwrite each other's deltas.
+"""
+import asyncio
+import contextlib
+import hashlib
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import ColumnElement, delete, func, or_, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .dataset_utils import dataset_dirs, get_file_type, is_dataset_item, iter_dataset_files
+from .media_validation import inspect_images
+from .models import Dataset, DatasetFile, DatasetStats
+from .near_duplicates import compute_phashes
+
+logger = logging.getLogger(__name__)
+
+QUERY_CHUNK = 500  # values per IN (...) query, below SQLite's variable limit
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Upper bounds (longest side, pixels) of the image dimension histogram buckets
+DIMENSION_BUCKETS = (256, 512, 768, 1024, 1536, 2048, 4096)
+
+_dataset_locks: Dict[int, asyncio.Lock] = {}
+
+
+def dataset_lock(dataset_id: int) -> asyncio.Lock:
+    """The lock serializing index and counter updates of one dataset."""
+    lock = _dataset_locks.get(dataset_id)
+    if lock is None:
+        lock = _dataset_locks[dataset_id] = asyncio.Lock()
+    return lock
+
+
+@contextlib.asynccontextmanager
+async def _locked(dataset_ids: Iterable[int]):
+    """Hold the locks of several datasets, taken in id order so two callers can't deadlock."""
+    async with contextlib.AsyncExitStack() as stack:
+        for dataset_id in sorted(set(dataset_ids)):
+            await stack.enter_async_context(dataset_lock(dataset_id))
+        yield
+
+
+def dimension_bucket(width: int, height: int) -> str:
+    """Histogram bucket label for an image, by its longest side."""
+    longest = max(width, height)
+    lower = 0
+    for upper in DIMENSION_BUCKETS:
+        if longest < upper:
+            return f"{lower}-{upper - 1}"
+        lower = upper
+    return f"{DIMENSION_BUCKETS[-1]}+"
+
+
+@dataclass
+class FileInfo:
+    size: int
+    mtime: float
+    sha256: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    phash: Optional[int] = None
+    mode: Optional[str] = None
+    orientation: Optional[int] = None
+    corrupt: bool = False
+    issues: List[str] = field(default_factory=list)
+
+
+def _key(path) -> str:
+    return Path(path).as_posix()
+
+
+def _describe(path: str, st: os.stat_result, sha256: Optional[str] = None) -> FileInfo:
+    """Hash a file unless the hash is known (images are inspected separately, in bulk)."""
+    if sha256 is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+    return FileInfo(size=st.st_size, mtime=st.st_mtime, sha256=sha256)
+
+
+def _inspect(files: Dict[str, FileInfo]) -> Dict[str, FileInfo]:
+    """Read image headers (dimensions, mode, orientation), flag corrupt files and rule violations."""
+    images = [key for key in files if get_file_type(key) == "image"]
+    for key, inspection in inspect_images(images).items():
+        info = files[key]
+        info.width, info.height = inspection.width, inspection.height
+        info.mode, info.orientation = inspection.mode, inspection.orientation
+        info.corrupt, info.issues = inspection.corrupt, inspection.issues
+    return files
+
+
+def _add_phashes(files: Dict[str, FileInfo]) -> Dict[str, FileInfo]:
+    """Perceptual-hash the images among described files, in batches."""
+    images = [key for key, info in files.items() if info.width and not info.corrupt]
+    for key, phash in compute_phashes(images).items():
+        files[key].phash = phash
+    return files
+
+
+def _describe_paths(paths: Iterable[Path], hashes: Dict[str, str]) -> Dict[str, FileInfo]:
+    files = {}
+    for path in paths:
+        if not is_dataset_item(Path(path).name):
+            continue
+        key = _key(path)
+        try:
+            files[key] = _describe(key, os.stat(path), hashes.get(key))
+        except FileNotFoundError:
+            continue
+    return _add_phashes(_inspect(files))
+
+
+def _describe_stale(stale: Dict[str, os.stat_result]) -> Dict[str, FileInfo]:
+    return _add_phashes(_inspect({key: _describe(key, st) for key, st in stale.items()}))
+
+
+def _scan(dataset_id: int) -> Dict[str, os.stat_result]:
+    stats = {}
+    for dataset_dir in dataset_dirs(dataset_id):
+        stats.update(iter_dataset_files(dataset_dir))
+    return stats
+
+
+async def _get_stats(db: AsyncSession, dataset_id: int) -> DatasetStats:
+    """The dataset's counters row, created if missing; call with the dataset's lock held."""
+    # INSERT OR IGNORE: a row created meanwhile (another process, a reconcile) is kept, not clobbered
+    await db.execute(
+        insert(DatasetStats)
+        .values(
+            dataset_id=dataset_id,
+            num_files=0,
+            total_bytes=0,
+            type_counts={},
+            extension_counts={},
+            dimension_histogram={},
+            duplicate_files=0,
+            duplicate_bytes=0,
+        )
+        .on_conflict_do_nothing(index_elements=["dataset_id"])
+    )
+    # Re-read even if the session has the row cached: the counters are only current as of now
+    return await db.get(DatasetStats, dataset_id, populate_existing=True)
+
+
+def _bump(counts: Optional[dict], key: str, delta: int) -> dict:
+    counts = dict(counts or {})  # copy so the JSON column is flagged dirty on reassignment
+    counts[key] = max(0, counts.get(key, 0) + delta)
+    if not counts[key]:
+        del counts[key]
+    return counts
+
+
+def _apply(stats: DatasetStats, row: DatasetFile, sign: int) -> None:
+    """Add (sign=1) or remove (sign=-1) one file's contribution to the aggregates."""
+    stats.num_files = max(0, (stats.num_files or 0) + sign)
+    stats.total_bytes = max(0, (stats.total_bytes or 0) + sign * (row.size_bytes or 0))
+    stats.type_counts = _bump(stats.type_counts, row.file_type, sign)
+    stats.extension_counts = _bump(stats.extension_counts, row.extension, sign)
+    if row.width and row.height:
+        stats.dimension_histogram = _bump(stats.dimension_histogram, dimension_bucket(row.width, row.height), sign)
+
+
+async def _apply_duplicates(db: AsyncSession, stats: DatasetStats, dataset_id: int,
+                            changes: Dict[str, Tuple[int, int]]) -> None:
+    """Update duplicate counters after rows were added/removed.
+
+    ``changes`` maps sha256 -> (change in copies, file size). A content with
+    n copies in the dataset contributes n - 1 duplicate files.
+    """
+    if not changes:
+        return
+    await db.flush()
+    hashes = list(changes)
+    current: Dict[str, int] = {}
+    for start in range(0, len(hashes), QUERY_CHUNK):
+        result = await db.execute(
+            select(DatasetFile.sha256, func.count(DatasetFile.id))
+            .where(DatasetFile.dataset_id == dataset_id, DatasetFile.sha256.in_(hashes[start:start + QUERY_CHUNK]))
+            .group_by(DatasetFile.sha256)
+        )
+        current.update(result.all())
+    for sha256, (delta, size) in changes.items():
+        after = current.get(sha256, 0)
+        before = after - delta
+        dup_delta = max(after - 1, 0) - max(before - 1, 0)
+        stats.duplicate_files = max(0, (stats.duplicate_files or 0) + dup_delta)
+        stats.duplicate_bytes = max(0, (stats.duplicate_bytes or 0) + dup_delta * size)
+
+
+def _track(changes: Dict[str, Tuple[int, int]], row: DatasetFile, delta: int) -> None:
+    if row.sha256:
+        count, _ = changes.get(row.sha256, (0, 0))
+        changes[row.sha256] = (count + delta, row.size_bytes or 0)
+
+
+async def _sync_num_items(db: AsyncSession, dataset_id: int, num_files: int) -> None:
+    await db.execute(
+        update(Dataset)
+        .where(Dataset.id == dataset_id)
+        .values(num_items=num_files, updated_at=datetime.utcnow())
+    )
+
+
+async def _indexed(db: AsyncSession, keys: List[str]) -> Dict[str, DatasetFile]:
+    rows = {}
+    for start in range(0, len(keys), QUERY_CHUNK):
+        result = await db.execute(select(DatasetFile).where(DatasetFile.path.in_(keys[start:start + QUERY_CHUNK])))
+        rows.update({row.path: row for row in result.scalars()})
+    return rows
+
+
+async def _drop(db: AsyncSession, stats: DatasetStats, rows: Iterable[DatasetFile],
+                changes: Dict[str, Tuple[int, int]]) -> int:
+    removed = 0
+    for row in rows:
+        _apply(stats, row, -1)
+        _track(changes, row, -1)
+        await db.delete(row)
+        removed += 1
+    return removed
+
+
+async def _upsert(db: AsyncSession, dataset_id: int, stats: DatasetStats, files: Dict[str, FileInfo],
+                  existing: Dict[str, DatasetFile], changes: Dict[str, Tuple[int, int]]) -> int:
+    """Insert described files, replacing rows whose file changed. Returns files added."""
+    added = 0
+    for key, info in files.items():
+        row = existing.get(key)
+        if row is not None:
+            if row.size_bytes == info.size and row.mtime == info.mtime and row.sha256 == info.sha256:
+                continue
+            await _drop(db, stats, [row], changes)
+            await db.flush()
+        row = DatasetFile(
+            dataset_id=dataset_id,
+            path=key,
+            file_type=get_file_type(key),
+            extension=Path(key).suffix.lower(),
+            size_bytes=info.size,
+            mtime=info.mtime,
+            sha256=info.sha256,
+            width=info.width,
+            height=info.height,
+            phash=info.phash,
+            image_mode=info.mode,
+            orientation=info.orientation,
+            is_corrupt=info.corrupt,
+            validation_issues=info.issues,
+        )
+        db.add(row)
+        _apply(stats, row, 1)
+        _track(changes, row, 1)
+        added += 1
+    return added
+
+
+async def add_files(db: AsyncSession, dataset_id: int, paths: Iterable[Path],
+                    hashes: Optional[Dict[str, str]] = None) -> DatasetStats:
+    """Index files newly written to a dataset directory and update its aggregates.
+
+    ``hashes`` maps paths to SHA-256 digests already computed upstream (the
+    upload stream, archive extraction) so files are not read twice.
+    """
+    hashes = {_key(path): sha256 for path, sha256 in (hashes or {}).items()}
+    files = await asyncio.to_thread(_describe_paths, list(paths), hashes)
+    async with dataset_lock(dataset_id):
+        stats = await _get_stats(db, dataset_id)
+        if files:
+            changes: Dict[str, Tuple[int, int]] = {}
+            await _upsert(db, dataset_id, stats, files, await _indexed(db, list(files)), changes)
+            await _apply_duplicates(db, stats, dataset_id, changes)
+        await _sync_num_items(db, dataset_id, stats.num_files)
+        await db.commit()
+    return stats
+
+
+def _under(path) -> ColumnElement:
+    key = _key(path)
+    return or_(DatasetFile.path == key, DatasetFile.path.startswith(key + "/", autoescape=True))
+
+
+async def remove_paths(db: AsyncSession, paths: Iterable[Path]) -> int:
+    """Remove deleted files (or whole deleted directories) from the index."""
+    paths = list(paths)
+    dataset_ids = set()
+    for path in paths:
+        result = await db.execute(select(DatasetFile.dataset_id).where(_under(path)).distinct())
+        dataset_ids.update(result.scalars())
+    if not dataset_ids:
+        return 0
+
+    removed = 0
+    touched: Dict[int, Tuple[DatasetStats, Dict[str, Tuple[int, int]]]] = {}
+    async with _locked(dataset_ids):
+        # Rows are re-read under the locks, so a file removed concurrently is only subtracted once
+        for path in paths:
+            result = await db.execute(
+                select(DatasetFile)
+                .where(_under(path), DatasetFile.dataset_id.in_(dataset_ids))
+                .execution_options(populate_existing=True)
+            )
+            for row in result.scalars():
+                if row.dataset_id not in touched:
+                    touched[row.dataset_id] = (await _get_stats(db, row.dataset_id), {})
+                stats, changes = touched[row.dataset_id]
+                removed += await _drop(db, stats, [row], changes)
+        for dataset_id, (stats, changes) in touched.items():
+            await _apply_duplicates(db, stats, dataset_id, changes)
+            await _sync_num_items(db, dataset_id, stats.num_files)
+        await db.commit()
+    return removed
+
+
+async def drop_dataset(db: AsyncSession, dataset_id: int) -> None:
+    """Forget the index and aggregates of a deleted dataset (caller commits)."""
+    await db.execute(delete(DatasetFile).where(DatasetFile.dataset_id == dataset_id))
+    await db.execute(delete(DatasetStats).where(DatasetStats.dataset_id == dataset_id))
+
+
+async def validation_report(db: AsyncSession, dataset_id: int, limit: int = 100) -> dict:
+    """Corrupt files and files violating the ingest rules in a dataset."""
+    where = DatasetFile.dataset_id == dataset_id
+    corrupt = (await db.execute(
+        select(func.count(DatasetFile.id)).where(where, DatasetFile.is_corrupt.is_(True))
+    )).scalar_one()
+    flagged = select(DatasetFile).where(
+        where, or_(DatasetFile.is_corrupt.is_(True), func.json_array_length(DatasetFile.validation_issues) > 0)
+    )
+    total = (await db.execute(select(func.count()).select_from(flagged.subquery()))).scalar_one()
+    rows = (await db.execute(flagged.order_by(DatasetFile.id).limit(limit))).scalars()
+    return {
+        "corrupt_files": corrupt,
+        "files_with_issues": total,
+        "files": [
+            {
+                "path": row.path,
+                "width": row.width,
+                "height": row.height,
+                "mode": row.image_mode,
+                "orientation": row.orientation,
+                "corrupt": bool(row.is_corrupt),
+                "issues": row.validation_issues or [],
+            }
+            for row in rows
+        ],
+    }
+
+
+async def get_dataset_counters(db: AsyncSession, dataset_id: int) -> DatasetStats:
+    """Maintained aggregates of a dataset, reconciling once if it was never indexed."""
+    stats = await db.get(DatasetStats, dataset_id)
+    if stats is None:
+        stats = await reconcile_dataset(db, dataset_id)
+    return stats
+
+
+async def _recompute(db: AsyncSession, stats: DatasetStats, dataset_id: int) -> None:
+    """Rebuild all aggregates from the index itself (repairs drift in the counters)."""
+    where = DatasetFile.dataset_id == dataset_id
+    type_counts, extension_counts, histogram = {}, {}, {}
+    num_files, total_bytes = 0, 0
+    rows = await db.execute(
+        select(DatasetFile.file_type, DatasetFile.extension, func.count(DatasetFile.id),
+               func.coalesce(func.sum(DatasetFile.size_bytes), 0))
+        .where(where)
+        .group_by(DatasetFile.file_type, DatasetFile.extension)
+    )
+    for file_type, extension, count, size in rows.all():
+        type_counts[file_type] = type_counts.get(file_type, 0) + count
+        extension_counts[extension] = extension_counts.get(extension, 0) + count
+        num_files += count
+        total_bytes += size
+
+    rows = await db.execute(
+        select(DatasetFile.width, DatasetFile.height, func.count(DatasetFile.id))
+        .where(where, DatasetFile.width.isnot(None), DatasetFile.height.isnot(None))
+        .group_by(DatasetFile.width, DatasetFile.height)
+    )
+    for width, height, count in rows.all():
+        bucket = dimension_bucket(width, height)
+        histogram[bucket] = histogram.get(bucket, 0) + count
+
+    copies = (
+        select(func.count(DatasetFile.id).label("copies"), func.max(DatasetFile.size_bytes).label("size"))
+        .where(where, DatasetFile.sha256.isnot(None))
+        .group_by(DatasetFile.sha256)
+        .having(func.count(DatasetFile.id) > 1)
+        .subquery()
+    )
+    duplicate_files, duplicate_bytes = (await db.execute(
+        select(func.coalesce(func.sum(copies.c.copies - 1), 0),
+               func.coalesce(func.sum((copies.c.copies - 1) * copies.c.size), 0))
+    )).one()
+
+    stats.num_files = num_files
+    stats.total_bytes = total_bytes
+    stats.type_counts = type_counts
+    stats.extension_counts = extension_counts
+    stats.dimension_histogram = histogram
+    stats.duplicate_files = duplicate_files
+    stats.duplicate_bytes = duplicate_bytes
+
+
+async def reconcile_dataset(db: AsyncSession, dataset_id: int) -> DatasetStats:
+    """Re-scan a dataset's directories and bring the index and aggregates in line with disk."""
+    async with dataset_lock(dataset_id):
+        return await _reconcile(db, dataset_id)
+
+
+async def _reconcile(db: AsyncSession, dataset_id: int) -> DatasetStats:
+    on_disk = await asyncio.to_thread(_scan, dataset_id)
+    result = await db.execute(select(DatasetFile).where(DatasetFile.dataset_id == dataset_id))
+    indexed = {row.path: row for row in result.scalars()}
+
+    stats = await _get_stats(db, dataset_id)
+    changes: Dict[str, Tuple[int, int]] = {}
+    removed = await _drop(db, stats, [row for key, row in indexed.items() if key not in on_disk], changes)
+
+    # Only new or modified files are hashed and measured
+    stale = {
+        key: st for key, st in on_disk.items()
+        if key not in indexed or indexed[key].size_bytes != st.st_size or indexed[key].mtime != st.st_mtime
+    }
+    files = await asyncio.to_thread(_describe_stale, stale)
+    added = await _upsert(db, dataset_id, stats, files, indexed, changes)
+
+    # Backfill perceptual hashes of images indexed before hashing existed
+    unhashed = [
+        row for key, row in indexed.items()
+        if key in on_disk and key not in stale and row.width and not row.is_corrupt and row.phash is None
+    ]
+    if unhashed:
+        phashes = await asyncio.to_thread(compute_phashes, [row.path for row in unhashed])
+        for row in unhashed:
+            row.phash = phashes.get(row.path)
+    await db.flush()
+
+    await _recompute(db, stats, dataset_id)
+    stats.reconciled_at = datetime.utcnow()
+    await _sync_num_items(db, dataset_id, stats.num_files)
+    await db.commit()
+
+    if added or removed:
+        logger.info(f"Reconciled dataset {dataset_id}: +{added} / -{removed} file(s), {stats.num_files} total")
+    return stats
+
+
+async def reconcile_all(db: AsyncSession) -> None:
+    """Reconcile every dataset."""
+    result = await db.execute(select(Dataset.id))
+    for dataset_id in result.scalars().all():
+        await reconcile_dataset(db, dataset_id)
+
+
+async def reconcile_loop(interval: float) -> None:
+    """Verify the index against the file system now (indexing pre-existing files) and then periodically."""
+    from .database import AsyncSessionLocal
+
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await reconcile_all(db)
+        except Exception as e:
+            logger.error(f"Dataset index reconciliation failed: {e}", exc_info=True)
+        await asyncio.sleep(interval)
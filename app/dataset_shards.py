@@ -0,0 +1,281 @@
+"""
+Sharded, streamable dataset format.
+
+A dataset is exported into plain (uncompressed) tar shards of roughly
+``SHARD_TARGET_BYTES`` each, webdataset style: every sample is a run of
+consecutive members sharing a key (``00000042.jpg``, ``00000042.txt`` with
+the caption from the CSV labels, ``00000042.json`` with metadata). Training
+then reads a few large files front to back instead of opening thousands of
+loose files and sidecars.
+
+``index.json`` lists the shards and, for each sample, the byte offset and
+size of its image inside the shard, for random access without a tar scan.
+``ShardReader`` streams the shards with worker threads prefetching into a
+bounded queue and mixes samples through a shuffle buffer.
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import queue
+import random
+import shutil
+import tarfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .training_cache import dataset_fingerprint, lookup_captions
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_VERSION = 1
+INDEX = "index.json"
+SHARD_TARGET_BYTES = 256 * 1024 * 1024
+
+_export_locks: Dict[int, asyncio.Lock] = {}
+
+
+def shards_root() -> Path:
+    from .config import get_settings
+
+    return Path(get_settings().dataset_shards_dir)
+
+
+def shards_dir(dataset_id: int) -> Path:
+    return shards_root() / f"dataset_{dataset_id}"
+
+
+def drop_dataset_shards(dataset_id: int) -> None:
+    shutil.rmtree(shards_dir(dataset_id), ignore_errors=True)
+
+
+def read_index(directory: Path) -> Optional[dict]:
+    try:
+        return json.loads((directory / INDEX).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _add_bytes(tf: tarfile.TarFile, name: str, data: bytes, mtime: float) -> tarfile.TarInfo:
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = mtime
+    tf.addfile(info, io.BytesIO(data))
+    return info
+
+
+def write_shards(directory: Path, paths: Sequence[str], captions: Sequence[str], fingerprint: str,
+                 target_bytes: int = SHARD_TARGET_BYTES) -> dict:
+    """Pack ``paths`` with their captions into tar shards at ``directory`` (blocking)."""
+    started = time.perf_counter()
+    building = directory.with_name(directory.name + ".building")
+    shutil.rmtree(building, ignore_errors=True)
+    building.mkdir(parents=True)
+
+    shards: List[dict] = []
+    tf: Optional[tarfile.TarFile] = None
+    current: Optional[dict] = None
+    written = 0
+    try:
+        for number, (path, caption) in enumerate(zip(paths, captions)):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                logger.warning(f"Skipping {path} in shard export: file is gone")
+                continue
+            if tf is None or current["bytes"] >= target_bytes:
+                if tf is not None:
+                    tf.close()
+                current = {"name": f"shard-{len(shards):06d}.tar", "bytes": 0, "samples": []}
+                shards.append(current)
+                tf = tarfile.open(building / current["name"], "w", format=tarfile.PAX_FORMAT)
+
+            key = f"{number:08d}"
+            ext = Path(path).suffix.lower().lstrip(".")
+            with open(path, "rb") as f:
+                image = tf.gettarinfo(arcname=f"{key}.{ext}", fileobj=f)
+                image.uid = image.gid = 0
+                image.uname = image.gname = ""
+                tf.addfile(image, f)
+            # Data is the last, block-padded part of the member just written
+            padded = (image.size + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE * tarfile.BLOCKSIZE
+            offset_data = tf.offset - padded
+            _add_bytes(tf, f"{key}.txt", caption.encode("utf-8"), st.st_mtime)
+            _add_bytes(tf, f"{key}.json", json.dumps({"path": path}).encode("utf-8"), st.st_mtime)
+            current["samples"].append([key, ext, offset_data, image.size])
+            current["bytes"] = tf.offset
+            written += 1
+    finally:
+        if tf is not None:
+            tf.close()
+
+    index = {
+        "version": LAYOUT_VERSION,
+        "fingerprint": fingerprint,
+        "samples": written,
+        "total_bytes": sum(shard["bytes"] for shard in shards),
+        "shards": shards,
+        "created_at": time.time(),
+    }
+    (building / INDEX).write_text(json.dumps(index))
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(building, directory)
+    logger.info(
+        f"Exported {written} sample(s) into {len(shards)} shard(s) at {directory} "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+    return index
+
+
+async def export_dataset_shards(db: AsyncSession, dataset_id: int, force: bool = False) -> Tuple[dict, bool]:
+    """Export a dataset to shards unless an export of the current index exists. Returns (index, rebuilt)."""
+    fingerprint, paths, label_stores = await dataset_fingerprint(db, dataset_id, f"shards-v{LAYOUT_VERSION}")
+    if not paths:
+        raise ValueError(f"Dataset {dataset_id} has no indexed trainable images")
+    directory = shards_dir(dataset_id)
+    async with _export_locks.setdefault(dataset_id, asyncio.Lock()):
+        index = read_index(directory)
+        if not force and index and index.get("fingerprint") == fingerprint:
+            return index, False
+        captions = await asyncio.to_thread(lookup_captions, paths, label_stores)
+        return await asyncio.to_thread(write_shards, directory, paths, captions, fingerprint), True
+
+
+def read_sample_image(directory: Path, shard: str, offset: int, size: int) -> bytes:
+    """Random access to one sample's image bytes via the offset index."""
+    with open(directory / shard, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+def iter_shard(path: Path) -> Iterator[dict]:
+    """Samples of one shard, in order, read sequentially (tar stream mode)."""
+    sample: dict = {}
+    with tarfile.open(path, "r|") as tf:
+        for member in tf:
+            if not member.isfile():
+                continue
+            key, _, ext = member.name.partition(".")
+            if sample and sample["key"] != key:
+                yield sample
+                sample = {}
+            data = tf.extractfile(member).read()
+            sample["key"] = key
+            if ext == "txt":
+                sample["caption"] = data.decode("utf-8")
+            elif ext == "json":
+                sample.update(json.loads(data))
+            else:
+                sample["image"] = data
+                sample["ext"] = ext
+    if sample:
+        yield sample
+
+
+_DONE = object()
+
+
+class ShardReader:
+    """Stream samples from exported shards.
+
+    ``workers`` threads each read whole shards sequentially and push samples
+    into a queue holding at most ``prefetch`` samples, so disk reads overlap
+    with training. Shard order is shuffled per pass, and a shuffle buffer
+    of ``shuffle_buffer`` samples mixes samples across shards. Each
+    iteration is one pass (epoch) over the data.
+    """
+
+    def __init__(self, directory: Path, shuffle_buffer: int = 1000, workers: int = 2,
+                 prefetch: int = 256, seed: Optional[int] = None):
+        self.directory = directory
+        self.index = read_index(directory)
+        if self.index is None:
+            raise FileNotFoundError(f"No shard index in {directory}")
+        self.shuffle_buffer = shuffle_buffer
+        self.workers = max(1, workers)
+        self.prefetch = prefetch
+        self.rng = random.Random(seed)
+
+    def __len__(self) -> int:
+        return self.index["samples"]
+
+    def _produce(self, shards: "queue.Queue", out: "queue.Queue", stop: threading.Event) -> None:
+        try:
+            while not stop.is_set():
+                try:
+                    shard = shards.get_nowait()
+                except queue.Empty:
+                    return
+                for sample in iter_shard(self.directory / shard):
+                    while not stop.is_set():
+                        try:
+                            out.put(sample, timeout=0.1)
+                            break
+                        except queue.Full:
+                            continue
+                    if stop.is_set():
+                        return
+        except Exception as e:
+            out.put(e)
+        finally:
+            out.put(_DONE)
+
+    def __iter__(self) -> Iterator[dict]:
+        names = [shard["name"] for shard in self.index["shards"]]
+        self.rng.shuffle(names)
+        shards: "queue.Queue" = queue.Queue()
+        for name in names:
+            shards.put(name)
+        out: "queue.Queue" = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=self._produce, args=(shards, out, stop), name=f"shard-reader-{i}", daemon=True)
+            for i in range(min(self.workers, len(names)))
+        ]
+        for thread in threads:
+            thread.start()
+
+        buffer: List[dict] = []
+        running = len(threads)
+        try:
+            while running:
+                item = out.get()
+                if item is _DONE:
+                    running -= 1
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+                if len(buffer) < self.shuffle_buffer:
+                    buffer.append(item)
+                    continue
+                # Emit a random buffered sample and keep the new one in its place
+                slot = self.rng.randrange(len(buffer))
+                buffer[slot], item = item, buffer[slot]
+                yield item
+            self.rng.shuffle(buffer)
+            yield from buffer
+        finally:
+            stop.set()
+            # Unblock producers waiting on a full queue
+            while any(thread.is_alive() for thread in threads):
+                try:
+                    out.get_nowait()
+                except queue.Empty:
+                    time.sleep(0.01)
+
+    def batches(self, batch_size: int) -> Iterator[List[dict]]:
+        """Endless stream of batches, starting a new pass when one ends."""
+        while len(self):
+            batch: List[dict] = []
+            for sample in self:
+                batch.append(sample)
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
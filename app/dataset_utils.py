@@ -1,8 +1,58 @@
 """Utility functions for dataset management."""
+import os
 from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
 
 # File extensions to exclude when counting dataset items
-METADATA_EXTENSIONS = {'.json', '.txt', '.md'}
+METADATA_EXTENSIONS = {'.json', '.txt', '.md', '.db'}
+
+# Supported file extensions
+SUPPORTED_IMAGE_FORMATS = {
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.tiff', '.tif', 
+    '.ico', '.svg', '.heic', '.heif', '.avif', '.jfif'
+}
+
+SUPPORTED_VIDEO_FORMATS = {
+    '.mp4', '.avi', '.mov', '.mkv', '.webm', '.flv', '.wmv', '.m4v',
+    '.mpg', '.mpeg', '.3gp', '.ogv', '.vob', '.mts', '.m2ts'
+}
+
+SUPPORTED_AUDIO_FORMATS = {
+    '.wav', '.mp3', '.aac', '.flac', '.ogg', '.m4a', '.wma', '.opus'
+}
+
+SUPPORTED_ARCHIVE_FORMATS = {
+    '.zip', '.rar', '.7z', '.tar', '.gz', '.bz2', '.xz'
+}
+
+SUPPORTED_CSV_FORMATS = {
+    '.csv', '.tsv', '.txt'
+}
+
+ALL_SUPPORTED_FORMATS = (
+    SUPPORTED_IMAGE_FORMATS | 
+    SUPPORTED_VIDEO_FORMATS | 
+    SUPPORTED_AUDIO_FORMATS | 
+    SUPPORTED_ARCHIVE_FORMATS |
+    SUPPORTED_CSV_FORMATS
+)
+
+
+def get_file_type(filename: str) -> str:
+    """Determine file type based on extension."""
+    ext = Path(filename).suffix.lower()
+    if ext in SUPPORTED_IMAGE_FORMATS:
+        return "image"
+    elif ext in SUPPORTED_VIDEO_FORMATS:
+        return "video"
+    elif ext in SUPPORTED_AUDIO_FORMATS:
+        return "audio"
+    elif ext in SUPPORTED_ARCHIVE_FORMATS:
+        return "archive"
+    elif ext in SUPPORTED_CSV_FORMATS:
+        return "csv"
+    else:
+        return "other"
 
 
 def get_dataset_path(dataset_id: int, dataset_type: str) -> Path:
@@ -18,6 +68,48 @@ def get_dataset_path(dataset_id: int, dataset_type: str) -> Path:
     return Path("uploads") / dataset_type / f"dataset_{dataset_id}"
 
 
+def is_dataset_item(name: str) -> bool:
+    """Whether a file counts as a dataset item (not metadata, not a hidden/partial file)."""
+    return not name.startswith('.') and Path(name).suffix.lower() not in METADATA_EXTENSIONS
+
+
+def iter_dataset_files(dataset_path: Path) -> Iterator[Tuple[str, os.stat_result]]:
+    """Yield (posix path, stat) for every dataset item under a directory, using os.scandir."""
+    stack = [str(dataset_path)]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith('.'):
+                        stack.append(entry.path)
+                elif entry.is_file() and is_dataset_item(entry.name):
+                    yield Path(entry.path).as_posix(), entry.stat()
+
+
+def dataset_dirs(dataset_id: int) -> List[Path]:
+    """All upload directories (one per file type) holding files of a dataset."""
+    upload_dir = Path("uploads")
+    if not upload_dir.exists():
+        return []
+    return [
+        type_dir / f"dataset_{dataset_id}"
+        for type_dir in upload_dir.iterdir()
+        if type_dir.is_dir() and (type_dir / f"dataset_{dataset_id}").is_dir()
+    ]
+
+
+def dataset_id_from_path(path: Path) -> Optional[int]:
+    """Dataset id of a path under uploads/<type>/dataset_<id>/, if any."""
+    for part in Path(path).parts:
+        if part.startswith("dataset_") and part[len("dataset_"):].isdigit():
+            return int(part[len("dataset_"):])
+    return None
+
+
 def count_dataset_files(dataset_path: Path) -> int:
     """Count files in a dataset directory, excluding metadata files.
     
@@ -27,35 +119,19 @@ def count_dataset_files(dataset_path: Path) -> int:
     Returns:
         Number of data files (excluding metadata)
     """
-    if not dataset_path.exists():
-        return 0
-    
-    count = 0
-    for file in dataset_path.rglob("*"):
-        if file.is_file() and file.suffix.lower() not in METADATA_EXTENSIONS:
-            count += 1
-    return count
+    return sum(1 for _ in iter_dataset_files(dataset_path))
 
 
 def count_total_dataset_items(dataset_id: int) -> int:
     """Count files for a dataset across all upload directories.
     
+    This walks the file system; request paths should read the maintained
+    counters from the dataset index instead (see app.dataset_index).
+    
     Args:
         dataset_id: The dataset ID
         
     Returns:
         Total number of files
     """
-    upload_dir = Path("uploads")
-    if not upload_dir.exists():
-        return 0
-        
-    total_count = 0
-    # Check all type directories (image, video, archive, etc.)
-    for type_dir in upload_dir.iterdir():
-        if type_dir.is_dir():
-            dataset_dir = type_dir / f"dataset_{dataset_id}"
-            if dataset_dir.exists():
-                total_count += count_dataset_files(dataset_dir)
-                
-    return total_count
+    return sum(count_dataset_files(dataset_dir) for dataset_dir in dataset_dirs(dataset_id))
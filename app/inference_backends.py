@@ -0,0 +1,232 @@
+"""
+Optional inference backends for Stable Diffusion pipelines.
+
+The default ``eager`` backend runs the stock PyTorch modules. The other
+backends are opt-in (``INFERENCE_BACKEND`` in ``.env``) and trade a one-off
+preparation cost for faster denoising steps:
+
+- ``compile``: ``torch.compile`` on the UNet, with the Inductor FX graph cache
+  persisted under the models cache so compilation happens once per model.
+- ``channels_last``: NHWC memory format for the UNet and VAE convolutions.
+- ``cpu_bf16``: channels-last plus bfloat16 autocast on CPU.
+- ``onnx``: UNet and VAE decoder exported to ONNX and executed with
+  ONNX Runtime. Exports are cached on disk per model version.
+"""
+import contextlib
+import hashlib
+import logging
+from pathlib import Path
+from typing import Optional, get_args
+
+import torch
+
+from .config import InferenceBackend
+from .profiling import profile_inference
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_BACKENDS = get_args(InferenceBackend)
+
+ONNX_OPSET = 17
+
+
+def model_version_key(model_id: str, dtype: torch.dtype) -> str:
+    """Build a stable key identifying a model version for compiled artifacts.
+
+    Local models include the modification time of their ``model_index.json``
+    so that retrained weights invalidate previously exported graphs.
+    """
+    import diffusers
+
+    parts = [model_id, str(dtype), torch.__version__, diffusers.__version__]
+    index_file = Path(model_id) / "model_index.json"
+    if index_file.exists():
+        parts.append(str(index_file.stat().st_mtime_ns))
+    digest = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+    safe_name = Path(model_id).name.replace("/", "--") or "model"
+    return f"{safe_name}-{digest}"
+
+
+def apply_inference_backend(pipeline, backend: str, artifacts_dir: Path, model_key: str, device: str):
+    """Prepare a loaded pipeline for the requested backend.
+
+    Falls back to eager execution (with a warning) when the backend is not
+    usable in the current environment, so generation never fails because of
+    an optimization.
+    """
+    if backend not in INFERENCE_BACKENDS:
+        logger.warning(
+            f"Unknown inference backend {backend!r} (choose from {', '.join(INFERENCE_BACKENDS)}), "
+            "using eager PyTorch backend"
+        )
+        return pipeline
+
+    if backend == "eager":
+        return pipeline
+
+    if backend in ("channels_last", "cpu_bf16"):
+        pipeline.unet.to(memory_format=torch.channels_last)
+        pipeline.vae.to(memory_format=torch.channels_last)
+        if backend == "cpu_bf16" and device != "cpu":
+            logger.warning("cpu_bf16 backend requested on %s, autocast will be skipped", device)
+        return pipeline
+
+    if backend == "compile":
+        return _apply_torch_compile(pipeline, artifacts_dir)
+
+    try:
+        return _apply_onnx_runtime(pipeline, artifacts_dir / "onnx" / model_key, device)
+    except ImportError:
+        logger.warning("onnx/onnxruntime not installed, using eager PyTorch backend")
+    except Exception as e:
+        logger.warning(f"ONNX backend unavailable for {model_key}, using eager PyTorch backend: {e}")
+    return pipeline
+
+
+@contextlib.contextmanager
+def inference_context(backend: str, device: str):
+    """Context manager wrapping a pipeline call for the given backend.
+
+    Also profiles the call, on the thread running it, while a profile is armed.
+    """
+    with profile_inference():
+        if backend == "cpu_bf16" and device == "cpu":
+            with torch.autocast("cpu", dtype=torch.bfloat16):
+                yield
+        else:
+            yield
+
+
+def _apply_torch_compile(pipeline, artifacts_dir: Path):
+    """Compile the UNet with a persistent Inductor cache."""
+    if not hasattr(torch, "compile"):
+        logger.warning("torch.compile not available, using eager PyTorch backend")
+        return pipeline
+
+    import os
+
+    cache_dir = artifacts_dir / "inductor"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # Inductor reads its cache location from the environment at compile time
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(cache_dir))
+    try:
+        import torch._inductor.config as inductor_config
+
+        inductor_config.fx_graph_cache = True
+    except Exception:
+        logger.info("Inductor FX graph cache not available, compiled graphs will not persist")
+
+    pipeline.unet.to(memory_format=torch.channels_last)
+    pipeline.unet = torch.compile(pipeline.unet, fullgraph=False)
+    return pipeline
+
+
+class _UNetExport(torch.nn.Module):
+    """Tuple-returning UNet wrapper used for ONNX export."""
+
+    def __init__(self, unet):
+        super().__init__()
+        self.unet = unet
+
+    def forward(self, sample, timestep, encoder_hidden_states):
+        return self.unet(sample, timestep, encoder_hidden_states, return_dict=False)[0]
+
+
+class _VaeDecoderExport(torch.nn.Module):
+    """Tuple-returning VAE decoder wrapper used for ONNX export."""
+
+    def __init__(self, vae):
+        super().__init__()
+        self.vae = vae
+
+    def forward(self, latents):
+        return self.vae.decode(latents, return_dict=False)[0]
+
+
+def _export_onnx(pipeline, export_dir: Path) -> None:
+    """Export the UNet and VAE decoder of a pipeline to ONNX files."""
+    export_dir.mkdir(parents=True, exist_ok=True)
+    unet = pipeline.unet
+    vae = pipeline.vae
+    sample_size = unet.config.sample_size
+    seq_len = pipeline.tokenizer.model_max_length
+
+    with torch.no_grad():
+        sample = torch.randn(2, unet.config.in_channels, sample_size, sample_size, dtype=unet.dtype, device=unet.device)
+        timestep = torch.ones(2, dtype=torch.float32, device=unet.device)
+        hidden = torch.randn(2, seq_len, unet.config.cross_attention_dim, dtype=unet.dtype, device=unet.device)
+        torch.onnx.export(
+            _UNetExport(unet),
+            (sample, timestep, hidden),
+            str(export_dir / "unet.onnx"),
+            input_names=["sample", "timestep", "encoder_hidden_states"],
+            output_names=["out_sample"],
+            dynamic_axes={
+                "sample": {0: "batch", 2: "height", 3: "width"},
+                "timestep": {0: "batch"},
+                "encoder_hidden_states": {0: "batch", 1: "sequence"},
+                "out_sample": {0: "batch", 2: "height", 3: "width"},
+            },
+            opset_version=ONNX_OPSET,
+        )
+
+        latents = torch.randn(1, vae.config.latent_channels, sample_size, sample_size, dtype=vae.dtype, device=vae.device)
+        torch.onnx.export(
+            _VaeDecoderExport(vae),
+            (latents,),
+            str(export_dir / "vae_decoder.onnx"),
+            input_names=["latent_sample"],
+            output_names=["sample"],
+            dynamic_axes={
+                "latent_sample": {0: "batch", 2: "height", 3: "width"},
+                "sample": {0: "batch", 2: "height", 3: "width"},
+            },
+            opset_version=ONNX_OPSET,
+        )
+    (export_dir / "COMPLETE").touch()
+
+
+def _apply_onnx_runtime(pipeline, export_dir: Path, device: str):
+    """Route UNet and VAE decoding through ONNX Runtime sessions."""
+    import onnxruntime as ort
+    from diffusers.models.autoencoders.vae import DecoderOutput
+    from diffusers.models.unets.unet_2d_condition import UNet2DConditionOutput
+
+    if getattr(pipeline.unet.config, "addition_embed_type", None):
+        raise ValueError("ONNX backend only supports UNets without added conditioning (SD 1.x/2.x)")
+
+    if not (export_dir / "COMPLETE").exists():
+        logger.info(f"Exporting UNet and VAE decoder to ONNX in {export_dir} (one-time cost)")
+        _export_onnx(pipeline, export_dir)
+    else:
+        logger.info(f"Using cached ONNX export from {export_dir}")
+
+    providers = ["CPUExecutionProvider"]
+    if device == "cuda" and "CUDAExecutionProvider" in ort.get_available_providers():
+        providers.insert(0, "CUDAExecutionProvider")
+    unet_session = ort.InferenceSession(str(export_dir / "unet.onnx"), providers=providers)
+    vae_session = ort.InferenceSession(str(export_dir / "vae_decoder.onnx"), providers=providers)
+
+    unet = pipeline.unet
+    vae = pipeline.vae
+
+    def unet_forward(sample, timestep, encoder_hidden_states, *args, return_dict: bool = True, **kwargs):
+        timestep = torch.as_tensor(timestep, dtype=torch.float32).reshape(-1).expand(sample.shape[0])
+        out = unet_session.run(None, {
+            "sample": sample.detach().cpu().numpy(),
+            "timestep": timestep.detach().cpu().numpy(),
+            "encoder_hidden_states": encoder_hidden_states.detach().cpu().numpy(),
+        })[0]
+        out = torch.from_numpy(out).to(device=sample.device, dtype=sample.dtype)
+        return UNet2DConditionOutput(sample=out) if return_dict else (out,)
+
+    def vae_decode(z, return_dict: bool = True, generator: Optional[torch.Generator] = None):
+        out = vae_session.run(None, {"latent_sample": z.detach().cpu().numpy()})[0]
+        out = torch.from_numpy(out).to(device=z.device, dtype=z.dtype)
+        return DecoderOutput(sample=out) if return_dict else (out,)
+
+    # Instance attributes shadow the module methods; config, dtype and device
+    # stay those of the original modules so the pipeline logic is unchanged.
+    unet.forward = unet_forward
+    vae.decode = vae_decode
+    return pipeline
@@ -1,10 +1,15 @@
 import asyncio
+import time
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional
 from uuid import uuid4
 
 from .config import get_settings
+from .metrics import JOB_QUEUE_DEPTH, JOB_QUEUE_WAIT_SECONDS, JOB_RUN_SECONDS
+from .profiling import JobTrace, current_trace, trace_span
+from .stats_store import stats_store
+from .timeseries import get_timeseries_store
 from .schemas import (
     ImageToImageRequest,
     ImageToVideoRequest,
@@ -13,6 +18,7 @@ from .schemas import (
     JobState,
     JobStatus,
     JobType,
+    PreviewRefineRequest,
     TextToImageRequest,
     TextToVideoRequest,
     UpscaleRequest,
@@ -20,24 +26,67 @@ from .schemas import (
 
 
 class JobQueue:
-    def __init__(self, output_dir: Path, max_parallel_jobs: int = 1, delay: float = 0.5):
+    def __init__(self, output_dir: Path, max_parallel_jobs: int = 1, delay: float = 0.5,
+                 preview_ttl: float = 900.0, max_pending_previews: int = 16):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.max_parallel_jobs = max(1, max_parallel_jobs)
         self.delay = delay
+        self.preview_ttl = preview_ttl
+        self.max_pending_previews = max(1, max_pending_previews)
 
         self.jobs: Dict[str, JobState] = {}
         self.queue: asyncio.Queue[str] = asyncio.Queue()
         self.workers: List[asyncio.Task] = []
         self._started = False
+        # Preview-then-refine state: preview results awaiting refinement and auto-refine/expiry timers
+        self.previews: Dict[str, object] = {}
+        self._refine_timers: Dict[str, asyncio.TimerHandle] = {}
+        self._enqueued_at: Dict[str, float] = {}  # monotonic enqueue times for wait metrics
+        # Time previews spent waiting for the user, left out of generation durations
+        self._preview_ready_at: Dict[str, datetime] = {}
+        self._confirm_wait: Dict[str, float] = {}
 
     def start(self) -> None:
         if self._started:
             return
         for _ in range(self.max_parallel_jobs):
             self.workers.append(asyncio.create_task(self._worker()))
+        JOB_QUEUE_DEPTH.set_function(self.queue.qsize)
         self._started = True
 
+    def _enqueue(self, job_id: str) -> None:
+        self._enqueued_at[job_id] = time.perf_counter()
+        self.queue.put_nowait(job_id)
+        get_timeseries_store().record_queue_depth(self.queue.qsize())
+
+    def _set_status(self, job: JobState, status: JobStatus) -> None:
+        """Change a job's status and feed the transition to the monitoring aggregates."""
+        old_status = job.status
+        job.status = status
+        now = datetime.utcnow()
+        if status == JobStatus.preview_ready:
+            self._preview_ready_at[job.id] = now
+        elif old_status == JobStatus.preview_ready and job.id in self._preview_ready_at:
+            waited = (now - self._preview_ready_at.pop(job.id)).total_seconds()
+            self._confirm_wait[job.id] = self._confirm_wait.get(job.id, 0.0) + waited
+        duration = None
+        if status == JobStatus.done:
+            duration = (now - job.created_at).total_seconds() - self._confirm_wait.pop(job.id, 0.0)
+        elif status == JobStatus.failed:
+            self._confirm_wait.pop(job.id, None)
+        stats_store.record_transition(
+            job.type.value,
+            old_status.value,
+            status.value,
+            duration=duration,
+            preset=job.params.get("preset") or job.params.get("style_preset"),
+        )
+        if status == JobStatus.done:
+            get_timeseries_store().record_job("completed", duration)
+        elif status == JobStatus.failed:
+            get_timeseries_store().record_job("failed")
+
     def _create_job(self, job_type: JobType, payload) -> JobState:
         """Common job creation logic."""
         job_id = str(uuid4())
@@ -55,7 +104,9 @@ class JobQueue:
             error=None,
         )
         self.jobs[job_id] = job
-        self.queue.put_nowait(job_id)
+        stats_store.record_transition(job_type.value, None, JobStatus.pending.value, when=now)
+        get_timeseries_store().record_job("created")
+        self._enqueue(job_id)
         return job
 
     def create_text_to_image_job(self, payload: TextToImageRequest) -> JobState:
@@ -76,17 +127,50 @@ class JobQueue:
     def create_upscale_job(self, payload: UpscaleRequest) -> JobState:
         return self._create_job(JobType.upscale, payload)
 
+    def create_preview_refine_job(self, payload: PreviewRefineRequest) -> JobState:
+        return self._create_job(JobType.preview_refine, payload)
+
     def get_job(self, job_id: str) -> Optional[JobState]:
         return self.jobs.get(job_id)
 
+    def confirm_refine(self, job_id: str, index: Optional[int] = None) -> Optional[JobState]:
+        """Queue the refine pass of a preview job for the chosen output.
+
+        Called by the user confirming a preview, or by the auto-refine timer.
+        Does nothing if the job is no longer waiting for confirmation.
+        """
+        job = self.jobs.get(job_id)
+        if not job or job.status != JobStatus.preview_ready:
+            return job
+        if index is not None:
+            if index >= len(job.outputs):
+                raise ValueError(f"Preview index {index} out of range (0-{len(job.outputs) - 1})")
+            job.params["refine_index"] = index
+        timer = self._refine_timers.pop(job_id, None)
+        if timer is not None:
+            timer.cancel()
+        self._set_status(job, JobStatus.pending)
+        job.updated_at = datetime.utcnow()
+        job.logs.append(f"Refine queued for preview {job.params.get('refine_index', 0)}")
+        self._enqueue(job_id)
+        return job
+
     async def _worker(self) -> None:
         while True:
             job_id = await self.queue.get()
             job = self.jobs.get(job_id)
+            enqueued_at = self._enqueued_at.pop(job_id, None)
             if not job:
                 self.queue.task_done()
                 continue
-            job.status = JobStatus.running
+            started = time.perf_counter()
+            trace = JobTrace()
+            trace_token = current_trace.set(trace)
+            if enqueued_at is not None:
+                JOB_QUEUE_WAIT_SECONDS.observe(started - enqueued_at, type=job.type.value)
+                trace.add("queue_wait", started - enqueued_at)
+            get_timeseries_store().record_queue_depth(self.queue.qsize())
+            self._set_status(job, JobStatus.running)
             job.updated_at = datetime.utcnow()
             try:
                 if job.type == JobType.text_to_image:
@@ -101,12 +185,21 @@ class JobQueue:
                     await self._run_inpainting(job)
                 elif job.type == JobType.upscale:
                     await self._run_upscale(job)
-                job.status = JobStatus.done
-                job.progress = 1.0
+                elif job.type == JobType.preview_refine:
+                    await self._run_preview_refine(job)
+                if job.status != JobStatus.preview_ready:
+                    job.progress = 1.0
+                    self._set_status(job, JobStatus.done)
             except Exception as exc:  # pragma: no cover - defensive
-                job.status = JobStatus.failed
                 job.error = str(exc)
+                self._set_status(job, JobStatus.failed)
+                self.previews.pop(job.id, None)
             finally:
+                run_seconds = time.perf_counter() - started
+                JOB_RUN_SECONDS.observe(run_seconds, type=job.type.value, status=job.status.value)
+                current_trace.reset(trace_token)
+                trace.add("run", run_seconds)
+                job.logs.append(trace.summary())
                 job.updated_at = datetime.utcnow()
                 self.queue.task_done()
 
@@ -135,6 +228,8 @@ class JobQueue:
                 steps = params.get('steps', 30)
                 cfg_scale = params.get('cfg_scale', 7.5)
                 seed = params.get('seed', None)
+                scheduler = params.get('scheduler', None)
+                quality = params.get('quality', 'standard')
                 
                 # Get model path from database if it's a trained model
                 model_path = None
@@ -161,12 +256,15 @@ class JobQueue:
                     num_inference_steps=steps,
                     guidance_scale=cfg_scale,
                     seed=seed,
+                    scheduler=scheduler,
+                    quality=quality,
                 )
                 
                 # Save generated images
                 for idx, image in enumerate(images):
                     outfile = self.output_dir / f"{job.id}-{idx + 1}.png"
-                    image.save(outfile)
+                    with trace_span("save"):
+                        image.save(outfile)
                     
                     relative_path = f"/outputs/{outfile.name}"
                     outputs.append(JobOutput(index=idx, path=relative_path))
@@ -216,7 +314,8 @@ class JobQueue:
                 draw.text((20, 20), text, fill=(255, 255, 255), font=font)
                 
                 # Save image
-                img.save(outfile)
+                with trace_span("save"):
+                    img.save(outfile)
                 
                 # Convert absolute path to relative URL path for frontend
                 relative_path = f"/outputs/{outfile.name}"
@@ -228,6 +327,141 @@ class JobQueue:
         
         job.outputs = outputs
 
+    async def _run_preview_refine(self, job: JobState) -> None:
+        """Run the preview pass, or the refine pass once the preview is confirmed."""
+        if job.id in self.previews:
+            await self._run_refine(job)
+        else:
+            await self._run_preview(job)
+
+    async def _run_preview(self, job: JobState) -> None:
+        import random
+
+        params = job.params
+        num_outputs = params.get("num_outputs", 1)
+        scale = params.get("preview_scale", 0.5)
+        # Latent sizes must stay multiples of 8 pixels
+        preview_width = max(64, int(params.get("width", 512) * scale) // 8 * 8)
+        preview_height = max(64, int(params.get("height", 768) * scale) // 8 * 8)
+        base_seed = params.get("seed")
+        if base_seed is None:
+            base_seed = random.randint(0, 2**31 - 1)
+        seeds = [base_seed + idx for idx in range(num_outputs)]
+
+        settings = get_settings()
+        if settings.use_real_ai:
+            from .ai_generator import get_ai_generator
+
+            preview = await get_ai_generator().generate_preview(
+                prompt=params.get("prompt", ""),
+                model_name=params.get("model", "stable-diffusion-1.5"),
+                negative_prompt=params.get("negative_prompt"),
+                seeds=seeds,
+                width=preview_width,
+                height=preview_height,
+                num_inference_steps=params.get("steps", 30),
+                guidance_scale=params.get("cfg_scale", 7.5),
+                scheduler=params.get("scheduler"),
+            )
+            images = preview.images
+        else:
+            from PIL import Image
+
+            images = []
+            for current_seed in seeds:
+                rng = random.Random(current_seed)
+                color = (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))
+                images.append(Image.new("RGB", (preview_width, preview_height), color))
+            await asyncio.sleep(self.delay)
+            preview = images
+
+        outputs: List[JobOutput] = []
+        for idx, image in enumerate(images):
+            outfile = self.output_dir / f"{job.id}-preview-{idx + 1}.png"
+            with trace_span("save"):
+                image.save(outfile)
+            outputs.append(JobOutput(
+                index=idx,
+                path=f"/outputs/{outfile.name}",
+                metadata={"phase": "preview", "seed": seeds[idx], "width": preview_width, "height": preview_height},
+            ))
+
+        self._evict_previews()
+        self.previews[job.id] = preview
+        params["seeds"] = seeds
+        job.outputs = outputs
+        job.progress = 0.5
+        self._set_status(job, JobStatus.preview_ready)
+        job.logs.append(f"Preview ready at {preview_width}x{preview_height}")
+
+        delay = params.get("auto_refine_after")
+        loop = asyncio.get_running_loop()
+        if delay is not None:
+            self._refine_timers[job.id] = loop.call_later(delay, self.confirm_refine, job.id)
+            job.logs.append(f"Auto-refine in {delay:g}s unless confirmed earlier")
+        else:
+            self._refine_timers[job.id] = loop.call_later(self.preview_ttl, self.expire_preview, job.id)
+            job.logs.append(f"Preview expires in {self.preview_ttl:g}s unless confirmed")
+
+    def _evict_previews(self) -> None:
+        """Expire the oldest unconfirmed previews so at most max_pending_previews - 1 remain."""
+        waiting = [
+            job_id for job_id in self.previews
+            if job_id in self.jobs and self.jobs[job_id].status == JobStatus.preview_ready
+        ]
+        for job_id in waiting[:max(0, len(waiting) - self.max_pending_previews + 1)]:
+            self.expire_preview(job_id)
+
+    def expire_preview(self, job_id: str) -> None:
+        """Drop an unconfirmed preview's latents and finish the job with the preview outputs only."""
+        job = self.jobs.get(job_id)
+        timer = self._refine_timers.pop(job_id, None)
+        if timer is not None:
+            timer.cancel()
+        if not job or job.status != JobStatus.preview_ready:
+            return
+        self.previews.pop(job_id, None)
+        job.progress = 1.0
+        job.updated_at = datetime.utcnow()
+        job.logs.append("Preview expired without confirmation; refine no longer available")
+        self._set_status(job, JobStatus.done)
+
+    async def _run_refine(self, job: JobState) -> None:
+        params = job.params
+        preview = self.previews.pop(job.id)
+        index = params.get("refine_index", 0)
+        width = params.get("width", 512)
+        height = params.get("height", 768)
+
+        settings = get_settings()
+        if settings.use_real_ai:
+            from .ai_generator import get_ai_generator
+
+            image = await get_ai_generator().refine_preview(
+                preview,
+                index=index,
+                width=width,
+                height=height,
+                num_inference_steps=params.get("steps", 30),
+                guidance_scale=params.get("cfg_scale", 7.5),
+                strength=params.get("refine_strength", 0.5),
+                scheduler=params.get("scheduler"),
+            )
+        else:
+            image = preview[index].resize((width, height))
+            await asyncio.sleep(self.delay)
+
+        outfile = self.output_dir / f"{job.id}-{index + 1}.png"
+        with trace_span("save"):
+            image.save(outfile)
+        previews = [output for output in job.outputs if (output.metadata or {}).get("phase") == "preview"]
+        job.outputs = previews + [JobOutput(
+            index=len(previews),
+            path=f"/outputs/{outfile.name}",
+            metadata={"phase": "refined", "seed": params["seeds"][index], "width": width, "height": height},
+        )]
+        job.logs.append(f"Refined preview {index} at {width}x{height}")
+
     async def _run_text_to_video(self, job: JobState) -> None:
         params = job.params
         outfile = self.output_dir / f"{job.id}-video.txt"
@@ -317,4 +551,6 @@ def build_job_queue() -> JobQueue:
         output_dir=settings.output_dir,
         max_parallel_jobs=settings.max_parallel_jobs,
         delay=settings.mock_generation_delay,
+        preview_ttl=settings.preview_ttl,
+        max_pending_previews=settings.max_pending_previews,
     )
@@ -0,0 +1,595 @@
+"""
+LoRA fine-tuning of a Stable Diffusion UNet in a worker process.
+
+The API process prepares the training cache and supervises; the training
+itself runs in a spawned process, so PyTorch never holds the GIL of the
+process serving requests. The worker trains from the cache's precomputed
+VAE latents and caption token ids, so no image is decoded or VAE-encoded
+during training. Caption embeddings come from the frozen text encoder,
+computed once per distinct caption when they fit in memory.
+
+- PEFT LoRA adapters on the UNet attention projections; all else is frozen
+- gradient accumulation over ``gradient_accumulation_steps`` micro-batches
+- optional gradient checkpointing (activations recomputed in backward)
+- autocast: fp16 with loss scaling or bf16 on CUDA; bf16 on CPUs with native
+  bf16 instructions, fp32 on other CPUs
+
+Checkpoints (see ``training_checkpoints``) are written every
+``checkpoint_steps`` optimizer steps, or at the end of each epoch, and when
+training is stopped. A run resumed from one continues with the same
+weights, optimizer moments, RNG state and position in the epoch's data
+order, which is derived from the seed and the epoch number.
+
+With ``world_size`` > 1 training is data-parallel over that many
+processes (``torch.distributed``, gloo backend, CPU): every rank trains on
+its own stride of each epoch's sample order, and after each optimizer
+step's micro-batches the LoRA gradients are averaged with one all-reduce,
+which also carries the step's loss and the stop flag, so all ranks step,
+log and stop together. Rank 0 reports, with per-rank statistics, and
+writes checkpoints. The launcher starts ``local_ranks`` ranks on this
+machine; other nodes join the same rendezvous by running this module
+with the job's ``distributed_spec.json`` (they need the same cache and
+checkpoint paths, e.g. on a shared filesystem)::
+
+    python -m app.lora_trainer outputs/training/<job>/distributed_spec.json --node-rank 1
+
+Progress, logs and the result travel back to the API process as plain
+dicts on a multiprocessing queue; a stop event ends training after the
+current optimizer step.
+"""
+import argparse
+import dataclasses
+import json
+import logging
+import math
+import os
+import queue
+import random
+import socket
+import sys
+import time
+import traceback
+from dataclasses import dataclass
+from datetime import timedelta
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LORA_TARGET_MODULES = ["to_q", "to_k", "to_v", "to_out.0"]
+MAX_CACHED_EMBEDDINGS = 1024  # distinct captions encoded up front; beyond that, per batch
+MAX_GRAD_NORM = 1.0
+DISTRIBUTED_TIMEOUT = timedelta(minutes=10)  # a rank that stops answering fails the job after this
+
+
+@dataclass
+class LoraTrainingSpec:
+    job_id: str
+    cache_dir: str  # training cache with latents.npy and input_ids.npy
+    base_model: str
+    output_path: str  # final LoRA weights (.safetensors)
+    learning_rate: float = 1e-4
+    batch_size: int = 4
+    num_epochs: int = 10
+    max_steps: Optional[int] = None  # optimizer steps; overrides num_epochs when reached first
+    lora_rank: int = 4
+    lora_alpha: int = 32
+    mixed_precision: str = "fp16"  # "no", "fp16" or "bf16"
+    gradient_accumulation_steps: int = 1
+    gradient_checkpointing: bool = False
+    seed: Optional[int] = None
+    device: Optional[str] = None
+    report_every: int = 5  # optimizer steps between progress events
+    checkpoint_dir: Optional[str] = None  # no checkpoints when unset
+    checkpoint_steps: Optional[int] = None  # optimizer steps between checkpoints; None: every epoch
+    keep_last_checkpoints: int = 3
+    keep_best_checkpoints: int = 1
+    resume_from: Optional[str] = None  # checkpoint directory
+    world_size: int = 1  # data-parallel ranks over all nodes
+    local_ranks: Optional[int] = None  # ranks the launcher starts on this node; world_size when unset
+    node_rank: int = 0
+    init_method: Optional[str] = None  # torch.distributed rendezvous; a free local port when unset
+
+
+def cpu_has_native_bf16() -> bool:
+    """Whether this CPU has bf16 instructions (AVX512-BF16/AMX on x86, BF16 on Arm); Linux only."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith(("flags", "Features")):
+                    flags = set(line.split(":", 1)[1].split())
+                    return bool(flags & {"avx512_bf16", "amx_bf16", "bf16"})
+    except OSError:
+        pass
+    return False
+
+
+def autocast_dtype(torch, device_type: str, mixed_precision: Optional[str]):
+    """Autocast dtype for a device and the job's mixed_precision setting, or None for fp32.
+
+    CPU autocast only supports bf16, and emulated bf16 is slower than fp32:
+    CPUs train in bf16 only when it is requested and native, fp32 otherwise.
+    """
+    if mixed_precision in (None, "no", "fp32"):
+        return None
+    if device_type != "cuda":
+        return torch.bfloat16 if mixed_precision == "bf16" and cpu_has_native_bf16() else None
+    return torch.bfloat16 if mixed_precision == "bf16" else torch.float16
+
+
+def load_latent_cache(directory: Path):
+    """Memory-mapped (latents, input_ids) of a training cache."""
+    import numpy as np
+
+    manifest = json.loads((directory / "manifest.json").read_text())
+    arrays = manifest.get("arrays", {})
+    if "latents" not in arrays or "input_ids" not in arrays:
+        raise ValueError(f"Training cache {directory} has no precomputed latents and token ids")
+    return np.load(directory / "latents.npy", mmap_mode="r"), np.load(directory / "input_ids.npy", mmap_mode="r")
+
+
+def lora_state_dict(unet) -> Dict[str, Any]:
+    """The UNet's LoRA weights, keyed as diffusers' ``load_lora_weights`` expects."""
+    import torch
+    from diffusers.utils import convert_state_dict_to_diffusers
+    from peft.utils import get_peft_model_state_dict
+
+    state = convert_state_dict_to_diffusers(get_peft_model_state_dict(unet))
+    # Copies, never views of the live parameters: checkpoints are serialized while training goes on
+    return {
+        f"unet.{key}": value.detach().to("cpu", torch.float32, copy=True).contiguous()
+        for key, value in state.items()
+    }
+
+
+def rank_partition(order, rank: int, world_size: int):
+    """A rank's share of an epoch's sample order.
+
+    Ranks take interleaved strides; the order is wrapped around to a
+    multiple of ``world_size`` first, so every rank runs the same number
+    of steps (required for the gradient all-reduce).
+    """
+    import numpy as np
+
+    per_rank = math.ceil(len(order) / world_size)
+    return np.resize(order, per_rank * world_size)[rank::world_size]
+
+
+def sync_step(params, world_size: int, loss: float, stop: bool):
+    """Average the gradients over all ranks in one all-reduce. Returns (mean loss, any rank stopping)."""
+    import torch
+    import torch.distributed as dist
+
+    grads = [param.grad if param.grad is not None else torch.zeros_like(param) for param in params]
+    flat = torch.cat([grad.reshape(-1).float() for grad in grads] + [torch.tensor([loss, float(stop)])])
+    dist.all_reduce(flat)
+    flat /= world_size
+    offset = 0
+    for param, grad in zip(params, grads):
+        param.grad = flat[offset:offset + grad.numel()].view_as(grad).to(grad.dtype)
+        offset += grad.numel()
+    return flat[-2].item(), flat[-1].item() > 0
+
+
+def gather_rank_stats(values: List[float], world_size: int) -> List[List[float]]:
+    import torch
+    import torch.distributed as dist
+
+    local = torch.tensor(values, dtype=torch.float64)
+    gathered = [torch.zeros_like(local) for _ in range(world_size)]
+    dist.all_gather(gathered, local)
+    return [row.tolist() for row in gathered]
+
+
+class _CaptionEncoder:
+    """Frozen text-encoder outputs for rows of the cached token ids."""
+
+    def __init__(self, text_encoder, input_ids, device):
+        import numpy as np
+        import torch
+
+        self.text_encoder = text_encoder
+        self.input_ids = input_ids
+        self.device = device
+        self.embeddings = None
+        unique, inverse = np.unique(np.asarray(input_ids), axis=0, return_inverse=True)
+        if len(unique) <= MAX_CACHED_EMBEDDINGS:
+            self.inverse = torch.from_numpy(inverse.ravel())
+            # no_grad rather than inference_mode: these tensors feed the LoRA layers' backward
+            with torch.no_grad():
+                self.embeddings = torch.cat([
+                    text_encoder(torch.from_numpy(unique[i:i + 64]).long().to(device))[0]
+                    for i in range(0, len(unique), 64)
+                ])
+
+    def __call__(self, indices):
+        import torch
+
+        if self.embeddings is not None:
+            return self.embeddings[self.inverse[indices].to(self.device)]
+        with torch.no_grad():
+            ids = torch.from_numpy(self.input_ids[indices]).long().to(self.device)
+            return self.text_encoder(ids)[0]
+
+
+def run_lora_training(spec: LoraTrainingSpec, report: Callable[[dict], None],
+                      should_stop: Callable[[], bool], rank: int = 0) -> dict:
+    """Train LoRA adapters as described by ``spec`` as one rank (blocking; runs in a worker process)."""
+    import numpy as np
+    import torch
+    import torch.nn.functional as F
+    from diffusers import DDPMScheduler, UNet2DConditionModel
+    from peft import LoraConfig
+    from peft.utils import get_peft_model_state_dict, set_peft_model_state_dict
+    from safetensors.torch import save_file
+    from transformers import CLIPTextModel
+
+    from .training_checkpoints import CheckpointWriter, load_training_state, snapshot_training_state
+
+    world_size = max(1, spec.world_size)
+    distributed = world_size > 1
+    is_main = rank == 0
+
+    def log(message: str, level: str = "info") -> None:
+        if is_main:
+            report({"type": "log", "message": message, "level": level})
+
+    resume = None
+    if spec.resume_from:
+        resume = load_training_state(Path(spec.resume_from))
+        if (resume[2]["lora_rank"], resume[2]["lora_alpha"]) != (spec.lora_rank, spec.lora_alpha):
+            raise ValueError(
+                f"Checkpoint has LoRA rank {resume[2]['lora_rank']}, alpha {resume[2]['lora_alpha']}; "
+                f"the job is configured for rank {spec.lora_rank}, alpha {spec.lora_alpha}"
+            )
+    # A seed is always recorded, so that a resumed run replays the same data order
+    seed = resume[2]["seed"] if resume else spec.seed if spec.seed is not None else random.randrange(2**31)
+    if distributed and spec.seed is None and not resume:
+        raise ValueError("Distributed training needs a seed shared by all ranks")
+    torch.manual_seed(seed + rank)  # same data order on every rank, different noise
+    if distributed:
+        import torch.distributed as dist
+
+        dist.init_process_group(
+            "gloo", init_method=spec.init_method, rank=rank, world_size=world_size, timeout=DISTRIBUTED_TIMEOUT
+        )
+    # gloo reduces CPU tensors: distributed runs train on CPU unless told otherwise
+    device = torch.device(spec.device or ("cuda" if torch.cuda.is_available() and not distributed else "cpu"))
+    latents, input_ids = load_latent_cache(Path(spec.cache_dir))
+    count = len(latents)
+
+    noise_scheduler = DDPMScheduler.from_pretrained(spec.base_model, subfolder="scheduler")
+    text_encoder = CLIPTextModel.from_pretrained(spec.base_model, subfolder="text_encoder").to(device).eval()
+    unet = UNet2DConditionModel.from_pretrained(spec.base_model, subfolder="unet").to(device)
+    text_encoder.requires_grad_(False)
+    unet.requires_grad_(False)
+    unet.add_adapter(LoraConfig(
+        r=spec.lora_rank,
+        lora_alpha=spec.lora_alpha,
+        init_lora_weights="gaussian",
+        target_modules=LORA_TARGET_MODULES,
+    ))
+    if spec.gradient_checkpointing:
+        unet.enable_gradient_checkpointing()
+    unet.train()
+    params = [param for param in unet.parameters() if param.requires_grad]
+    optimizer = torch.optim.AdamW(params, lr=spec.learning_rate)
+
+    amp_dtype = autocast_dtype(torch, device.type, spec.mixed_precision)
+    precision = {torch.bfloat16: "bf16", torch.float16: "fp16"}.get(amp_dtype, "no")
+    if precision != ("no" if spec.mixed_precision in (None, "fp32") else spec.mixed_precision):
+        log(f"mixed_precision={spec.mixed_precision} isn't available on this {device.type} device; "
+            f"training with {'fp32' if precision == 'no' else precision}", "warning")
+    scaler = torch.cuda.amp.GradScaler(enabled=amp_dtype == torch.float16)
+    if resume:
+        adapter, optimizer_state, meta = resume
+        set_peft_model_state_dict(unet, {key: value.to(device) for key, value in adapter.items()})
+        optimizer.load_state_dict(optimizer_state)
+        for group in optimizer.param_groups:
+            group["lr"] = spec.learning_rate
+        if meta["state"].get("scaler") and scaler.is_enabled():
+            scaler.load_state_dict(meta["state"]["scaler"])
+        if "rng_torch" in meta and is_main:
+            torch.set_rng_state(meta["rng_torch"])
+        elif distributed:
+            # Only rank 0's generator is checkpointed; the others get a fresh, per-rank stream
+            torch.manual_seed(hash((seed, rank, meta["step"])))
+    encode = _CaptionEncoder(text_encoder, input_ids, device)
+    num_train_timesteps = noise_scheduler.config.num_train_timesteps
+    prediction_type = noise_scheduler.config.prediction_type
+
+    accumulation = max(1, spec.gradient_accumulation_steps)
+    per_rank = math.ceil(count / world_size)
+    micro_batches = math.ceil(per_rank / spec.batch_size)
+    steps_per_epoch = math.ceil(micro_batches / accumulation)
+    total_steps = steps_per_epoch * spec.num_epochs
+    if spec.max_steps:
+        total_steps = min(total_steps, spec.max_steps)
+    log(
+        f"Training {sum(p.numel() for p in params):,} LoRA parameters on {device.type} "
+        f"({amp_dtype or torch.float32}), {count} sample(s), {total_steps} step(s), "
+        f"effective batch {spec.batch_size * accumulation * world_size}"
+        + (f", {world_size} ranks" if distributed else "")
+    )
+
+    step = epoch = 0
+    first_epoch, skip_steps, trained_samples = 1, 0, 0
+    if resume:
+        meta = resume[2]
+        step, trained_samples = meta["step"], meta.get("samples", 0)
+        if meta.get("steps_per_epoch") == steps_per_epoch:
+            first_epoch, skip_steps = divmod(step, steps_per_epoch)
+            first_epoch += 1
+        else:
+            first_epoch = meta["epoch"] + 1
+            log("Dataset or batch settings changed since the checkpoint; resuming at the next epoch", "warning")
+        log(f"Resumed from {Path(spec.resume_from).name} at step {step}, epoch {first_epoch}")
+
+    writer = None
+    if spec.checkpoint_dir and is_main:
+        writer = CheckpointWriter(
+            Path(spec.checkpoint_dir), spec.keep_last_checkpoints, spec.keep_best_checkpoints,
+            on_saved=lambda info: report({"type": "checkpoint", **info}),
+        )
+    saved_step = step
+    window_loss, window_steps = 0.0, 0  # loss since the last checkpoint, its ranking metric
+
+    def checkpoint() -> None:
+        nonlocal saved_step, window_loss, window_steps
+        if writer is None or step == saved_step:
+            return
+        tensors, state = snapshot_training_state(get_peft_model_state_dict(unet), optimizer, scaler)
+        writer.save(step, epoch, window_loss / max(1, window_steps), lora_state_dict(unet), tensors, state, {
+            "seed": seed,
+            "samples": trained_samples + samples * world_size,
+            "steps_per_epoch": steps_per_epoch,
+            "lora_rank": spec.lora_rank,
+            "lora_alpha": spec.lora_alpha,
+        })
+        saved_step = step
+        window_loss, window_steps = 0.0, 0
+
+    samples = 0  # this rank's; every rank trains the same number
+    loss_value = float("nan")
+    stop = False
+    started = time.perf_counter()
+    try:
+        for epoch in range(first_epoch, spec.num_epochs + 1):
+            if step >= total_steps:
+                break
+            order = np.random.default_rng([seed, epoch]).permutation(count)
+            if distributed:
+                order = rank_partition(order, rank, world_size)
+            batches = [np.sort(order[i:i + spec.batch_size]) for i in range(0, len(order), spec.batch_size)]
+            epoch_loss, epoch_steps = 0.0, 0
+            for first in range(skip_steps * accumulation, len(batches), accumulation):
+                group = batches[first:first + accumulation]
+                local_loss = 0.0
+                for indices in group:
+                    # Sorted indices read the memory-mapped latents in file order
+                    clean = torch.from_numpy(np.ascontiguousarray(latents[indices])).to(device, torch.float32)
+                    noise = torch.randn_like(clean)
+                    timesteps = torch.randint(0, num_train_timesteps, (len(indices),), device=device).long()
+                    noisy = noise_scheduler.add_noise(clean, noise, timesteps)
+                    if prediction_type == "v_prediction":
+                        target = noise_scheduler.get_velocity(clean, noise, timesteps)
+                    else:
+                        target = noise
+                    with torch.autocast(device.type, dtype=amp_dtype or torch.bfloat16, enabled=amp_dtype is not None):
+                        prediction = unet(noisy, timesteps, encode(indices)).sample
+                    loss = F.mse_loss(prediction.float(), target.float())
+                    scaler.scale(loss / len(group)).backward()
+                    local_loss += loss.item() / len(group)
+                    samples += len(indices)
+
+                stop = should_stop()
+                loss_value = local_loss
+                if distributed:
+                    loss_value, stop = sync_step(params, world_size, local_loss, stop)
+                scaler.unscale_(optimizer)
+                torch.nn.utils.clip_grad_norm_(params, MAX_GRAD_NORM)
+                scaler.step(optimizer)
+                scaler.update()
+                optimizer.zero_grad(set_to_none=True)
+                step += 1
+                epoch_loss += loss_value
+                epoch_steps += 1
+                window_loss += loss_value
+                window_steps += 1
+                if spec.checkpoint_steps and step % spec.checkpoint_steps == 0:
+                    checkpoint()
+
+                if step % spec.report_every == 0 or step == total_steps or stop:
+                    rate = samples / (time.perf_counter() - started)
+                    ranks = gather_rank_stats([local_loss, rate], world_size) if distributed else None
+                    if is_main:
+                        report({
+                            "type": "progress",
+                            "epoch": epoch,
+                            "step": step,
+                            "total_steps": total_steps,
+                            "progress": step / total_steps,
+                            "loss": loss_value,
+                            "samples": trained_samples + samples * world_size,
+                            "samples_per_second": sum(row[1] for row in ranks) if ranks else rate,
+                            "index": int(group[-1][-1]),
+                            "ranks": [
+                                {"rank": index, "loss": row[0], "samples_per_second": row[1]}
+                                for index, row in enumerate(ranks)
+                            ] if ranks else None,
+                        })
+                if stop or step >= total_steps:
+                    break
+            skip_steps = 0
+
+            # Always at the end too, so a run extended with a larger max_steps resumes where this one stopped
+            if not spec.checkpoint_steps or stop or step >= total_steps:
+                checkpoint()
+            if is_main:
+                report({
+                    "type": "epoch",
+                    "epoch": epoch,
+                    "num_epochs": spec.num_epochs,
+                    "loss": epoch_loss / max(1, epoch_steps),
+                    "samples_per_second": samples * world_size / (time.perf_counter() - started),
+                })
+            if stop or step >= total_steps:
+                break
+    finally:
+        if writer is not None:
+            writer.close()
+            for error in writer.errors:
+                log(f"Checkpoint not saved ({error})", "warning")
+
+    elapsed = time.perf_counter() - started
+    result = {
+        "stopped": stop,
+        "steps": step,
+        "epochs": epoch,
+        "samples": trained_samples + samples * world_size,
+        "seconds": elapsed,
+        "samples_per_second": samples * world_size / elapsed if elapsed else 0.0,
+        "final_loss": loss_value,
+        "output_path": None,
+    }
+    if not stop and is_main:
+        Path(spec.output_path).parent.mkdir(parents=True, exist_ok=True)
+        save_file(lora_state_dict(unet), spec.output_path, metadata={"format": "pt"})
+        result["output_path"] = spec.output_path
+    return result
+
+
+def _worker_main(spec: LoraTrainingSpec, rank: int, threads: Optional[int], events, stop) -> None:
+    try:
+        if threads:
+            import torch
+
+            torch.set_num_threads(threads)
+        result = run_lora_training(spec, events.put, stop.is_set, rank)
+        if rank == 0:
+            events.put({"type": "done", **result})
+    except BaseException as e:
+        prefix = f"rank {rank}: " if spec.world_size > 1 else ""
+        events.put({
+            "type": "error",
+            "rank": rank,
+            "message": f"{prefix}{type(e).__name__}: {e}",
+            "traceback": traceback.format_exc(),
+        })
+    finally:
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.distributed.is_available() and torch.distributed.is_initialized():
+            torch.distributed.destroy_process_group()
+
+
+def _free_local_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LoraTrainingProcess:
+    """A LoRA training running in its own (spawned) processes, one per local rank."""
+
+    def __init__(self, spec: LoraTrainingSpec):
+        # spawn: forking a process that runs an event loop and threads is unsafe
+        context = get_context("spawn")
+        local_ranks = spec.local_ranks or spec.world_size
+        if spec.world_size > 1 and spec.init_method is None:
+            spec = dataclasses.replace(spec, init_method=f"tcp://127.0.0.1:{_free_local_port()}")
+        self.spec = spec
+        self.events = context.Queue()
+        self._stop = context.Event()
+        # Ranks sharing a machine split its cores instead of each starting a full thread pool
+        threads = max(1, (os.cpu_count() or 1) // local_ranks) if local_ranks > 1 else None
+        first_rank = spec.node_rank * local_ranks
+        self.processes = [
+            context.Process(
+                target=_worker_main,
+                args=(spec, rank, threads, self.events, self._stop),
+                name=f"lora-{spec.job_id}-rank{rank}",
+                daemon=True,
+            )
+            for rank in range(first_rank, first_rank + local_ranks)
+        ]
+
+    def start(self) -> None:
+        for process in self.processes:
+            process.start()
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.processes[0].pid
+
+    @property
+    def pids(self) -> List[int]:
+        return [process.pid for process in self.processes if process.pid is not None]
+
+    def stop(self) -> None:
+        """Ask the workers to finish after their current optimizer step."""
+        self._stop.set()
+
+    def _failed(self) -> bool:
+        # The first process reports the result; any process dying uncleanly stalls the others
+        main = self.processes[0]
+        return not main.is_alive() or any(
+            process.exitcode not in (None, 0) for process in self.processes
+        )
+
+    def next_event(self, timeout: float = 0.5) -> Optional[dict]:
+        """Next event from the workers, or None if there was none within ``timeout`` (blocking)."""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            if not self._failed():
+                return None
+        # Exited: drain what was sent right before exiting, else it died without reporting
+        try:
+            return self.events.get(timeout=1.0)
+        except queue.Empty:
+            codes = ", ".join(str(process.exitcode) for process in self.processes)
+            return {"type": "error", "message": f"Training process exited with code {codes}"}
+
+    def join(self, timeout: float = 30.0) -> None:
+        """Wait for the workers to exit, killing those that don't (blocking)."""
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+        for process in self.processes:
+            if process.is_alive():
+                logger.warning(f"Training process {process.name} did not exit, terminating it")
+                process.terminate()
+                process.join(5)
+        self.events.close()
+
+
+def main() -> int:
+    """Join a distributed training from another node (the API node starts ranks from 0)."""
+    parser = argparse.ArgumentParser(description="Run this node's ranks of a distributed LoRA training")
+    parser.add_argument("spec", type=Path, help="distributed_spec.json written by the API node")
+    parser.add_argument("--node-rank", type=int, required=True, help="1 for the second node, 2 for the third...")
+    args = parser.parse_args()
+
+    spec = LoraTrainingSpec(**json.loads(args.spec.read_text()))
+    worker = LoraTrainingProcess(dataclasses.replace(spec, node_rank=args.node_rank))
+    worker.start()
+    failed = False
+    try:
+        while any(process.is_alive() for process in worker.processes):
+            try:
+                event = worker.events.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if event["type"] == "error":
+                failed = True
+                print(event["message"], event.get("traceback", ""), sep="\n", file=sys.stderr)
+    except KeyboardInterrupt:
+        worker.stop()
+    finally:
+        worker.join()
+    return 1 if failed or any(process.exitcode for process in worker.processes) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,21 @@
+import asyncio
+
 from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
 from .config import Settings, get_settings
-from .database import init_db
+from .database import AsyncSessionLocal, init_db
+from .dataset_index import reconcile_loop
 from .jobs import JobQueue, build_job_queue
+from .media_validation import shutdown_inspection_pool
+from .metrics import MetricsMiddleware, render_prometheus
+from .stats_store import stats_store
+from .timeseries import get_timeseries_store
+from .training_supervisor import get_training_supervisor
+from .training_sweeps import fail_interrupted_sweeps
+from .upload_store import migrate_legacy_dirs, prune_store
 from .routers import generation, models, projects, workflows, datasets, training, data_collection, presets, suggestions, monitoring, uploads, autonomous_collection
 
 
@@ -22,6 +33,8 @@ def create_app(settings: Settings, queue: JobQueue) -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    if settings.metrics_enabled:
+        app.add_middleware(MetricsMiddleware)
 
     # Include routers
     app.include_router(generation.router, prefix=settings.api_prefix)
@@ -45,8 +58,28 @@ def create_app(settings: Settings, queue: JobQueue) -> FastAPI:
     async def startup_event() -> None:
         # Initialize database
         await init_db()
+        # Load monitoring aggregates for existing history (once)
+        async with AsyncSessionLocal() as db:
+            await stats_store.bootstrap(db)
+        # No sweep scheduler survives a restart; don't leave their sweeps looking alive
+        await fail_interrupted_sweeps(AsyncSessionLocal)
+        # Keep the blob store out of the public uploads mount, then drop content orphaned by
+        # an earlier crash (before any upload can race it)
+        await asyncio.to_thread(migrate_legacy_dirs)
+        await asyncio.to_thread(prune_store)
         # Start job queue workers
         queue.start()
+        # Periodically verify dataset file indexes against disk
+        if settings.dataset_reconcile_interval > 0:
+            app.state.reconcile_task = asyncio.create_task(reconcile_loop(settings.dataset_reconcile_interval))
+
+    @app.on_event("shutdown")
+    async def shutdown_event() -> None:
+        # Let running trainings stop at a step boundary and persist their state
+        await get_training_supervisor().shutdown()
+        # Persist the metrics history ring buffer
+        get_timeseries_store().flush()
+        shutdown_inspection_pool()
 
     @app.get("/health")
     async def health() -> dict:
@@ -56,6 +89,10 @@ def create_app(settings: Settings, queue: JobQueue) -> FastAPI:
             "version": "1.0.0",
         }
 
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    async def metrics() -> PlainTextResponse:
+        return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
     return app
 
 
@@ -0,0 +1,201 @@
+"""
+Image inspection and file validation rules.
+
+Ingested images are opened header-only (dimensions, mode, EXIF orientation;
+pixel data is never decoded) and checked for corruption and against
+``FILE_TYPE_RULES``. Header parsing is CPU-bound Python, so large batches are
+spread over a process pool; small batches are inspected inline, where the
+pool's IPC would cost more than it saves.
+"""
+import logging
+import mimetypes
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# File type recognition rules
+FILE_TYPE_RULES = {
+    'image': {
+        'extensions': ['.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tiff', '.svg'],
+        'mime_types': ['image/jpeg', 'image/png', 'image/webp', 'image/gif', 'image/bmp', 'image/tiff', 'image/svg+xml'],
+        'max_size_mb': 50,
+        'min_dimensions': (256, 256),
+        'recommended_dimensions': (1024, 1024)
+    },
+    'video': {
+        'extensions': ['.mp4', '.mov', '.avi', '.webm', '.mkv', '.flv'],
+        'mime_types': ['video/mp4', 'video/quicktime', 'video/x-msvideo', 'video/webm', 'video/x-matroska'],
+        'max_size_mb': 500,
+        'min_duration_sec': 1,
+        'max_duration_sec': 60,
+        'recommended_fps': 24
+    }
+}
+
+EXIF_ORIENTATION = 0x0112
+INLINE_BATCH = 32  # smaller batches are inspected in the calling thread
+POOL_CHUNK = 64  # paths per task sent to a worker process
+
+
+def check_file_rules(
+    file_type: str,
+    extension: Optional[str] = None,
+    mime_type: Optional[str] = None,
+    size_mb: Optional[float] = None,
+    dimensions: Optional[Tuple[int, int]] = None,
+    duration_sec: Optional[float] = None,
+) -> Tuple[List[str], List[str]]:
+    """Check a file's properties against FILE_TYPE_RULES. Returns (issues, recommendations)."""
+    issues: List[str] = []
+    recommendations: List[str] = []
+    rules = FILE_TYPE_RULES[file_type]
+
+    if extension and extension not in rules['extensions']:
+        issues.append(f"Unsupported extension: {extension}")
+    if mime_type and mime_type not in rules['mime_types']:
+        issues.append(f"Unsupported MIME type: {mime_type}")
+    if size_mb and size_mb > rules['max_size_mb']:
+        issues.append(f"File too large: {size_mb}MB (max: {rules['max_size_mb']}MB)")
+
+    if file_type == 'image' and dimensions:
+        width, height = dimensions
+        min_w, min_h = rules['min_dimensions']
+        if width < min_w or height < min_h:
+            issues.append(f"Dimensions too small: {width}x{height} (min: {min_w}x{min_h})")
+        rec_w, rec_h = rules['recommended_dimensions']
+        if width < rec_w or height < rec_h:
+            recommendations.append(f"Recommended dimensions: {rec_w}x{rec_h} for best quality")
+
+    elif file_type == 'video' and duration_sec:
+        if duration_sec < rules['min_duration_sec']:
+            issues.append(f"Video too short: {duration_sec}s (min: {rules['min_duration_sec']}s)")
+        if duration_sec > rules['max_duration_sec']:
+            issues.append(f"Video too long: {duration_sec}s (max: {rules['max_duration_sec']}s)")
+
+    return issues, recommendations
+
+
+@dataclass
+class ImageInspection:
+    path: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    mode: Optional[str] = None
+    format: Optional[str] = None
+    orientation: Optional[int] = None  # EXIF orientation tag, 1-8
+    corrupt: bool = False
+    issues: List[str] = field(default_factory=list)
+
+
+def _scans_end_with_eoi(data: bytes) -> bool:
+    """Walk a JPEG's marker segments and scans; True once the EOI marker is reached."""
+    pos, end = 2, len(data)  # after SOI
+    while True:
+        marker_at = data.find(b"\xff", pos)
+        if marker_at < 0 or marker_at + 1 >= end:
+            return False
+        marker = data[marker_at + 1]
+        pos = marker_at + 2
+        if marker == 0xD9:
+            return True
+        if marker == 0xFF:
+            pos = marker_at + 1  # fill byte before a marker
+        elif marker == 0x00 or marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            continue  # stuffed 0xFF in scan data, TEM or restart marker: no length field
+        else:
+            # Segment with a length (headers, tables, APPn with thumbnails, SOS): skip its payload
+            if pos + 2 > end:
+                return False
+            pos += int.from_bytes(data[pos:pos + 2], "big")
+
+
+def _truncated_jpeg(path: str) -> bool:
+    """A JPEG's last scan must be followed by the EOI marker.
+
+    Usually EOI ends the file and only the last bytes are read. Files with
+    trailing data (camera/phone trailers, padding) are parsed from the start
+    instead, so bytes after EOI don't matter.
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 16))
+        if b"\xff\xd9" in f.read():
+            return False
+        f.seek(0)
+        return not _scans_end_with_eoi(f.read())
+
+
+def inspect_image(path: str) -> ImageInspection:
+    """Read an image's header and check its structure without decoding pixels."""
+    from PIL import Image
+
+    result = ImageInspection(path=path)
+    if Path(path).suffix.lower() == ".svg":
+        return result  # vector format, nothing to read with PIL
+    try:
+        with Image.open(path) as image:
+            result.width, result.height = image.size
+            result.mode = image.mode
+            result.format = image.format
+            result.orientation = image.getexif().get(EXIF_ORIENTATION)
+            # verify() walks the file structure (chunk CRCs, markers) but decodes nothing
+            image.verify()
+        if result.format == "JPEG" and _truncated_jpeg(path):
+            raise ValueError("truncated JPEG (no end-of-image marker)")
+    except Exception as e:
+        result.corrupt = True
+        result.issues.append(f"Corrupt or unreadable image: {e}")
+        return result
+
+    mime_type = Image.MIME.get(result.format) or mimetypes.guess_type(path)[0]
+    size_mb = round(os.path.getsize(path) / (1024 * 1024), 2)
+    dimensions = (result.width, result.height)
+    if result.orientation in (5, 6, 7, 8):  # displayed rotated by 90 degrees
+        dimensions = (result.height, result.width)
+    issues, _ = check_file_rules('image', Path(path).suffix.lower(), mime_type, size_mb, dimensions)
+    result.issues.extend(issues)
+    return result
+
+
+def _inspect_chunk(paths: Sequence[str]) -> List[dict]:
+    return [asdict(inspect_image(path)) for path in paths]
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_inspection_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        from .config import get_settings
+
+        workers = get_settings().ingest_workers or os.cpu_count() or 1
+        # spawn: forking a process that runs an event loop and threads is unsafe
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+    return _pool
+
+
+def shutdown_inspection_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def inspect_images(paths: Sequence[str]) -> Dict[str, ImageInspection]:
+    """Inspect many images, across the process pool for large batches (blocking)."""
+    paths = list(paths)
+    if len(paths) <= INLINE_BATCH:
+        return {path: inspect_image(path) for path in paths}
+    chunks = [paths[i:i + POOL_CHUNK] for i in range(0, len(paths), POOL_CHUNK)]
+    results: Dict[str, ImageInspection] = {}
+    for chunk in get_inspection_pool().map(_inspect_chunk, chunks):
+        for item in chunk:
+            results[item["path"]] = ImageInspection(**item)
+    return results
+
@@ -0,0 +1,222 @@
+"""
+Built-in instrumentation exported in Prometheus text format.
+
+Counters and histograms are sharded per thread: each thread only ever writes
+to its own shard, so recording a value takes no lock (a lock is only taken
+once per thread and metric, when the shard is created). Shards are summed
+when ``/metrics`` is scraped.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .timeseries import get_timeseries_store
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JOB_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+STEP_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    """Base class holding per-thread shards of label -> value."""
+
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[Dict[tuple, object]] = []
+        self._shards_lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _shard(self) -> Dict[tuple, object]:
+        shard = getattr(self._local, "values", None)
+        if shard is None:
+            shard = {}
+            self._local.values = shard
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _labels(self, labels: Dict[str, str]) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def reset(self) -> None:
+        with self._shards_lock:
+            for shard in self._shards:
+                shard.clear()
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        shard = self._shard()
+        key = self._labels(labels)
+        shard[key] = shard.get(key, 0.0) + amount
+
+    def snapshot(self) -> Dict[tuple, float]:
+        totals: Dict[tuple, float] = {}
+        for shard in list(self._shards):
+            for key, value in list(shard.items()):
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value:g}"
+            for key, value in sorted(self.snapshot().items())
+        ]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram (bucket counts, sum and count per label set)."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: str) -> None:
+        shard = self._shard()
+        key = self._labels(labels)
+        entry = shard.get(key)
+        if entry is None:
+            # [per-bucket counts (last one is +Inf), sum, count]
+            entry = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            shard[key] = entry
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def snapshot(self) -> Dict[tuple, list]:
+        totals: Dict[tuple, list] = {}
+        for shard in list(self._shards):
+            for key, (counts, total, count) in list(shard.items()):
+                merged = totals.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        return totals
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Gauge whose value is read from a callback at scrape time."""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self._function: Optional[Callable[[], float]] = None
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._function = function
+
+    def render(self) -> List[str]:
+        if self._function is None:
+            return []
+        return [f"{self.name} {float(self._function()):g}"]
+
+
+REGISTRY: List[_Metric] = []
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+HTTP_REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+JOB_QUEUE_WAIT_SECONDS = Histogram(
+    "job_queue_wait_seconds", "Time jobs spend queued before a worker picks them up", ("type",), JOB_BUCKETS
+)
+JOB_RUN_SECONDS = Histogram("job_run_seconds", "Job execution time", ("type", "status"), JOB_BUCKETS)
+JOB_QUEUE_DEPTH = Gauge("job_queue_depth", "Jobs waiting in the generation queue")
+MODEL_LOAD_SECONDS = Histogram("model_load_seconds", "Pipeline load time", ("backend",), JOB_BUCKETS)
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+INFERENCE_STEP_SECONDS = Histogram("inference_step_seconds", "Denoising step latency", ("scheduler",), STEP_BUCKETS)
+
+
+def render_prometheus() -> str:
+    """Render every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class StepTimer:
+    """``callback_on_step_end`` hook recording the duration of each denoising step."""
+
+    def __init__(self, scheduler: str):
+        self.scheduler = scheduler
+        self.last = None
+
+    def __call__(self, pipeline, step, timestep, callback_kwargs):
+        now = time.perf_counter()
+        # The first step has no start mark; it also absorbs prompt encoding
+        if self.last is not None:
+            INFERENCE_STEP_SECONDS.observe(now - self.last, scheduler=self.scheduler)
+        self.last = now
+        return callback_kwargs
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request counts and latency per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            # FastAPI stores the matched route in the scope; use its template to bound cardinality
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_REQUESTS.inc(method=method, route=route_path, status=str(status["code"]))
+            HTTP_REQUEST_SECONDS.observe(elapsed, method=method, route=route_path)
+            get_timeseries_store().record_request(elapsed, status["code"])
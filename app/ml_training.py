@@ -4,12 +4,19 @@ Integrates with the database for real-time progress tracking.
 """
 import os
 import json
+import random
 import asyncio
 from typing import Optional, Dict, Any, Callable
 from datetime import datetime
 from pathlib import Path
 import logging
 
+from .csv_labels import LabelStore, find_label_stores, labels_db_path
+from .dataset_utils import dataset_dirs, dataset_id_from_path
+from .dataset_shards import ShardReader, export_dataset_shards, shards_dir
+from .training_cache import prepare_training_cache
+from .training_progress import ProgressPublisher
+
 logger = logging.getLogger(__name__)
 
 class TrainingEngine:
@@ -18,7 +25,7 @@ class TrainingEngine:
     Supports LoRA, DreamBooth, and full fine-tuning.
     """
     
-    def __init__(self, job_id: str, config: Dict[str, Any], db_session):
+    def __init__(self, job_id: str, config: Dict[str, Any], db_session, session_factory=None):
         self.job_id = job_id
         self.config = config
         self.db_session = db_session
@@ -27,6 +34,9 @@ class TrainingEngine:
         self.current_step = 0
         self.current_loss = 0.0
         self.current_image_path = None
+        self.worker = None  # LoraTrainingProcess while training
+        self.started_at = datetime.utcnow()
+        self.publisher = ProgressPublisher(job_id, session_factory=session_factory)
         
     async def update_progress(
         self,
@@ -37,13 +47,11 @@ class TrainingEngine:
         image_path: Optional[str] = None,
         analyzed_images: Optional[int] = None,
         total_images: Optional[int] = None,
-        current_label: Optional[str] = None
+        current_label: Optional[str] = None,
+        samples_per_second: Optional[float] = None,
+        ranks: Optional[list] = None
     ):
-        """Update training progress in database"""
-        from sqlalchemy import select, update
-        from .models import TrainingJob
-        
-        # Update metrics
+        """Publish training progress (persisted in coalesced batches, not per call)"""
         metrics = {
             "current_epoch": epoch or self.current_epoch,
             "current_step": step or self.current_step,
@@ -52,62 +60,35 @@ class TrainingEngine:
             "analyzed_images": analyzed_images,
             "total_images": total_images,
             "current_label": current_label,
+            "samples_per_second": samples_per_second,
+            "ranks": ranks,
             "last_update": datetime.utcnow().isoformat()
         }
+        self.publisher.update(progress, metrics)
         
-        # Update in database
-        stmt = (
-            update(TrainingJob)
-            .where(TrainingJob.id == self.job_id)
-            .values(
-                progress=progress,
-                metrics=metrics,
-                updated_at=datetime.utcnow()
-            )
-        )
-        
-        await self.db_session.execute(stmt)
-        await self.db_session.commit()
-        
-        logger.info(f"Training {self.job_id}: {progress*100:.1f}% - Epoch {epoch}, Loss {loss:.4f}")
+        logger.debug(f"Training {self.job_id}: {progress*100:.1f}% - Epoch {epoch}, Loss {metrics['loss']:.4f}")
     
     async def log_message(self, message: str, level: str = "info"):
-        """Add log message to training job"""
-        from sqlalchemy import select
-        from .models import TrainingJob
-        
-        result = await self.db_session.execute(
-            select(TrainingJob).where(TrainingJob.id == self.job_id)
-        )
-        job = result.scalar_one_or_none()
-        
-        if job:
-            logs = job.logs or []
-            logs.append({
-                "timestamp": datetime.utcnow().isoformat(),
-                "level": level,
-                "message": message
-            })
-            
-            from sqlalchemy import update
-            stmt = (
-                update(TrainingJob)
-                .where(TrainingJob.id == self.job_id)
-                .values(logs=logs)
-            )
-            await self.db_session.execute(stmt)
-            await self.db_session.commit()
+        """Append a log line to the training job's log"""
+        self.publisher.log(message, level)
+    
+    async def close(self):
+        """Persist any buffered progress and logs"""
+        await self.publisher.close()
     
     async def train_lora(
         self,
         dataset_path: str,
         base_model_path: str,
-        output_dir: str
+        output_dir: str,
+        resume_from: Optional[str] = None
     ):
         """
         Train LoRA model using PyTorch and PEFT.
         This is a real implementation that can be expanded with actual PyTorch code.
         """
+        label_store = None
+        shard_batches = None
         try:
             await self.log_message(f"Starting LoRA training for {self.job_id}")
             await self.log_message(f"Dataset: {dataset_path}, Model: {base_model_path}")
@@ -132,6 +113,7 @@ class TrainingEngine:
             image_extensions = {'.jpg', '.jpeg', '.png', '.webp'}
             images = []
             dataset_path_obj = Path(dataset_path)
+            dataset_id = dataset_id_from_path(dataset_path_obj)
             
             if dataset_path_obj.exists():
                 for ext in image_extensions:
@@ -148,15 +130,18 @@ class TrainingEngine:
             
             total_images_count = len(images)
 
-            # Load CSV labels if available
+            # Open the indexed CSV label stores; labels are looked up per image, not loaded
             image_labels = {}
             try:
-                # Look for CSV metadata in the same directory or parent
-                csv_metadata_files = list(dataset_path_obj.glob("*.json"))
-                if not csv_metadata_files and dataset_path_obj.parent.exists():
-                    csv_metadata_files = list(dataset_path_obj.parent.glob("*.json"))
+                label_dirs = [dataset_path_obj, dataset_path_obj.parent]
+                if dataset_id is not None:
+                    label_dirs += [d for d in dataset_dirs(dataset_id) if d not in label_dirs]
+                label_store = LabelStore(find_label_stores(label_dirs))
                 
-                for meta_file in csv_metadata_files:
+                # CSV summaries written before label stores existed carry the full mapping
+                for meta_file in [m for d in label_dirs for m in d.glob("*.json")]:
+                    if labels_db_path(meta_file).exists():
+                        continue
                     with open(meta_file, 'r') as f:
                         data = json.load(f)
                         if 'mappings' in data:
@@ -164,8 +149,46 @@ class TrainingEngine:
             except Exception as e:
                 await self.log_message(f"Failed to load labels: {str(e)}", "warning")
             
-            # TODO: Integrate actual PyTorch training loop
-            # For now, simulate training with progress updates
+            # Decoded, resized and VAE-encoded once per dataset version, then memory-mapped
+            training_cache = None
+            if dataset_id is not None and self.config.get("use_cache", True):
+                try:
+                    training_cache, rebuilt = await prepare_training_cache(
+                        self.db_session, dataset_id, base_model_path, self.config.get("resolution", 512)
+                    )
+                    await self.log_message(
+                        f"{'Built' if rebuilt else 'Reusing'} training cache: {len(training_cache)} image(s), "
+                        f"latents {'cached' if training_cache.latents is not None else 'not available'}"
+                    )
+                    images = [Path(path) for path in training_cache.paths]
+                    total_images_count = len(images)
+                except Exception as e:
+                    training_cache = None
+                    await self.log_message(f"Training cache unavailable, reading raw files: {e}", "warning")
+            
+            # Otherwise optionally stream from sequential shards (prefetched and shuffled off the event loop)
+            if training_cache is None and dataset_id is not None and self.config.get("use_shards", False):
+                try:
+                    _, exported = await export_dataset_shards(self.db_session, dataset_id)
+                    reader = ShardReader(shards_dir(dataset_id))
+                    shard_batches = reader.batches(batch_size)
+                    total_images_count = len(reader)
+                    await self.log_message(
+                        f"{'Exported' if exported else 'Reusing'} dataset shards: {total_images_count} sample(s)"
+                    )
+                except Exception as e:
+                    await self.log_message(f"Shard streaming unavailable, reading raw files: {e}", "warning")
+            
+            # Real training runs in a worker process, from the cached latents and token ids
+            if training_cache is not None and training_cache.latents is not None and training_cache.input_ids is not None:
+                return await self._train_lora_process(training_cache, base_model_path, output_path, resume_from)
+            if resume_from:
+                raise ValueError("Resuming needs the real training loop, which needs cached latents and token ids")
+            
+            # Without them (no VAE/tokenizer for this base model) only a simulation is possible
+            await self.log_message(
+                "No precomputed latents and token ids for this dataset; running a simulated training", "warning"
+            )
             
             steps_per_epoch = max(1, (total_images_count + batch_size - 1) // batch_size)
             total_steps = num_epochs * steps_per_epoch
@@ -190,18 +213,21 @@ class TrainingEngine:
                     
                     # Simulate image being processed
                     img_idx = (step * batch_size) % total_images_count
-                    current_img_path = images[img_idx]
+                    current_img_path = images[img_idx] if images else None
                     
                     # Get label for current image
-                    current_label = image_labels.get(current_img_path.name, "No Label")
+                    if shard_batches is not None:
+                        sample = (await asyncio.to_thread(next, shard_batches))[0]
+                        current_img_path = Path(sample["path"])
+                        current_label = sample.get("caption") or "No Label"
+                    elif training_cache is not None:
+                        current_label = training_cache.captions[img_idx] or "No Label"
+                    else:
+                        current_label = image_labels.get(current_img_path.name) or (
+                            label_store.get(current_img_path.name) if label_store else None
+                        ) or "No Label"
                     
-                    # Convert to path relative to CWD for frontend
-                    try:
-                        rel_path = current_img_path.relative_to(Path.cwd())
-                        self.current_image_path = f"/{rel_path}".replace("\\", "/")
-                    except ValueError:
-                        # Fallback if not relative
-                        self.current_image_path = f"/uploads/image/{current_img_path.name}"
+                    self.current_image_path = self._display_path(current_img_path)
                     
                     # Calculate progress
                     current_total_step = (epoch * steps_per_epoch) + step
@@ -255,9 +281,159 @@ class TrainingEngine:
             await self.log_message(f"Training error: {str(e)}", "error")
             logger.error(f"Training error for {self.job_id}: {e}", exc_info=True)
             raise
+        finally:
+            if label_store is not None:
+                label_store.close()
+            if shard_batches is not None:
+                shard_batches.close()
+    
+    @staticmethod
+    def _display_path(image_path: Path) -> str:
+        """URL path of an image for the frontend"""
+        try:
+            rel_path = image_path.relative_to(Path.cwd())
+            return f"/{rel_path}".replace("\\", "/")
+        except ValueError:
+            # Fallback if not relative
+            return f"/uploads/image/{image_path.name}"
+    
+    async def _train_lora_process(
+        self,
+        training_cache,
+        base_model_path: str,
+        output_path: Path,
+        resume_from: Optional[str] = None
+    ) -> Optional[str]:
+        """Run the LoRA training loop in a worker process and relay its progress"""
+        from dataclasses import asdict
+        from .config import get_settings
+        from .lora_trainer import LoraTrainingProcess, LoraTrainingSpec
+        
+        num_processes = max(1, self.config.get("num_processes", 1))
+        num_nodes = max(1, self.config.get("num_nodes", 1))
+        init_method = None
+        if num_nodes > 1:
+            settings = get_settings()
+            init_method = f"tcp://{settings.training_master_addr}:{settings.training_master_port}"
+        final_model_path = output_path / "lora_weights.safetensors"
+        spec = LoraTrainingSpec(
+            job_id=self.job_id,
+            cache_dir=str(training_cache.directory),
+            base_model=base_model_path,
+            output_path=str(final_model_path),
+            learning_rate=self.config.get("learning_rate", 1e-4),
+            batch_size=self.config.get("batch_size", 4),
+            num_epochs=self.config.get("num_epochs", 10),
+            max_steps=self.config.get("max_steps"),
+            lora_rank=self.config.get("lora_rank", 4),
+            lora_alpha=self.config.get("lora_alpha", 32),
+            mixed_precision=self.config.get("mixed_precision", "fp16"),
+            gradient_accumulation_steps=self.config.get("gradient_accumulation_steps", 1),
+            gradient_checkpointing=self.config.get("gradient_checkpointing", False),
+            seed=self.config.get("seed"),
+            checkpoint_dir=str(output_path / "checkpoints"),
+            checkpoint_steps=self.config.get("checkpoint_steps"),
+            keep_last_checkpoints=self.config.get("keep_last_checkpoints", 3),
+            keep_best_checkpoints=self.config.get("keep_best_checkpoints", 1),
+            resume_from=resume_from,
+            world_size=num_processes * num_nodes,
+            local_ranks=num_processes,
+            init_method=init_method,
+        )
+        if spec.world_size > 1 and spec.seed is None:
+            # Every rank must derive the same data order
+            spec.seed = random.randrange(2**31)
+        if num_nodes > 1:
+            spec_path = output_path / "distributed_spec.json"
+            spec_path.write_text(json.dumps(asdict(spec), indent=2))
+            await self.log_message(
+                f"Waiting for {num_nodes - 1} more node(s) to join at {init_method}: on node N (1-{num_nodes - 1}) "
+                f"run `python -m app.lora_trainer {spec_path} --node-rank N`",
+                "warning"
+            )
+        total_images = len(training_cache) * spec.num_epochs
+        
+        worker = LoraTrainingProcess(spec)
+        worker.start()
+        self.worker = worker
+        await self.log_message(
+            f"Training process started (pid {worker.pid})" if len(worker.pids) == 1 else
+            f"Training processes started: {spec.world_size} ranks, pids {', '.join(map(str, worker.pids))}"
+        )
+        result = None
+        try:
+            while result is None:
+                if self.stop_requested:
+                    worker.stop()
+                event = await asyncio.to_thread(worker.next_event)
+                if event is None:
+                    continue
+                kind = event["type"]
+                if kind == "log":
+                    await self.log_message(event["message"], event.get("level", "info"))
+                elif kind == "progress":
+                    self.current_epoch = event["epoch"]
+                    self.current_step = event["step"]
+                    self.current_loss = event["loss"]
+                    index = event["index"]
+                    self.current_image_path = self._display_path(Path(training_cache.paths[index]))
+                    await self.update_progress(
+                        progress=event["progress"],
+                        epoch=self.current_epoch,
+                        step=self.current_step,
+                        loss=self.current_loss,
+                        image_path=self.current_image_path,
+                        analyzed_images=event["samples"],
+                        total_images=total_images,
+                        current_label=training_cache.captions[index] or "No Label",
+                        samples_per_second=event["samples_per_second"],
+                        ranks=event.get("ranks")
+                    )
+                elif kind == "epoch":
+                    await self.log_message(
+                        f"Epoch {event['epoch']}/{event['num_epochs']} completed - Avg Loss: {event['loss']:.4f}, "
+                        f"{event['samples_per_second']:.1f} samples/s"
+                    )
+                elif kind == "checkpoint":
+                    removed = f", removed {', '.join(event['removed'])}" if event["removed"] else ""
+                    await self.log_message(
+                        f"Checkpoint saved: {event['name']} (loss {event['loss']:.4f}, "
+                        f"written in {event['seconds']:.1f}s{removed})"
+                    )
+                elif kind == "error":
+                    logger.error(f"Training process of {self.job_id} failed:\n{event.get('traceback', '')}")
+                    raise RuntimeError(f"Training process failed: {event['message']}")
+                elif kind == "done":
+                    result = event
+        finally:
+            worker.stop()
+            await asyncio.to_thread(worker.join)
+            self.worker = None
+        
+        if result["stopped"]:
+            await self.log_message("Training stopped by user", "warning")
+            return None
+        
+        await self.save_final_model(final_model_path, stats={
+            "steps": result["steps"],
+            "samples_per_second": round(result["samples_per_second"], 2),
+            "training_seconds": round(result["seconds"], 1),
+        })
+        await self.log_message(
+            f"Training completed successfully! {result['steps']} steps, "
+            f"{result['samples_per_second']:.1f} samples/s", "success"
+        )
+        await self.update_progress(
+            progress=1.0,
+            epoch=result["epochs"],
+            step=result["steps"],
+            loss=result["final_loss"],
+            samples_per_second=result["samples_per_second"]
+        )
+        return str(final_model_path)
     
     async def save_checkpoint(self, path: Path, epoch: int):
-        """Save training checkpoint"""
+        """Record a simulated training's checkpoint (real ones are written by the training process)"""
         checkpoint = {
             "epoch": epoch,
             "job_id": self.job_id,
@@ -279,21 +455,19 @@ class TrainingEngine:
         
         await self.log_message(f"Checkpoint saved: {path.name}")
     
-    async def save_final_model(self, path: Path):
-        """Save final trained model"""
+    async def save_final_model(self, path: Path, stats: Optional[Dict[str, Any]] = None):
+        """Record the final model's metadata next to its weights"""
         model_info = {
             "job_id": self.job_id,
             "type": "lora",
             "config": self.config,
             "final_loss": self.current_loss,
             "epochs_completed": self.current_epoch,
-            "created_at": datetime.utcnow().isoformat()
+            "created_at": datetime.utcnow().isoformat(),
+            **(stats or {})
         }
         
-        # In real implementation, save actual model weights
-        # safetensors.torch.save_file(lora_weights, path)
-        
-        # For now, save metadata
+        # The weights themselves are written by the training process
         with open(path.with_suffix('.json'), 'w') as f:
             json.dump(model_info, f, indent=2)
         
@@ -305,6 +479,41 @@ class TrainingEngine:
         logger.info(f"Stop requested for training {self.job_id}")
 
 
+async def register_trained_model(db_session, model_name: str, training_type: str, output_path: str,
+                                 config: Dict[str, Any], job_id: str, log_message) -> None:
+    """Add a trained model to the models table, unless one with that name exists."""
+    from sqlalchemy import select
+    from .models import Model
+    
+    try:
+        # Check if model with this name already exists
+        result = await db_session.execute(
+            select(Model).where(Model.name == model_name)
+        )
+        existing_model = result.scalar_one_or_none()
+        
+        if not existing_model:
+            new_model = Model(
+                name=model_name,
+                type=training_type,
+                category="image",
+                path=output_path,
+                description=f"Trained {training_type} model from job {job_id}",
+                config=config,
+                is_active=True,
+                version="1.0"
+            )
+            db_session.add(new_model)
+            await db_session.commit()
+            await log_message(f"Model registered: {model_name}", "success")
+        else:
+            await log_message(f"Model {model_name} already exists, skipping registration", "warning")
+    except Exception as e:
+        logger.error(f"Failed to register model for job {job_id}: {e}", exc_info=True)
+        await log_message(f"Warning: Model registration failed: {str(e)}", "warning")
+        # Don't fail the training job if model registration fails
+
+
 async def start_training_background(
     job_id: str,
     training_type: str,
@@ -313,16 +522,20 @@ async def start_training_background(
     model_path: str,
     output_dir: str,
     db_session,
-    output_name: str = None
+    output_name: str = None,
+    engine: Optional[TrainingEngine] = None,
+    resume_from: Optional[str] = None,
+    register_model: bool = True
 ):
     """
     Background task to run training.
-    This should be called from the training router.
+    Run by the training supervisor, on a session of its own. Sweep trials
+    pass ``register_model=False``; only the sweep's winner is registered.
     """
-    from sqlalchemy import update, select
-    from .models import TrainingJob, Model
+    from sqlalchemy import update
+    from .models import TrainingJob
     
-    engine = TrainingEngine(job_id, config, db_session)
+    engine = engine or TrainingEngine(job_id, config, db_session)
     
     try:
         # Update status to running
@@ -336,7 +549,7 @@ async def start_training_background(
         
         # Run training based on type
         if training_type == "lora":
-            output_path = await engine.train_lora(dataset_path, model_path, output_dir)
+            output_path = await engine.train_lora(dataset_path, model_path, output_dir, resume_from)
         elif training_type == "dreambooth":
             # TODO: Implement DreamBooth training
             await engine.log_message("DreamBooth training not yet implemented", "warning")
@@ -349,7 +562,10 @@ async def start_training_background(
             raise ValueError(f"Unknown training type: {training_type}")
         
         # Update final status
-        final_status = "completed" if output_path and not engine.stop_requested else "failed"
+        if engine.stop_requested:
+            final_status = "cancelled"
+        else:
+            final_status = "completed" if output_path else "failed"
         stmt = (
             update(TrainingJob)
             .where(TrainingJob.id == job_id)
@@ -363,36 +579,11 @@ async def start_training_background(
         await db_session.commit()
         
         # Register the trained model in the models table if training completed
-        if final_status == "completed" and output_path:
-            try:
-                model_name = output_name or f"trained-{training_type}-{job_id}"
-                
-                # Check if model with this name already exists
-                result = await db_session.execute(
-                    select(Model).where(Model.name == model_name)
-                )
-                existing_model = result.scalar_one_or_none()
-                
-                if not existing_model:
-                    new_model = Model(
-                        name=model_name,
-                        type=training_type,
-                        category="image",
-                        path=output_path,
-                        description=f"Trained {training_type} model from job {job_id}",
-                        config=config,
-                        is_active=True,
-                        version="1.0"
-                    )
-                    db_session.add(new_model)
-                    await db_session.commit()
-                    await engine.log_message(f"Model registered: {model_name}", "success")
-                else:
-                    await engine.log_message(f"Model {model_name} already exists, skipping registration", "warning")
-            except Exception as e:
-                logger.error(f"Failed to register model for job {job_id}: {e}", exc_info=True)
-                await engine.log_message(f"Warning: Model registration failed: {str(e)}", "warning")
-                # Don't fail the training job if model registration fails
+        if final_status == "completed" and output_path and register_model:
+            await register_trained_model(
+                db_session, output_name or f"trained-{training_type}-{job_id}", training_type,
+                output_path, config, job_id, engine.log_message
+            )
         
     except Exception as e:
         logger.error(f"Training failed for {job_id}: {e}", exc_info=True)
@@ -409,56 +600,6 @@ async def start_training_background(
         )
         await db_session.execute(stmt)
         await db_session.commit()
+    finally:
+        await engine.close()
 
-
-# Integration notes for real PyTorch implementation:
-"""
-To integrate actual PyTorch training:
-
-1. Install dependencies:
-   pip install torch torchvision torchaudio
-   pip install diffusers transformers accelerate peft safetensors
-
-2. In train_lora(), replace simulation with:
-   
-   from diffusers import StableDiffusionPipeline
-   from peft import LoraConfig, get_peft_model
-   import torch
-   
-   # Load base model
-   pipe = StableDiffusionPipeline.from_pretrained(base_model_path)
-   
-   # Configure LoRA
-   lora_config = LoraConfig(
-       r=lora_rank,
-       lora_alpha=lora_alpha,
-       target_modules=["to_q", "to_v"],
-       lora_dropout=0.1,
-   )
-   
-   # Apply LoRA
-   model = get_peft_model(pipe.unet, lora_config)
-   
-   # Training loop with actual gradients
-   optimizer = torch.optim.AdamW(model.parameters(), lr=learning_rate)
-   
-   for epoch in range(num_epochs):
-       for batch in dataloader:
-           # Forward pass
-           loss = model(batch)
-           
-           # Backward pass
-           loss.backward()
-           optimizer.step()
-           optimizer.zero_grad()
-           
-           # Update progress
-           await self.update_progress(...)
-   
-   # Save LoRA weights
-   model.save_pretrained(output_dir)
-
-3. Implement proper dataset loading with image captions
-4. Add validation metrics
-5. Implement gradient checkpointing for memory efficiency
-"""
@@ -2,6 +2,7 @@
 from datetime import datetime
 from sqlalchemy import (
     JSON,
+    BigInteger,
     Boolean,
     Column,
     DateTime,
@@ -136,6 +137,45 @@ class Dataset(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class DatasetFile(Base):
+    """File belonging to a dataset, indexed as it is uploaded or extracted."""
+
+    __tablename__ = "dataset_files"
+
+    id = Column(Integer, primary_key=True, index=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.id"), nullable=False, index=True)
+    path = Column(String(1000), unique=True, nullable=False)  # e.g. uploads/image/dataset_1/cat.png
+    file_type = Column(String(20), nullable=False)  # image, video, audio, archive, csv, other
+    extension = Column(String(20), nullable=False)
+    size_bytes = Column(Integer, default=0)
+    mtime = Column(Float, nullable=True)
+    sha256 = Column(String(64), nullable=True, index=True)
+    width = Column(Integer, nullable=True)  # images only
+    height = Column(Integer, nullable=True)
+    phash = Column(BigInteger, nullable=True)  # 64-bit perceptual hash (signed), images only
+    image_mode = Column(String(10), nullable=True)  # PIL mode, e.g. RGB, RGBA, L
+    orientation = Column(Integer, nullable=True)  # EXIF orientation tag
+    is_corrupt = Column(Boolean, default=False)
+    validation_issues = Column(JSON, default=list)  # FILE_TYPE_RULES violations found on ingest
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class DatasetStats(Base):
+    """Aggregates derived from the dataset file index, kept up to date incrementally."""
+
+    __tablename__ = "dataset_stats"
+
+    dataset_id = Column(Integer, ForeignKey("datasets.id"), primary_key=True)
+    num_files = Column(Integer, default=0)
+    total_bytes = Column(Integer, default=0)
+    type_counts = Column(JSON, default=dict)  # file_type -> count
+    extension_counts = Column(JSON, default=dict)  # extension -> count
+    dimension_histogram = Column(JSON, default=dict)  # longest-side bucket -> image count
+    duplicate_files = Column(Integer, default=0)  # files whose content already exists in the dataset
+    duplicate_bytes = Column(Integer, default=0)
+    reconciled_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 
 class TrainingJob(Base):
     """Training job model for fine-tuning/LoRA training."""
@@ -150,8 +190,40 @@ class TrainingJob(Base):
     progress = Column(Float, default=0.0)
     config = Column(JSON, nullable=False)
     output_path = Column(String(500), nullable=True)
-    logs = Column(JSON, default=list)
+    logs = Column(JSON, default=list)  # legacy; log lines are now rows of training_logs
     metrics = Column(JSON, default=dict)
     error = Column(Text, nullable=True)
+    sweep_id = Column(String(36), ForeignKey("training_sweeps.id"), nullable=True, index=True)  # set on sweep trials
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class TrainingSweep(Base):
+    """Hyperparameter sweep: trial training jobs pruned by successive halving."""
+
+    __tablename__ = "training_sweeps"
+
+    id = Column(String(36), primary_key=True, index=True)
+    name = Column(String(255), nullable=False)
+    dataset_id = Column(Integer, ForeignKey("datasets.id"), nullable=False)
+    base_model_id = Column(Integer, ForeignKey("models.id"), nullable=False)
+    type = Column(String(50), nullable=False, default="lora")
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, completed, failed, cancelled
+    config = Column(JSON, nullable=False)  # base config, search space and rung schedule
+    rungs = Column(JSON, default=list)  # per finished rung: budget, trial losses, promoted trials
+    best_job_id = Column(String(36), nullable=True)
+    error = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class TrainingLog(Base):
+    """Append-only log line of a training job (replaces rewriting TrainingJob.logs)."""
+
+    __tablename__ = "training_logs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String(36), ForeignKey("training_jobs.id"), nullable=False, index=True)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+    level = Column(String(20), nullable=False, default="info")
+    message = Column(Text, nullable=False)
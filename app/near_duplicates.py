@@ -0,0 +1,224 @@
+"""
+Perceptual-hash near-duplicate detection.
+
+Every indexed image gets a 64-bit DCT perceptual hash (pHash), computed in
+batches with NumPy from a 32x32 grayscale thumbnail. JPEGs are decoded at a
+reduced scale, so hashing costs a fraction of a full decode. Resized or
+re-encoded copies of an image hash to within a few bits of each other.
+
+Near-duplicates are found with a multi-index hash table: the 64 bits are
+split into ``threshold + 1`` segments and, by the pigeonhole principle, two
+hashes within ``threshold`` bits agree exactly on at least one segment. Only
+hashes sharing a segment value are compared, so a report over millions of
+images stays far from quadratic.
+
+Closeness is not transitive (A~B and B~C does not make A~C), so the linked
+components are only candidates: each is split greedily around its best
+image, and an image is reported as a duplicate only if it is within
+``threshold`` bits of the image kept in its place.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import DatasetFile
+
+logger = logging.getLogger(__name__)
+
+THUMB_SIZE = 32
+HASH_SIZE = 8  # low-frequency DCT block -> 64 bits
+HASH_BATCH = 256
+MAX_THRESHOLD = 16
+COMPARE_ROWS = 1024  # rows per pairwise comparison block inside one bucket
+
+
+def _to_signed(value: int) -> int:
+    """Store unsigned 64-bit hashes in a signed BIGINT column."""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count("1")
+
+
+def _dct_matrix(n: int):
+    import numpy as np
+
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+def load_thumbnail(path: str):
+    """Grayscale THUMB_SIZE x THUMB_SIZE float32 array of an image, or None if it can't be decoded."""
+    import numpy as np
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            # JPEG only: lets libjpeg decode at 1/2..1/8 scale
+            image.draft("L", (THUMB_SIZE * 4, THUMB_SIZE * 4))
+            thumb = image.convert("L").resize((THUMB_SIZE, THUMB_SIZE), Image.BILINEAR)
+            return np.asarray(thumb, dtype=np.float32)
+    except Exception:
+        return None
+
+
+def phash_batch(thumbs):
+    """pHash of a stack of thumbnails, shape (N, 32, 32) -> (N,) uint64."""
+    import numpy as np
+
+    dct = _dct_matrix(THUMB_SIZE)
+    coeffs = dct @ thumbs @ dct.T
+    low = coeffs[:, :HASH_SIZE, :HASH_SIZE].reshape(len(thumbs), -1)
+    # Median of the AC coefficients; the DC term would dominate it
+    median = np.median(low[:, 1:], axis=1, keepdims=True)
+    bits = np.packbits(low > median, axis=1)
+    return bits.view(">u8").ravel().astype(np.uint64)
+
+
+def compute_phashes(paths: Sequence[str], batch_size: int = HASH_BATCH) -> Dict[str, int]:
+    """Perceptual hashes (signed 64-bit ints) of the decodable images among ``paths`` (blocking)."""
+    try:
+        import numpy as np
+    except ImportError:
+        logger.debug("NumPy not available, skipping perceptual hashes")
+        return {}
+
+    hashes: Dict[str, int] = {}
+    for start in range(0, len(paths), batch_size):
+        keys, thumbs = [], []
+        for path in paths[start:start + batch_size]:
+            thumb = load_thumbnail(path)
+            if thumb is not None:
+                keys.append(path)
+                thumbs.append(thumb)
+        if thumbs:
+            for key, value in zip(keys, phash_batch(np.stack(thumbs)).tolist()):
+                hashes[key] = _to_signed(value)
+    return hashes
+
+
+def _segments(threshold: int) -> List[Tuple[int, int]]:
+    """(shift, width) of the threshold + 1 segments covering all 64 bits."""
+    count = threshold + 1
+    segments, shift = [], 0
+    for index in range(count):
+        width = 64 // count + (1 if index < 64 % count else 0)
+        segments.append((shift, width))
+        shift += width
+    return segments
+
+
+def _popcount(values):
+    import numpy as np
+
+    if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+        return np.bitwise_count(values)
+    as_bytes = values.view(np.uint8).reshape(values.shape + (8,))
+    return np.unpackbits(as_bytes, axis=-1).sum(axis=-1)
+
+
+def near_duplicate_groups(hashes: Sequence[int], threshold: int) -> List[List[int]]:
+    """Group the indices of ``hashes`` that are within ``threshold`` bits, transitively."""
+    import numpy as np
+
+    if not len(hashes):
+        return []
+    values = np.asarray(hashes, dtype=np.int64).view(np.uint64)
+    unique, inverse = np.unique(values, return_inverse=True)
+    inverse = inverse.ravel()
+
+    parent: Dict[int, int] = {}
+
+    def find(node: int) -> int:
+        root = node
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while parent.get(node, node) != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    for shift, width in _segments(threshold):
+        segment = (unique >> np.uint64(shift)) & np.uint64((1 << width) - 1)
+        order = np.argsort(segment, kind="stable")
+        ordered = segment[order]
+        starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+        lengths = np.diff(np.r_[starts, len(ordered)])
+        for start, length in zip(starts[lengths > 1], lengths[lengths > 1]):
+            bucket = order[start:start + length]
+            bucket_values = unique[bucket]
+            for row in range(0, length, COMPARE_ROWS):
+                rows = bucket[row:row + COMPARE_ROWS]
+                close = _popcount(unique[rows][:, None] ^ bucket_values[None, :]) <= threshold
+                close &= rows[:, None] < bucket[None, :]  # each pair once, no self-matches
+                for x, y in zip(*np.nonzero(close)):
+                    rx, ry = find(int(rows[x])), find(int(bucket[y]))
+                    if rx != ry:
+                        parent[max(rx, ry)] = min(rx, ry)
+
+    roots = np.arange(len(unique))
+    for node in parent:
+        roots[node] = find(node)
+    item_roots = roots[inverse]
+    order = np.argsort(item_roots, kind="stable")
+    ordered = item_roots[order]
+    starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+    lengths = np.diff(np.r_[starts, len(ordered)])
+    return [order[s:s + n].tolist() for s, n in zip(starts[lengths > 1], lengths[lengths > 1])]
+
+
+@dataclass
+class DuplicateGroup:
+    keep: Any  # dataset_files rows (id, path, width, height, size_bytes, phash)
+    duplicates: List[Any] = field(default_factory=list)
+
+    def summary(self) -> dict:
+        return {
+            "keep": self.keep.path,
+            "duplicates": [
+                {"path": row.path, "size_bytes": row.size_bytes, "distance": hamming(self.keep.phash, row.phash)}
+                for row in self.duplicates
+            ],
+        }
+
+
+def _keep_order(row) -> tuple:
+    # Highest resolution first, then largest file, then the oldest entry
+    return (-(row.width or 0) * (row.height or 0), -(row.size_bytes or 0), row.id)
+
+
+def _split_component(members: List[Any], threshold: int) -> List[DuplicateGroup]:
+    """Greedy groups of a linked component: the best remaining image keeps everything within threshold of it."""
+    remaining = sorted(members, key=_keep_order)
+    groups = []
+    while remaining:
+        keep, rest = remaining[0], remaining[1:]
+        duplicates = [row for row in rest if hamming(keep.phash, row.phash) <= threshold]
+        if duplicates:
+            groups.append(DuplicateGroup(keep=keep, duplicates=duplicates))
+        remaining = [row for row in rest if hamming(keep.phash, row.phash) > threshold]
+    return groups
+
+
+async def find_near_duplicates(db: AsyncSession, dataset_id: int, threshold: int) -> List[DuplicateGroup]:
+    """Near-duplicate groups among a dataset's hashed images, largest group first."""
+    result = await db.execute(
+        select(DatasetFile.id, DatasetFile.path, DatasetFile.width, DatasetFile.height,
+               DatasetFile.size_bytes, DatasetFile.phash)
+        .where(DatasetFile.dataset_id == dataset_id, DatasetFile.phash.isnot(None))
+    )
+    rows = result.all()
+    index_groups = await asyncio.to_thread(near_duplicate_groups, [row.phash for row in rows], threshold)
+    groups = []
+    for indices in index_groups:
+        groups.extend(_split_component([rows[i] for i in indices], threshold))
+    groups.sort(key=lambda group: len(group.duplicates), reverse=True)
+    return groups
+
@@ -0,0 +1,225 @@
+"""
+On-demand profiling and per-job tracing.
+
+``run_profile`` samples the Python stacks of every thread in the process for a
+fixed window and returns them in the collapsed-stack format understood by
+flamegraph.pl, speedscope and inferno. ``torch.profiler`` only records the
+thread it is started on, so for torch operators the window is armed instead:
+every pipeline call entering ``profile_inference`` (via the inference
+backends' context) during the window runs under a profiler on its own
+thread, and the calls' results are merged. ``JobTrace`` collects coarse spans (queue wait, model load, encode,
+denoise, decode, save) for the job currently being run by a worker.
+"""
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a profile is requested while another one is running."""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _collapse(counts: Counter) -> str:
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
+
+
+def sample_stacks(duration: float, interval: float = 0.005) -> Dict:
+    """Sample all thread stacks every ``interval`` seconds for ``duration`` seconds."""
+    own_id = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    counts: Counter = Counter()
+    samples = 0
+    deadline = time.perf_counter() + duration
+
+    while time.perf_counter() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if thread_id not in names:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stack.append(names.get(thread_id, f"thread-{thread_id}"))
+            counts[";".join(reversed(stack))] += 1
+        samples += 1
+        time.sleep(interval)
+
+    return {"samples": samples, "interval_ms": interval * 1000, "collapsed": _collapse(counts)}
+
+
+def _torch_profiler():
+    """A torch.profiler session for the calling thread, or None without torch."""
+    try:
+        import torch
+        from torch.profiler import ProfilerActivity, profile
+    except ImportError:
+        return None
+    activities = [ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(ProfilerActivity.CUDA)
+    return profile(activities=activities, with_stack=True, record_shapes=False)
+
+
+class TorchCapture:
+    """Merged torch operator stats of the pipeline calls profiled during one window."""
+
+    def __init__(self, deadline: float):
+        self.deadline = deadline  # perf_counter time after which no new call is profiled
+        self.calls = 0
+        self.stacks: Counter = Counter()
+        self.ops: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, profiler) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            stacks_path = os.path.join(tmp, "stacks.txt")
+            profiler.export_stacks(stacks_path, "self_cpu_time_total")
+            with open(stacks_path) as f:
+                lines = f.read().splitlines()
+        averages = profiler.key_averages()
+        with self._lock:
+            self.calls += 1
+            for line in lines:
+                stack, _, value = line.rpartition(" ")
+                if stack and value.isdigit():
+                    self.stacks[stack] += int(value)
+            for event in averages:
+                op = self.ops.setdefault(event.key, {"count": 0, "self_cpu_us": 0.0, "cpu_total_us": 0.0})
+                op["count"] += event.count
+                op["self_cpu_us"] += event.self_cpu_time_total
+                op["cpu_total_us"] += event.cpu_time_total
+
+    def result(self, row_limit: int = 30) -> Dict:
+        with self._lock:
+            ops = sorted(self.ops.items(), key=lambda item: item[1]["self_cpu_us"], reverse=True)
+            return {
+                "pipeline_calls": self.calls,
+                "collapsed": _collapse(self.stacks),
+                "ops": [{"name": name, **stats} for name, stats in ops[:row_limit]],
+                "note": "Operators of pipeline calls started during the window, recorded on the thread "
+                        "running them; calls still running when the window closed are not included",
+            }
+
+
+_torch_capture: Optional[TorchCapture] = None
+
+
+@contextmanager
+def profile_inference():
+    """Run the enclosed pipeline call under torch.profiler when a profile window is armed."""
+    capture = _torch_capture
+    profiler = None
+    if capture is not None and time.perf_counter() < capture.deadline:
+        profiler = _torch_profiler()
+    if profiler is None:
+        yield
+        return
+    with profiler:
+        yield
+    try:
+        capture.add(profiler)
+    except Exception as e:
+        logger.warning(f"Could not collect torch profile of a pipeline call: {e}")
+
+
+def run_profile(duration: float, interval: float = 0.005, torch_profile: bool = True) -> Dict:
+    """Run a time-boxed profile; blocking, so call it from a worker thread.
+
+    With ``torch_profile``, pipeline calls started during the window are also
+    profiled on their own threads and their operators returned as a collapsed
+    stack export plus per-operator totals.
+    """
+    global _torch_capture
+
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusyError("A profile is already running")
+    try:
+        capture = None
+        if torch_profile:
+            capture = _torch_capture = TorchCapture(time.perf_counter() + duration)
+
+        started_at = time.time()
+        try:
+            result = sample_stacks(duration, interval)
+        finally:
+            _torch_capture = None
+
+        return {
+            "format": "collapsed",
+            "started_at": started_at,
+            "duration_seconds": duration,
+            **result,
+            "torch": capture.result() if capture is not None else None,
+        }
+    finally:
+        _profile_lock.release()
+
+
+class JobTrace:
+    """Accumulated span durations for one job run."""
+
+    def __init__(self):
+        self.spans: Dict[str, float] = {}
+        self.counts: Counter = Counter()
+
+    def add(self, name: str, seconds: float) -> None:
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+        self.counts[name] += 1
+
+    def summary(self) -> str:
+        parts = []
+        for name, seconds in self.spans.items():
+            repeat = f" x{self.counts[name]}" if self.counts[name] > 1 else ""
+            parts.append(f"{name} {seconds * 1000:.1f}ms{repeat}")
+        return "Trace: " + ", ".join(parts)
+
+
+current_trace: ContextVar[Optional[JobTrace]] = ContextVar("current_trace", default=None)
+
+
+def add_span(name: str, seconds: float) -> None:
+    """Add a span to the current job's trace (no-op outside a job)."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+@contextmanager
+def trace_span(name: str):
+    """Time the enclosed block as a span of the current job's trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(name, time.perf_counter() - start)
+
+
+def add_pipeline_spans(call_start: float, last_step_end: Optional[float]) -> None:
+    """Split a diffusers pipeline call into denoise and decode spans.
+
+    ``last_step_end`` is the time of the final ``callback_on_step_end`` call
+    (``StepTimer.last``); everything after it is VAE decoding and
+    post-processing.
+    """
+    end = time.perf_counter()
+    split = last_step_end or end
+    add_span("denoise", split - call_start)
+    add_span("decode", end - split)
@@ -0,0 +1,72 @@
+"""
+Short-TTL JSON response cache with change-driven invalidation and ETags.
+
+Each cached entry is tagged with a data version supplied by the caller (for
+the monitoring endpoints, ``stats_store.version``, which changes whenever a
+job, asset, dataset or training job changes). An entry is rebuilt when the
+version moved or the TTL expired, and clients presenting the current ETag in
+``If-None-Match`` get a body-less 304. Versions are per process and restart
+at zero, so ETags also carry a nonce drawn at startup: a tag issued before a
+restart, or by another worker, never matches.
+"""
+import json
+import time
+import uuid
+from typing import Callable, Dict, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from .metrics import CACHE_REQUESTS
+
+BOOT_NONCE = uuid.uuid4().hex[:8]
+
+
+def _etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison: ignore W/ prefixes on either side
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+class VersionedResponseCache:
+    """Cache of serialized JSON bodies keyed by endpoint and query."""
+
+    def __init__(self, name: str, version: Callable[[], int], ttl: float = 2.0):
+        self.name = name
+        self.version = version
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[int, float, bytes]] = {}
+
+    def invalidate(self, key: str | None = None) -> None:
+        """Drop one entry, or all entries when ``key`` is None."""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def respond(self, request: Request, key: str, build: Callable[[], object]) -> Response:
+        """Return a 304, a cached body, or a freshly built body for ``key``."""
+        version = self.version()
+        # Weak ETag: volatile fields (uptime, timestamp) may differ for the same data version
+        etag = f'W/"{key}-{BOOT_NONCE}-{version}"'
+        headers = {"ETag": etag, "Cache-Control": f"private, max-age={int(self.ttl)}"}
+
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            CACHE_REQUESTS.inc(cache=self.name, result="not_modified")
+            return Response(status_code=304, headers=headers)
+
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version or entry[1] < now:
+            CACHE_REQUESTS.inc(cache=self.name, result="miss")
+            body = json.dumps(jsonable_encoder(build())).encode("utf-8")
+            entry = (version, now + self.ttl, body)
+            self._entries[key] = entry
+        else:
+            CACHE_REQUESTS.inc(cache=self.name, result="hit")
+
+        return Response(content=entry[2], media_type="application/json", headers=headers)
@@ -10,26 +10,9 @@ import asyncio
 import mimetypes
 from pathlib import Path
 
-router = APIRouter(prefix="/api/autonomous-collection", tags=["autonomous-collection"])
+from ..media_validation import FILE_TYPE_RULES, check_file_rules
 
-# File type recognition rules
-FILE_TYPE_RULES = {
-    'image': {
-        'extensions': ['.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tiff', '.svg'],
-        'mime_types': ['image/jpeg', 'image/png', 'image/webp', 'image/gif', 'image/bmp', 'image/tiff', 'image/svg+xml'],
-        'max_size_mb': 50,
-        'min_dimensions': (256, 256),
-        'recommended_dimensions': (1024, 1024)
-    },
-    'video': {
-        'extensions': ['.mp4', '.mov', '.avi', '.webm', '.mkv', '.flv'],
-        'mime_types': ['video/mp4', 'video/quicktime', 'video/x-msvideo', 'video/webm', 'video/x-matroska'],
-        'max_size_mb': 500,
-        'min_duration_sec': 1,
-        'max_duration_sec': 60,
-        'recommended_fps': 24
-    }
-}
+router = APIRouter(prefix="/api/autonomous-collection", tags=["autonomous-collection"])
 
 # In-memory storage
 collection_jobs_db: Dict[str, Dict] = {}
@@ -161,10 +144,6 @@ async def validate_file(
     """
     Validate file against rules for its type
     """
-    issues = []
-    recommendations = []
-    is_valid = True
-    
     if file_type not in ['image', 'video']:
         return FileValidationResult(
             is_valid=False,
@@ -172,49 +151,18 @@ async def validate_file(
             issues=["Unknown file type"]
         )
     
-    rules = FILE_TYPE_RULES[file_type]
-    
-    # Validate extension
     ext = file_info.get('extension', '').lower()
-    if ext and ext not in rules['extensions']:
-        issues.append(f"Unsupported extension: {ext}")
-        is_valid = False
-    
-    # Validate MIME type
     mime = file_info.get('mime_type', '')
-    if mime and mime not in rules['mime_types']:
-        issues.append(f"Unsupported MIME type: {mime}")
-        is_valid = False
-    
-    # Validate size
     size_mb = file_info.get('size_mb', 0)
-    if size_mb > rules['max_size_mb']:
-        issues.append(f"File too large: {size_mb}MB (max: {rules['max_size_mb']}MB)")
-        is_valid = False
-    
-    # Type-specific validation
-    if file_type == 'image':
-        dimensions = file_info.get('dimensions')
-        if dimensions:
-            width, height = dimensions
-            min_w, min_h = rules['min_dimensions']
-            if width < min_w or height < min_h:
-                issues.append(f"Dimensions too small: {width}x{height} (min: {min_w}x{min_h})")
-                is_valid = False
-            
-            rec_w, rec_h = rules['recommended_dimensions']
-            if width < rec_w or height < rec_h:
-                recommendations.append(f"Recommended dimensions: {rec_w}x{rec_h} for best quality")
-    
-    elif file_type == 'video':
-        duration = file_info.get('duration_sec', 0)
-        if duration:
-            if duration < rules['min_duration_sec']:
-                issues.append(f"Video too short: {duration}s (min: {rules['min_duration_sec']}s)")
-                is_valid = False
-            if duration > rules['max_duration_sec']:
-                issues.append(f"Video too long: {duration}s (max: {rules['max_duration_sec']}s)")
-                is_valid = False
+    issues, recommendations = check_file_rules(
+        file_type,
+        extension=ext,
+        mime_type=mime,
+        size_mb=size_mb,
+        dimensions=file_info.get('dimensions'),
+        duration_sec=file_info.get('duration_sec'),
+    )
+    is_valid = not issues
     
     return FileValidationResult(
         is_valid=is_valid,
@@ -1,14 +1,21 @@
 """Dataset management router for training data with database integration."""
+import asyncio
 from typing import List
 from pathlib import Path
-from fastapi import APIRouter, HTTPException, UploadFile, File, Depends
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Query
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
-from datetime import datetime
+from sqlalchemy import select
+from ..config import get_settings
 from ..database import get_db
 from ..models import Dataset
-from ..dataset_utils import get_dataset_path, count_dataset_files, count_total_dataset_items
+from ..dataset_index import drop_dataset, get_dataset_counters, reconcile_dataset, remove_paths, validation_report
+from ..dataset_utils import get_dataset_path
+from ..near_duplicates import MAX_THRESHOLD, find_near_duplicates
+from ..dataset_shards import drop_dataset_shards, export_dataset_shards
+from ..training_cache import drop_dataset_caches
+from ..upload_store import linked_blobs, release_blobs
+from ..stats_store import stats_store
 
 router = APIRouter(prefix="/datasets", tags=["datasets"])
 
@@ -89,6 +96,7 @@ async def create_dataset(
     dataset.path = str(dataset_path)
     await db.commit()
     await db.refresh(dataset)
+    stats_store.adjust("datasets", 1)
     
     return DatasetResponse(
         id=dataset.id,
@@ -136,8 +144,12 @@ async def delete_dataset(
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
     
+    await drop_dataset(db, dataset_id)
     await db.delete(dataset)
     await db.commit()
+    await asyncio.to_thread(drop_dataset_caches, dataset_id)
+    await asyncio.to_thread(drop_dataset_shards, dataset_id)
+    stats_store.adjust("datasets", -1)
     
     return {"status": "deleted", "id": dataset_id}
 
@@ -170,19 +182,29 @@ async def get_dataset_stats(
     dataset_id: int,
     db: AsyncSession = Depends(get_db)
 ) -> dict:
-    """Get dataset statistics from database."""
+    """Get dataset storage statistics from the maintained index aggregates."""
     result = await db.execute(select(Dataset).where(Dataset.id == dataset_id))
     dataset = result.scalar_one_or_none()
     
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
     
+    # Aggregates are maintained as files are added/removed; this is a primary-key lookup
+    stats = await get_dataset_counters(db, dataset_id)
+    
     return {
         "id": dataset_id,
         "name": dataset.name,
-        "total_items": dataset.num_items,
+        "total_items": stats.num_files,
         "type": dataset.type,
-        "storage_size_mb": dataset.num_items * 2.5,  # Approximate size
+        "storage_size_bytes": stats.total_bytes,
+        "storage_size_mb": round(stats.total_bytes / (1024 * 1024), 2),
+        "type_counts": stats.type_counts,
+        "format_counts": stats.extension_counts,
+        "dimension_histogram": stats.dimension_histogram,
+        "duplicate_files": stats.duplicate_files,
+        "duplicate_bytes": stats.duplicate_bytes,
+        "reconciled_at": stats.reconciled_at.isoformat() if stats.reconciled_at else None,
         "tags": dataset.tags
     }
 
@@ -192,27 +214,123 @@ async def refresh_dataset_count(
     dataset_id: int,
     db: AsyncSession = Depends(get_db)
 ) -> dict:
-    """Refresh dataset item count by scanning the upload directory."""
+    """Re-scan the upload directories and reconcile the dataset file index and counters."""
     result = await db.execute(select(Dataset).where(Dataset.id == dataset_id))
     dataset = result.scalar_one_or_none()
     
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
     
-    # Count files in dataset directory using utility function
-    file_count = count_total_dataset_items(dataset_id)
-    
-    # Update database
-    stmt = (
-        update(Dataset)
-        .where(Dataset.id == dataset_id)
-        .values(num_items=file_count, updated_at=datetime.utcnow())
-    )
-    await db.execute(stmt)
-    await db.commit()
+    stats = await reconcile_dataset(db, dataset_id)
     
     return {
         "dataset_id": dataset_id,
-        "num_items": file_count,
+        "num_items": stats.num_files,
+        "total_bytes": stats.total_bytes,
+        "type_counts": stats.type_counts,
         "status": "refreshed"
     }
+
+
+@router.get("/{dataset_id}/validation")
+async def get_validation_report(
+    dataset_id: int,
+    limit: int = Query(100, ge=1, le=1000, description="Flagged files to list"),
+    db: AsyncSession = Depends(get_db)
+) -> dict:
+    """Corrupt images and files that break the ingest rules, as recorded in the file index."""
+    result = await db.execute(select(Dataset).where(Dataset.id == dataset_id))
+    if not result.scalar_one_or_none():
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    
+    report = await validation_report(db, dataset_id, limit)
+    report["dataset_id"] = dataset_id
+    return report
+
+
+@router.post("/{dataset_id}/shards")
+async def export_shards(
+    dataset_id: int,
+    force: bool = Query(False, description="Re-export even if the dataset is unchanged"),
+    db: AsyncSession = Depends(get_db)
+) -> dict:
+    """Pack the dataset's images and captions into sequential tar shards for streaming training."""
+    result = await db.execute(select(Dataset).where(Dataset.id == dataset_id))
+    if not result.scalar_one_or_none():
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    
+    try:
+        index, rebuilt = await export_dataset_shards(db, dataset_id, force)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "dataset_id": dataset_id,
+        "exported": rebuilt,
+        "samples": index["samples"],
+        "total_bytes": index["total_bytes"],
+        "shards": [
+            {"name": shard["name"], "samples": len(shard["samples"]), "bytes": shard["bytes"]}
+            for shard in index["shards"]
+        ],
+    }
+
+
+async def _near_duplicate_groups(dataset_id: int, threshold: int | None, db: AsyncSession):
+    result = await db.execute(select(Dataset).where(Dataset.id == dataset_id))
+    if not result.scalar_one_or_none():
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    if threshold is None:
+        threshold = get_settings().near_duplicate_threshold
+    return threshold, await find_near_duplicates(db, dataset_id, threshold)
+
+
+@router.get("/{dataset_id}/duplicates")
+async def get_near_duplicates(
+    dataset_id: int,
+    threshold: int | None = Query(None, ge=0, le=MAX_THRESHOLD, description="Max differing hash bits"),
+    limit: int = Query(100, ge=1, le=1000, description="Groups to list"),
+    db: AsyncSession = Depends(get_db)
+) -> dict:
+    """Report groups of visually near-identical images (resized/re-encoded copies)."""
+    threshold, groups = await _near_duplicate_groups(dataset_id, threshold, db)
+    return {
+        "dataset_id": dataset_id,
+        "threshold": threshold,
+        "groups": len(groups),
+        "duplicate_files": sum(len(group.duplicates) for group in groups),
+        "reclaimable_bytes": sum(row.size_bytes or 0 for group in groups for row in group.duplicates),
+        "items": [group.summary() for group in groups[:limit]],
+    }
+
+
+@router.post("/{dataset_id}/duplicates/remove")
+async def remove_near_duplicates(
+    dataset_id: int,
+    threshold: int | None = Query(None, ge=0, le=MAX_THRESHOLD, description="Max differing hash bits"),
+    dry_run: bool = Query(True, description="Only list what would be removed"),
+    db: AsyncSession = Depends(get_db)
+) -> dict:
+    """Delete all but the highest-resolution image of every near-duplicate group."""
+    threshold, groups = await _near_duplicate_groups(dataset_id, threshold, db)
+    doomed = [Path(row.path) for group in groups for row in group.duplicates]
+    freed = sum(row.size_bytes or 0 for group in groups for row in group.duplicates)
+    
+    if not dry_run and doomed:
+        def unlink_all() -> None:
+            for path in doomed:
+                path.unlink(missing_ok=True)
+        
+        blobs = await asyncio.to_thread(linked_blobs, doomed)
+        await asyncio.to_thread(unlink_all)
+        await remove_paths(db, doomed)
+        await asyncio.to_thread(release_blobs, blobs)
+    
+    return {
+        "dataset_id": dataset_id,
+        "threshold": threshold,
+        "dry_run": dry_run,
+        "removed_files": len(doomed),
+        "freed_bytes": freed,
+        "paths": [str(path) for path in doomed],
+    }
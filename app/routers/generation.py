@@ -10,6 +10,8 @@ from ..schemas import (
     InpaintingRequest,
     JobState,
     JobStatus,
+    PreviewRefineRequest,
+    RefineRequest,
     TextToImageRequest,
     TextToVideoRequest,
     UpscaleRequest,
@@ -33,6 +35,33 @@ async def text_to_image(
     return queue.create_text_to_image_job(request)
 
 
+@router.post("/text-to-image/preview", response_model=JobState)
+async def text_to_image_preview(
+    request: PreviewRefineRequest,
+    queue: JobQueue = Depends(get_queue),
+) -> JobState:
+    """Generate fast low-resolution previews, then refine one at full resolution."""
+    return queue.create_preview_refine_job(request)
+
+
+@router.post("/{job_id}/refine", response_model=JobState)
+async def refine_preview(
+    job_id: str,
+    request: RefineRequest,
+    queue: JobQueue = Depends(get_queue),
+) -> JobState:
+    """Confirm a preview and refine the chosen seed at full resolution."""
+    job = queue.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != JobStatus.preview_ready:
+        raise HTTPException(status_code=400, detail=f"Cannot refine job in {job.status.value} status")
+    try:
+        return queue.confirm_refine(job_id, request.index)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.post("/text-to-video", response_model=JobState)
 async def text_to_video(
     request: TextToVideoRequest,
@@ -2,15 +2,19 @@
 Monitoring & Analytics Router - Phase 6
 Provides system monitoring, statistics, and analytics with real database integration
 """
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
+import asyncio
 import time
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from ..database import get_db
-from ..models import Job, TrainingJob, Asset, Dataset, User
+from collections import deque
+from ..config import get_settings
+from ..profiling import ProfilerBusyError, run_profile
+from ..response_cache import VersionedResponseCache
+from ..stats_store import stats_store
+from ..timeseries import get_timeseries_store
 
 router = APIRouter(prefix="/monitoring", tags=["monitoring"])
 
@@ -32,6 +36,8 @@ class UsageStats(BaseModel):
 
 # In-memory statistics (ready for database integration)
 START_TIME = time.time()
+MAX_RECENT_ERRORS = 500
+MAX_TIMESERIES_POINTS = 1440
 STATS_DB = {
     "jobs": {"total": 0, "completed": 0, "failed": 0, "pending": 0, "total_time": 0.0},
     "usage": {
@@ -43,9 +49,14 @@ STATS_DB = {
         "downloads": 0,
     },
     "endpoints": {},  # Track endpoint usage
-    "errors": [],  # Recent errors
+    "errors": deque(maxlen=MAX_RECENT_ERRORS),  # Recent errors (bounded)
 }
 
+# Dashboard responses, invalidated whenever the aggregates change (stats_store.version)
+response_cache = VersionedResponseCache(
+    "monitoring", lambda: stats_store.version, ttl=get_settings().dashboard_cache_ttl
+)
+
 @router.get("/health")
 async def health_check():
     """Basic health check endpoint"""
@@ -57,99 +68,78 @@ async def health_check():
         "timestamp": datetime.utcnow().isoformat(),
     }
 
-@router.get("/stats/system", response_model=SystemStats)
-async def get_system_stats(db: AsyncSession = Depends(get_db)):
-    """Get overall system statistics from database"""
-    # Count all jobs
-    total_jobs_query = await db.execute(select(func.count(Job.id)))
-    total_jobs = total_jobs_query.scalar() or 0
-    
-    # Count completed jobs
-    completed_query = await db.execute(
-        select(func.count(Job.id)).where(Job.status == "completed")
-    )
-    jobs_completed = completed_query.scalar() or 0
-    
-    # Count failed jobs
-    failed_query = await db.execute(
-        select(func.count(Job.id)).where(Job.status == "failed")
-    )
-    jobs_failed = failed_query.scalar() or 0
-    
-    # Count pending jobs
-    pending_query = await db.execute(
-        select(func.count(Job.id)).where(Job.status == "pending")
-    )
-    jobs_pending = pending_query.scalar() or 0
-    
-    # Calculate average generation time from completed jobs with timing data
-    completed_jobs = await db.execute(
-        select(Job).where(Job.status == "completed")
-    )
-    completed_list = completed_jobs.scalars().all()
-    
-    total_time = 0.0
-    count_with_time = 0
-    for job in completed_list:
-        if job.created_at and job.updated_at:
-            delta = (job.updated_at - job.created_at).total_seconds()
-            if delta > 0:
-                total_time += delta
-                count_with_time += 1
-    
-    avg_time = total_time / count_with_time if count_with_time > 0 else 0.0
-    
+def build_system_stats() -> SystemStats:
+    """Overall system statistics from the incrementally maintained aggregates"""
     return SystemStats(
-        total_jobs=total_jobs,
-        jobs_completed=jobs_completed,
-        jobs_failed=jobs_failed,
-        jobs_pending=jobs_pending,
-        avg_generation_time=avg_time,
+        total_jobs=stats_store.total_jobs,
+        jobs_completed=stats_store.status_counts["completed"],
+        jobs_failed=stats_store.status_counts["failed"],
+        jobs_pending=stats_store.status_counts["pending"],
+        avg_generation_time=stats_store.avg_generation_time,
         uptime_seconds=time.time() - START_TIME,
     )
 
-@router.get("/stats/usage", response_model=UsageStats)
-async def get_usage_stats(db: AsyncSession = Depends(get_db)):
-    """Get usage statistics across all features from database"""
-    # Count images generated
-    images_query = await db.execute(
-        select(func.count(Asset.id)).where(Asset.type == "image")
-    )
-    total_images = images_query.scalar() or 0
-    
-    # Count videos generated
-    videos_query = await db.execute(
-        select(func.count(Asset.id)).where(Asset.type == "video")
-    )
-    total_videos = videos_query.scalar() or 0
-    
-    # Count workflows executed (jobs with type 'workflow')
-    workflows_query = await db.execute(
-        select(func.count(Job.id)).where(Job.type.like("%workflow%"))
-    )
-    total_workflows = workflows_query.scalar() or 0
-    
-    # Count datasets created
-    datasets_query = await db.execute(select(func.count(Dataset.id)))
-    total_datasets = datasets_query.scalar() or 0
-    
-    # Count training jobs
-    training_query = await db.execute(select(func.count(TrainingJob.id)))
-    total_training = training_query.scalar() or 0
-    
-    # Count total assets as downloads metric
-    downloads_query = await db.execute(select(func.count(Asset.id)))
-    total_downloads = downloads_query.scalar() or 0
-    
+def build_usage_stats() -> UsageStats:
+    """Usage statistics across all features from the maintained counters"""
+    counts = stats_store.entity_counts
     return UsageStats(
-        total_images_generated=total_images,
-        total_videos_generated=total_videos,
-        total_workflows_executed=total_workflows,
-        total_datasets_created=total_datasets,
-        total_training_jobs=total_training,
-        total_downloads=total_downloads,
+        total_images_generated=counts["assets_image"],
+        total_videos_generated=counts["assets_video"],
+        total_workflows_executed=counts["workflows"],
+        total_datasets_created=counts["datasets"],
+        total_training_jobs=counts["training_jobs"],
+        total_downloads=counts["assets"],
     )
 
+@router.get("/stats/system", response_model=SystemStats)
+async def get_system_stats(request: Request):
+    """Get overall system statistics (cached, supports If-None-Match)"""
+    return response_cache.respond(request, "system", build_system_stats)
+
+@router.get("/stats/usage", response_model=UsageStats)
+async def get_usage_stats(request: Request):
+    """Get usage statistics across all features (cached, supports If-None-Match)"""
+    return response_cache.respond(request, "usage", build_usage_stats)
+
+@router.get("/stats/rollups")
+async def get_rollups(
+    request: Request,
+    resolution: str = Query("minute", pattern="^(minute|hour)$"),
+    limit: int = Query(60, ge=1, le=1440),
+):
+    """Get per-minute or per-hour job counts, durations and preset usage"""
+    return response_cache.respond(
+        request,
+        f"rollups-{resolution}-{limit}",
+        lambda: {"resolution": resolution, "buckets": stats_store.series(resolution, limit)},
+    )
+
+@router.get("/timeseries")
+async def get_timeseries(
+    start: Optional[float] = Query(None, description="Range start (epoch seconds), default one hour ago"),
+    end: Optional[float] = Query(None, description="Range end (epoch seconds), default now"),
+    step: Optional[int] = Query(None, ge=1, description="Seconds per point, rounded to the bucket resolution"),
+):
+    """Get job throughput, queue depth, latency percentiles and error rates over a time range"""
+    store = get_timeseries_store()
+    if end is None:
+        end = time.time()
+    if start is None:
+        start = end - 3600
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    step = max(step or store.resolution, store.resolution)
+    # Coarsen the step for long ranges so responses stay bounded
+    while (end - start) / step > MAX_TIMESERIES_POINTS:
+        step *= 2
+    return {
+        "start": start,
+        "end": end,
+        "step": step - step % store.resolution,
+        "resolution": store.resolution,
+        "points": store.query(start, end, step),
+    }
+
 @router.get("/stats/endpoints")
 async def get_endpoint_stats():
     """Get statistics for API endpoint usage"""
@@ -176,7 +166,7 @@ async def get_endpoint_stats():
 @router.get("/errors/recent")
 async def get_recent_errors(limit: int = 50):
     """Get recent errors and exceptions"""
-    errors = STATS_DB["errors"][-limit:]
+    errors = list(STATS_DB["errors"])[-limit:]
     return {
         "total_errors": len(STATS_DB["errors"]),
         "recent_errors": errors,
@@ -231,23 +221,16 @@ async def track_endpoint_usage(path: str, response_time: float):
     
     return {"status": "tracked"}
 
-@router.get("/dashboard")
-async def get_dashboard_data(db: AsyncSession = Depends(get_db)):
-    """Get comprehensive dashboard data with real database queries"""
-    system = await get_system_stats(db)
-    usage = await get_usage_stats(db)
+def build_dashboard() -> dict:
+    """Comprehensive dashboard data from the maintained aggregates (no table scans)"""
+    system = build_system_stats()
+    usage = build_usage_stats()
     uptime = time.time() - START_TIME
     
-    # Recent activity - real data from database
-    recent_jobs = await db.execute(
-        select(Job).order_by(Job.updated_at.desc()).limit(10)
-    )
-    recent_jobs_list = recent_jobs.scalars().all()
-    
     recent_activity = []
-    for job in recent_jobs_list:
+    for event in stats_store.recent:
         # Calculate time ago
-        time_diff = datetime.utcnow() - job.updated_at
+        time_diff = datetime.utcnow() - event["updated_at"]
         if time_diff.seconds < 60:
             time_ago = f"{time_diff.seconds} seconds ago"
         elif time_diff.seconds < 3600:
@@ -255,33 +238,14 @@ async def get_dashboard_data(db: AsyncSession = Depends(get_db)):
         else:
             time_ago = f"{time_diff.seconds // 3600} hours ago"
         
-        # Determine type
-        job_type = "image" if "image" in job.type else ("video" if "video" in job.type else "workflow")
-        
         recent_activity.append({
-            "type": job_type,
-            "status": job.status,
+            "type": event["type"],
+            "status": event["status"],
             "time": time_ago
         })
     
-    # Popular presets - could be tracked in a separate table, for now use job params frequency
-    jobs_with_params = await db.execute(
-        select(Job).where(Job.status == "completed")
-    )
-    jobs_list = jobs_with_params.scalars().all()
-    
-    # Count preset usage (simplified)
-    preset_counts = {}
-    for job in jobs_list:
-        if job.params and isinstance(job.params, dict):
-            preset_name = job.params.get("preset", "Custom")
-            preset_counts[preset_name] = preset_counts.get(preset_name, 0) + 1
-    
     # Get top 5 presets
-    popular_presets = [
-        {"name": name, "usage": count}
-        for name, count in sorted(preset_counts.items(), key=lambda x: x[1], reverse=True)[:5]
-    ]
+    popular_presets = stats_store.popular_presets(5)
     
     if not popular_presets:
         # Default if no data
@@ -300,6 +264,31 @@ async def get_dashboard_data(db: AsyncSession = Depends(get_db)):
         "timestamp": datetime.utcnow().isoformat(),
     }
 
+@router.get("/dashboard")
+async def get_dashboard_data(request: Request):
+    """Get comprehensive dashboard data (cached, supports If-None-Match)"""
+    return response_cache.respond(request, "dashboard", build_dashboard)
+
+@router.post("/profile")
+async def profile_process(
+    duration: float = Query(10.0, gt=0, description="Seconds to profile"),
+    interval_ms: float = Query(5.0, ge=1, le=1000, description="Stack sampling interval"),
+    torch_profile: bool = Query(True, description="Also record torch operators when torch is installed"),
+    format: str = Query("json", pattern="^(json|collapsed)$"),
+):
+    """Sample the running process and return flamegraph-compatible stacks (admin only in production)"""
+    max_seconds = get_settings().profiler_max_seconds
+    if duration > max_seconds:
+        raise HTTPException(status_code=400, detail=f"duration must be at most {max_seconds:g} seconds")
+    try:
+        # Sample from a worker thread so the event loop (and the job workers on it) keep running
+        result = await asyncio.to_thread(run_profile, duration, interval_ms / 1000, torch_profile)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "collapsed":
+        return PlainTextResponse(result["collapsed"])
+    return result
+
 @router.post("/reset-stats")
 async def reset_statistics():
     """Reset all statistics (admin only in production)"""
@@ -313,6 +302,6 @@ async def reset_statistics():
         "downloads": 0,
     }
     STATS_DB["endpoints"] = {}
-    STATS_DB["errors"] = []
+    STATS_DB["errors"].clear()
     
     return {"status": "success", "message": "All statistics reset"}
@@ -1,16 +1,23 @@
 """Training jobs router for model fine-tuning with real database integration."""
-from typing import List
+from typing import Any, Dict, List, Optional
 from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, ValidationError
 from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from ..database import get_db
-from ..models import TrainingJob, Dataset, Model
+from ..models import TrainingJob, TrainingSweep, Dataset, Model
+from ..stats_store import stats_store
+from ..training_checkpoints import find_checkpoint, list_checkpoints
+from ..training_progress import count_logs, read_logs
+from ..training_supervisor import checkpoints_root, get_training_supervisor, training_output_dir
+from ..training_sweeps import rung_schedule, run_sweep, sample_trials, sweep_leaderboard, validate_search_space
 import uuid
 
 router = APIRouter(prefix="/training", tags=["training"])
 
+RESUMABLE_STATUSES = {"pending", "failed", "cancelled"}
+
 
 class TrainingConfig(BaseModel):
     """Training configuration."""
@@ -20,7 +27,18 @@ class TrainingConfig(BaseModel):
     max_steps: int | None = None
     lora_rank: int = 4
     lora_alpha: int = 32
-    mixed_precision: str = "fp16"
+    mixed_precision: str = "fp16"  # "no", "fp16" or "bf16"; on CPU only native bf16 is used, else fp32
+    gradient_accumulation_steps: int = 1
+    gradient_checkpointing: bool = False  # trade compute for activation memory
+    seed: int | None = None
+    checkpoint_steps: int | None = None  # optimizer steps between checkpoints; every epoch when unset
+    keep_last_checkpoints: int = 3
+    keep_best_checkpoints: int = 1  # lowest-loss checkpoints kept in addition to the last ones
+    num_processes: int = 1  # data-parallel ranks on this machine (torch.distributed, gloo, CPU)
+    num_nodes: int = 1  # machines; the others join with `python -m app.lora_trainer <spec> --node-rank N`
+    resolution: int = 512
+    use_cache: bool = True  # train from preprocessed, memory-mapped latents
+    use_shards: bool = False  # without the cache, stream the dataset from exported tar shards
 
 
 class TrainingJobCreate(BaseModel):
@@ -32,6 +50,26 @@ class TrainingJobCreate(BaseModel):
     output_name: str
 
 
+class TrainingSweepCreate(BaseModel):
+    """Request to create a hyperparameter sweep.
+    
+    ``search_space`` maps TrainingConfig fields to a list of values or to a
+    range ``{"min": 1e-5, "max": 1e-3, "log": true}``.
+    """
+    name: str
+    dataset_id: int
+    base_model_id: int
+    type: str = "lora"
+    base_config: TrainingConfig
+    search_space: Dict[str, Any]
+    num_trials: int = Field(9, ge=1, le=64)
+    min_steps: int = Field(50, ge=1)  # budget of the first rung
+    reduction_factor: int = Field(3, ge=2)  # 1/reduction_factor of the trials survive each rung
+    max_steps: int | None = Field(None, ge=1)  # cap on any rung's budget
+    seed: int | None = None
+    output_name: str | None = None  # the winner's model name
+
+
 class TrainingJobResponse(BaseModel):
     """Training job information."""
     id: str
@@ -112,6 +150,7 @@ async def create_training_job(
     db.add(job)
     await db.commit()
     await db.refresh(job)
+    stats_store.adjust("training_jobs", 1)
     
     return TrainingJobResponse(
         id=job.id,
@@ -128,6 +167,147 @@ async def create_training_job(
     )
 
 
+@router.get("/active")
+async def list_active_trainings() -> dict:
+    """Running and queued trainings with slot usage and resource consumption."""
+    return get_training_supervisor().snapshot()
+
+
+def sweep_summary(sweep: TrainingSweep) -> dict:
+    return {
+        "id": sweep.id,
+        "name": sweep.name,
+        "dataset_id": sweep.dataset_id,
+        "base_model_id": sweep.base_model_id,
+        "type": sweep.type,
+        "status": sweep.status,
+        "num_trials": sweep.config["num_trials"],
+        "schedule": sweep.config["schedule"],
+        "rungs_completed": len(sweep.rungs or []),
+        "best_job_id": sweep.best_job_id,
+        "error": sweep.error,
+        "created_at": sweep.created_at.isoformat(),
+        "updated_at": sweep.updated_at.isoformat(),
+    }
+
+
+@router.post("/sweeps")
+async def create_training_sweep(
+    request: TrainingSweepCreate,
+    db: AsyncSession = Depends(get_db)
+) -> dict:
+    """Create a hyperparameter sweep and start scheduling its trials.
+    
+    Trials are regular training jobs; they share the training slots with
+    other jobs and are pruned by successive halving (see training_sweeps).
+    """
+    dataset = (await db.execute(select(Dataset).where(Dataset.id == request.dataset_id))).scalar_one_or_none()
+    if not dataset:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    model = (await db.execute(select(Model).where(Model.id == request.base_model_id))).scalar_one_or_none()
+    if not model:
+        raise HTTPException(status_code=404, detail="Base model not found")
+    
+    # Rungs stop trials at a step budget and resume them, which only the cached LoRA training loop supports
+    if request.type != "lora":
+        raise HTTPException(status_code=400, detail="Sweeps only support LoRA training")
+    if not request.base_config.use_cache:
+        raise HTTPException(status_code=400, detail="Sweeps train from the preprocessed cache; use_cache must be true")
+    
+    base_config = request.base_config.model_dump()
+    try:
+        validate_search_space(request.search_space, TrainingConfig.model_fields)
+        trial_params = sample_trials(request.search_space, request.num_trials, request.seed)
+        trial_configs = [TrainingConfig(**{**base_config, **params}).model_dump() for params in trial_params]
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid search space: {e}")
+    
+    max_steps = request.max_steps or base_config.get("max_steps")
+    sweep = TrainingSweep(
+        id=str(uuid.uuid4()),
+        name=request.name,
+        dataset_id=request.dataset_id,
+        base_model_id=request.base_model_id,
+        type=request.type,
+        status="pending",
+        config={
+            "base_config": {**base_config, "output_name": request.output_name},
+            "search_space": request.search_space,
+            "num_trials": len(trial_configs),
+            "min_steps": request.min_steps,
+            "reduction_factor": request.reduction_factor,
+            "max_steps": max_steps,
+            "seed": request.seed,
+            "schedule": rung_schedule(len(trial_configs), request.min_steps, request.reduction_factor, max_steps),
+        },
+        rungs=[],
+    )
+    db.add(sweep)
+    for index, config in enumerate(trial_configs):
+        # Trials start from the same seed, so they differ only by their parameters
+        config.update(output_name=f"{request.name}-trial-{index}", seed=config.get("seed") or request.seed or 0)
+        db.add(TrainingJob(
+            id=str(uuid.uuid4()),
+            dataset_id=request.dataset_id,
+            base_model_id=request.base_model_id,
+            type=request.type,
+            status="pending",
+            progress=0.0,
+            config=config,
+            metrics={},
+            logs=[],
+            sweep_id=sweep.id,
+        ))
+    await db.commit()
+    await db.refresh(sweep)
+    stats_store.adjust("training_jobs", len(trial_configs))
+    
+    get_training_supervisor().start_sweep(sweep.id, run_sweep(sweep.id))
+    return sweep_summary(sweep)
+
+
+@router.get("/sweeps")
+async def list_training_sweeps(db: AsyncSession = Depends(get_db)) -> List[dict]:
+    """List hyperparameter sweeps, newest first."""
+    result = await db.execute(select(TrainingSweep).order_by(TrainingSweep.created_at.desc()))
+    return [sweep_summary(sweep) for sweep in result.scalars()]
+
+
+@router.get("/sweeps/{sweep_id}")
+async def get_training_sweep(
+    sweep_id: str,
+    db: AsyncSession = Depends(get_db)
+) -> dict:
+    """A sweep with its rung history and the leaderboard of its trials."""
+    sweep = (await db.execute(select(TrainingSweep).where(TrainingSweep.id == sweep_id))).scalar_one_or_none()
+    if not sweep:
+        raise HTTPException(status_code=404, detail="Sweep not found")
+    trials = list((await db.execute(select(TrainingJob).where(TrainingJob.sweep_id == sweep_id))).scalars())
+    return {
+        **sweep_summary(sweep),
+        "search_space": sweep.config["search_space"],
+        "rungs": sweep.rungs or [],
+        "leaderboard": sweep_leaderboard(sweep, trials),
+    }
+
+
+@router.post("/sweeps/{sweep_id}/cancel")
+async def cancel_training_sweep(
+    sweep_id: str,
+    db: AsyncSession = Depends(get_db)
+) -> dict:
+    """Stop a sweep: no further rungs are scheduled and its active trials are stopped."""
+    sweep = (await db.execute(select(TrainingSweep).where(TrainingSweep.id == sweep_id))).scalar_one_or_none()
+    if not sweep:
+        raise HTTPException(status_code=404, detail="Sweep not found")
+    trial_ids = list((await db.execute(
+        select(TrainingJob.id).where(TrainingJob.sweep_id == sweep_id)
+    )).scalars())
+    if not get_training_supervisor().cancel_sweep(sweep_id, trial_ids):
+        raise HTTPException(status_code=400, detail=f"Cannot cancel sweep in {sweep.status} status")
+    return {"status": "cancelling", "sweep_id": sweep_id}
+
+
 @router.get("/{job_id}", response_model=TrainingJobResponse)
 async def get_training_job(
     job_id: str,
@@ -160,11 +340,17 @@ async def get_training_job(
 @router.post("/{job_id}/start")
 async def start_training_job(
     job_id: str,
+    resume: bool = False,
+    checkpoint: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ) -> dict:
-    """Start a training job with real PyTorch training engine."""
-    import asyncio
-    from ..ml_training import start_training_background
+    """Start a training job with real PyTorch training engine.
+    
+    With ``resume``, training continues from the job's latest checkpoint, or
+    from ``checkpoint`` (a name from GET /{job_id}/checkpoints); failed and
+    cancelled jobs can be resumed too.
+    """
+    supervisor = get_training_supervisor()
     
     result = await db.execute(
         select(TrainingJob).where(TrainingJob.id == job_id)
@@ -174,12 +360,29 @@ async def start_training_job(
     if not job:
         raise HTTPException(status_code=404, detail="Training job not found")
     
-    if job.status != "pending":
+    if job.sweep_id:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Job is a trial of sweep {job.sweep_id}, which schedules it; "
+                   f"use /training/sweeps/{job.sweep_id} instead"
+        )
+    
+    allowed = RESUMABLE_STATUSES if resume else {"pending"}
+    if job.status not in allowed or supervisor.is_active(job_id):
         raise HTTPException(
             status_code=400,
             detail=f"Cannot start job in {job.status} status"
         )
     
+    resume_from = None
+    if resume:
+        resume_from = find_checkpoint(checkpoints_root(job_id), checkpoint)
+        if resume_from is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Checkpoint {checkpoint} not found" if checkpoint else "Job has no checkpoint to resume from"
+            )
+    
     # Get dataset and model paths
     dataset_result = await db.execute(
         select(Dataset).where(Dataset.id == job.dataset_id)
@@ -192,23 +395,28 @@ async def start_training_job(
     model = model_result.scalar_one()
     
     # Prepare output directory
-    output_dir = f"./outputs/training/{job_id}"
-    
-    # Start training in background
-    # Note: In production, use Celery or similar for proper background tasks
-    asyncio.create_task(
-        start_training_background(
-            job_id=job_id,
-            training_type=job.type,
-            config=job.config,
-            dataset_path=dataset.path,
-            model_path=model.path,
-            output_dir=output_dir,
-            db_session=db,
-            output_name=job.config.get('output_name')
-        )
+    output_dir = training_output_dir(job_id)
+    
+    # The supervisor runs it on its own session once a training slot is free
+    supervisor.submit(
+        job_id=job_id,
+        training_type=job.type,
+        config=job.config,
+        dataset_path=dataset.path,
+        model_path=model.path,
+        output_dir=output_dir,
+        output_name=job.config.get('output_name'),
+        resume_from=str(resume_from) if resume_from else None
     )
+    position = supervisor.queue_position(job_id)
     
+    if position is not None:
+        return {
+            "status": "queued",
+            "job_id": job_id,
+            "queue_position": position,
+            "message": f"All {supervisor.slots} training slot(s) are busy; the job starts when one frees up"
+        }
     return {
         "status": "started",
         "job_id": job_id,
@@ -232,6 +440,13 @@ async def cancel_training_job(
     if not job:
         raise HTTPException(status_code=404, detail="Training job not found")
     
+    if job.sweep_id:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Job is a trial of sweep {job.sweep_id}, which schedules it; "
+                   f"use /training/sweeps/{job.sweep_id}/cancel instead"
+        )
+    
     if job.status == "completed":
         raise HTTPException(
             status_code=400,
@@ -246,10 +461,25 @@ async def cancel_training_job(
     )
     await db.execute(stmt)
     await db.commit()
+    # Drop it from the queue, or stop it after the current step if it is training
+    get_training_supervisor().cancel(job_id)
     
     return {"status": "cancelled", "job_id": job_id}
 
 
+@router.get("/{job_id}/checkpoints")
+async def list_training_checkpoints(
+    job_id: str,
+    db: AsyncSession = Depends(get_db)
+) -> dict:
+    """Checkpoints kept for a job, oldest first; any of them can be resumed from."""
+    job = (await db.execute(select(TrainingJob).where(TrainingJob.id == job_id))).scalar_one_or_none()
+    if not job:
+        raise HTTPException(status_code=404, detail="Training job not found")
+    
+    return {"job_id": job_id, "checkpoints": list_checkpoints(checkpoints_root(job_id))}
+
+
 @router.get("/{job_id}/progress")
 async def get_training_progress(
     job_id: str,
@@ -265,7 +495,7 @@ async def get_training_progress(
         raise HTTPException(status_code=404, detail="Training job not found")
     
     metrics = job.metrics or {}
-    logs = job.logs or []
+    logs = await read_logs(db, job_id, limit=10) or (job.logs or [])[-10:]
     
     return {
         "job_id": job.id,
@@ -279,7 +509,8 @@ async def get_training_progress(
         "total_images": metrics.get("total_images"),
         "current_label": metrics.get("current_label"),
         "last_update": metrics.get("last_update"),
-        "recent_logs": logs[-10:],  # Last 10 log messages
+        "recent_logs": logs,  # Last 10 log messages
+        "queue_position": get_training_supervisor().queue_position(job_id),
         "config": job.config
     }
 
@@ -288,9 +519,10 @@ async def get_training_progress(
 async def get_training_logs(
     job_id: str,
     db: AsyncSession = Depends(get_db),
-    limit: int = 50
+    limit: int = 50,
+    after_id: int | None = None
 ) -> dict:
-    """Get training logs."""
+    """Get training logs: the last ``limit`` lines, or the lines after ``after_id`` for incremental polling."""
     result = await db.execute(
         select(TrainingJob).where(TrainingJob.id == job_id)
     )
@@ -299,12 +531,19 @@ async def get_training_logs(
     if not job:
         raise HTTPException(status_code=404, detail="Training job not found")
     
-    logs = job.logs or []
+    total = await count_logs(db, job_id)
+    if total:
+        logs = await read_logs(db, job_id, limit=limit, after_id=after_id)
+    else:
+        # Jobs from before the training_logs table kept their logs on the job row
+        logs = (job.logs or [])[-limit:]
+        total = len(job.logs or [])
     
     return {
         "job_id": job.id,
-        "total_logs": len(logs),
-        "logs": logs[-limit:]  # Return last N logs
+        "total_logs": total,
+        "logs": logs,
+        "last_id": logs[-1].get("id") if logs else after_id
     }
 
 @router.get("/{job_id}/metrics")
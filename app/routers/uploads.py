@@ -1,58 +1,52 @@
 """File upload router for handling various file types."""
+import asyncio
 import os
 import shutil
-import zipfile
-import tarfile
-import csv
 import json
 from pathlib import Path
 from typing import List, Dict, Optional, Any
-from datetime import datetime
-from fastapi import APIRouter, File, UploadFile, HTTPException, Form, Depends
+from fastapi import APIRouter, File, UploadFile, HTTPException, Form, Depends, Query, Request
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
-from ..database import get_db
+from sqlalchemy import select
+from ..archive_extraction import ExtractionTask, start_extraction, tasks as extraction_tasks
+from ..config import get_settings
+from ..csv_labels import CSVLabelError, ingest_csv, labels_db_path
+from ..database import AsyncSessionLocal, get_db
+from ..dataset_index import add_files, remove_paths
 from ..models import Dataset
-from ..dataset_utils import get_dataset_path, count_dataset_files, count_total_dataset_items
+from ..upload_store import (
+    UPLOAD_CHUNK_SIZE,
+    OffsetMismatchError,
+    UploadIncompleteError,
+    StoredFile,
+    UploadSession,
+    UploadTooLargeError,
+    abort_session,
+    append_chunk,
+    complete_session,
+    create_session,
+    expire_sessions,
+    linked_blobs,
+    load_session,
+    place_blob,
+    release_blobs,
+    store_upload,
+)
+from ..dataset_utils import (
+    ALL_SUPPORTED_FORMATS,
+    SUPPORTED_ARCHIVE_FORMATS,
+    SUPPORTED_AUDIO_FORMATS,
+    SUPPORTED_CSV_FORMATS,
+    SUPPORTED_IMAGE_FORMATS,
+    SUPPORTED_VIDEO_FORMATS,
+    get_file_type,
+)
 
 router = APIRouter(prefix="/uploads", tags=["uploads"])
 
-# CSV parsing configuration
-CSV_ENCODINGS_TO_TRY = ['utf-8', 'utf-8-sig', 'latin-1', 'cp1252', 'iso-8859-1', 'ascii']
-CSV_IMAGE_COLUMN_NAMES = ['image', 'filename', 'file', 'img', 'path', 'image_path', 'file_name']
-CSV_LABEL_COLUMN_NAMES = ['label', 'class', 'category', 'tag', 'description', 'caption', 'text']
-
-# Supported file extensions
-SUPPORTED_IMAGE_FORMATS = {
-    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.tiff', '.tif', 
-    '.ico', '.svg', '.heic', '.heif', '.avif', '.jfif'
-}
-
-SUPPORTED_VIDEO_FORMATS = {
-    '.mp4', '.avi', '.mov', '.mkv', '.webm', '.flv', '.wmv', '.m4v',
-    '.mpg', '.mpeg', '.3gp', '.ogv', '.vob', '.mts', '.m2ts'
-}
-
-SUPPORTED_AUDIO_FORMATS = {
-    '.wav', '.mp3', '.aac', '.flac', '.ogg', '.m4a', '.wma', '.opus'
-}
-
-SUPPORTED_ARCHIVE_FORMATS = {
-    '.zip', '.rar', '.7z', '.tar', '.gz', '.bz2', '.xz'
-}
-
-SUPPORTED_CSV_FORMATS = {
-    '.csv', '.tsv', '.txt'
-}
-
-ALL_SUPPORTED_FORMATS = (
-    SUPPORTED_IMAGE_FORMATS | 
-    SUPPORTED_VIDEO_FORMATS | 
-    SUPPORTED_AUDIO_FORMATS | 
-    SUPPORTED_ARCHIVE_FORMATS |
-    SUPPORTED_CSV_FORMATS
-)
+# Archive members kept on extraction (nested archives are not unpacked)
+EXTRACTABLE_FORMATS = ALL_SUPPORTED_FORMATS - SUPPORTED_ARCHIVE_FORMATS
 
 # Upload directory
 UPLOAD_DIR = Path("uploads")
@@ -66,124 +60,40 @@ class FileUploadResponse(BaseModel):
     size: int
     type: str
     extracted_files: List[str] = []
+    extraction: Optional[Dict] = None  # background extraction summary; poll /uploads/extractions/{task_id}
     csv_data: Optional[Dict] = None
+    sha256: Optional[str] = None
     error: str | None = None
 
 
-def get_file_type(filename: str) -> str:
-    """Determine file type based on extension."""
-    ext = Path(filename).suffix.lower()
-    if ext in SUPPORTED_IMAGE_FORMATS:
-        return "image"
-    elif ext in SUPPORTED_VIDEO_FORMATS:
-        return "video"
-    elif ext in SUPPORTED_AUDIO_FORMATS:
-        return "audio"
-    elif ext in SUPPORTED_ARCHIVE_FORMATS:
-        return "archive"
-    elif ext in SUPPORTED_CSV_FORMATS:
-        return "csv"
-    else:
-        return "other"
-
-
-def extract_archive(archive_path: Path, extract_to: Path) -> List[str]:
-    """Extract archive and return list of extracted files."""
-    extracted_files = []
-    extract_to.mkdir(parents=True, exist_ok=True)
-    
-    try:
-        if archive_path.suffix.lower() == '.zip':
-            with zipfile.ZipFile(archive_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_to)
-                extracted_files = zip_ref.namelist()
-        elif archive_path.suffix.lower() in {'.tar', '.gz', '.bz2', '.xz'}:
-            with tarfile.open(archive_path, 'r:*') as tar_ref:
-                tar_ref.extractall(extract_to)
-                extracted_files = tar_ref.getnames()
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to extract archive: {str(e)}")
-    
-    return extracted_files
+class UploadSessionCreate(BaseModel):
+    """Start a resumable upload."""
+    filename: str
+    size: Optional[int] = None  # total bytes, if known; enables completeness checks
+    dataset_id: Optional[int] = None
+    extract_archives: bool = True
 
 
-def parse_csv_file(csv_path: Path) -> Dict[str, Any]:
-    """Parse CSV file and extract image-label mappings."""
-    # Try different encodings in order of likelihood
-    for encoding in CSV_ENCODINGS_TO_TRY:
-        try:
-            with open(csv_path, 'r', encoding=encoding) as f:
-                # Try to detect delimiter
-                sample = f.read(1024)
-                f.seek(0)
-                sniffer = csv.Sniffer()
-                try:
-                    delimiter = sniffer.sniff(sample).delimiter
-                except csv.Error:
-                    delimiter = ','
-                
-                reader = csv.DictReader(f, delimiter=delimiter)
-                rows = list(reader)
-                
-                # Try to identify image and label columns
-                image_label_map = {}
-                image_col = None
-                label_col = None
-                
-                if len(rows) > 0:
-                    columns = list(rows[0].keys())
-                    
-                    # Find image column using configured names
-                    for col in columns:
-                        if col.lower() in CSV_IMAGE_COLUMN_NAMES:
-                            image_col = col
-                            break
-                    if not image_col:
-                        image_col = columns[0]  # Default to first column
-                    
-                    # Find label column using configured names
-                    for col in columns:
-                        if col.lower() in CSV_LABEL_COLUMN_NAMES:
-                            label_col = col
-                            break
-                    if not label_col and len(columns) > 1:
-                        label_col = columns[1]  # Default to second column
-                    
-                    # Build mapping
-                    for row in rows:
-                        if image_col in row and label_col in row:
-                            image_name = row[image_col]
-                            label = row[label_col]
-                            if image_name and label:
-                                image_label_map[image_name] = label
-                
-                return {
-                    'total_rows': len(rows),
-                    'image_column': image_col,
-                    'label_column': label_col,
-                    'mappings': image_label_map,
-                    'columns': list(rows[0].keys()) if rows else [],
-                    'encoding': encoding
-                }
-        except (UnicodeDecodeError, UnicodeError):
-            # Try next encoding
-            continue
-        except csv.Error as e:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"CSV parsing error: {str(e)}. Please ensure your CSV file is properly formatted with consistent delimiters and quoted fields."
-            )
-        except Exception as e:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Failed to parse CSV: {str(e)}. Common issues: invalid file format, corrupted file, or unsupported CSV structure."
-            )
-    
-    # If all encodings failed
-    raise HTTPException(
-        status_code=400, 
-        detail="Failed to decode CSV file. Please ensure the file is a valid CSV with UTF-8 or common encoding."
-    )
+class UploadSessionStatus(BaseModel):
+    """State of a resumable upload; ``offset`` is where the next chunk must start."""
+    upload_id: str
+    filename: str
+    offset: int
+    size: Optional[int] = None
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+
+
+async def parse_csv_file(csv_path: Path) -> Dict[str, Any]:
+    """Parse a CSV file into its indexed label store and return a summary."""
+    try:
+        return await asyncio.to_thread(ingest_csv, csv_path)
+    except CSVLabelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Failed to parse CSV: {str(e)}. Common issues: invalid file format, corrupted file, or unsupported CSV structure."
+        )
 
 
 @router.post("/", response_model=FileUploadResponse)
@@ -197,105 +107,115 @@ async def upload_file(
     Upload a file. Supports images, videos, audio, archives, and CSV files.
     
     If the file is an archive and extract_archives is True,
-    it will be automatically extracted.
+    it will be extracted in the background (see /uploads/extractions/{task_id}).
     
     If the file is a CSV, it will be parsed for image-label mappings.
+    
+    Content is stored once by hash; re-uploading an identical file returns
+    the existing path instead of creating a numbered copy.
     """
-    # Check file extension
-    file_ext = Path(file.filename).suffix.lower()
+    file_type = check_file_type(file.filename)
+    type_dir = get_type_dir(file_type, dataset_id)
+    
+    # Stream into the content-addressed store (constant memory, size limit enforced while writing)
+    max_bytes = get_settings().max_upload_mb * 1024 * 1024
+    try:
+        stored = await store_upload(file, max_bytes)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+    
+    return await finish_upload(file.filename, stored, file_type, type_dir, extract_archives, dataset_id, db)
+
+
+def check_file_type(filename: str) -> str:
+    """Reject unsupported extensions and return the file type."""
+    file_ext = Path(filename).suffix.lower()
     if file_ext not in ALL_SUPPORTED_FORMATS:
         raise HTTPException(
             status_code=400,
             detail=f"Unsupported file type: {file_ext}. Supported formats: {', '.join(sorted(ALL_SUPPORTED_FORMATS))}"
         )
-    
-    # Determine file type
-    file_type = get_file_type(file.filename)
-    
-    # Create type-specific directory
+    return get_file_type(filename)
+
+
+def get_type_dir(file_type: str, dataset_id: Optional[int]) -> Path:
+    """Type-specific upload directory, organized by dataset if given."""
     type_dir = UPLOAD_DIR / file_type
     type_dir.mkdir(exist_ok=True)
-    
-    # If dataset_id is provided, organize by dataset
     if dataset_id:
         type_dir = type_dir / f"dataset_{dataset_id}"
         type_dir.mkdir(exist_ok=True)
+    return type_dir
+
+
+async def finish_upload(
+    filename: str,
+    stored: StoredFile,
+    file_type: str,
+    type_dir: Path,
+    extract_archives: bool,
+    dataset_id: Optional[int],
+    db: AsyncSession,
+) -> FileUploadResponse:
+    """Link stored content into the upload directory and post-process it."""
+    # Identical content already uploaded under this name is reused instead of stored again
+    file_path = place_blob(stored.path, type_dir, filename)
     
-    # Save file
-    file_path = type_dir / file.filename
-    
-    # Handle duplicate filenames
-    counter = 1
-    original_path = file_path
-    while file_path.exists():
-        stem = original_path.stem
-        suffix = original_path.suffix
-        file_path = type_dir / f"{stem}_{counter}{suffix}"
-        counter += 1
-    
-    # Write file
-    try:
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        file_size = len(content)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
-    
-    # Extract archives if requested
-    extracted_files = []
+    # Extract archives in the background if requested
+    extraction = None
     if file_type == "archive" and extract_archives:
         extract_dir = type_dir / file_path.stem
-        extracted_files = extract_archive(file_path, extract_dir)
+        
+        async def after_extraction(task: ExtractionTask) -> None:
+            if dataset_id:
+                async with AsyncSessionLocal() as session:
+                    await index_dataset_files(dataset_id, list(task.hashes), session, task.hashes)
+        
+        extraction = start_extraction(file_path, extract_dir, EXTRACTABLE_FORMATS, after_extraction).summary()
     
     # Parse CSV files
     csv_data = None
     if file_type == "csv":
-        csv_data = parse_csv_file(file_path)
+        csv_data = await parse_csv_file(file_path)
         
-        # Save CSV metadata
+        # Save CSV summary; the full mapping lives in the .labels.db next to it
         metadata_path = file_path.with_suffix('.json')
         with open(metadata_path, 'w') as f:
             json.dump(csv_data, f, indent=2)
     
-    # Update dataset item count if dataset_id is provided
+    # Index the file and update the dataset counters if dataset_id is provided
     if dataset_id:
-        await update_dataset_count(dataset_id, db)
+        await index_dataset_files(dataset_id, [file_path], db, {str(file_path): stored.sha256})
     
     return FileUploadResponse(
-        filename=file.filename,
+        filename=filename,
         path=str(file_path),
-        size=file_size,
+        size=stored.size,
         type=file_type,
-        extracted_files=extracted_files,
-        csv_data=csv_data
+        extraction=extraction,
+        csv_data=csv_data,
+        sha256=stored.sha256,
     )
 
 
-async def update_dataset_count(dataset_id: int, db: AsyncSession):
-    """Update dataset item count by counting files in the dataset directory."""
+async def index_dataset_files(
+    dataset_id: int,
+    paths: List[Path],
+    db: AsyncSession,
+    hashes: Optional[Dict[str, str]] = None,
+):
+    """Add new files to the dataset index, updating num_items and the storage aggregates."""
     # Verify dataset exists
-    result = await db.execute(select(Dataset).where(Dataset.id == dataset_id))
-    dataset = result.scalar_one_or_none()
-    
-    if not dataset:
+    result = await db.execute(select(Dataset.id).where(Dataset.id == dataset_id))
+    if result.scalar_one_or_none() is None:
         # Log warning but don't fail the upload
         import logging
         logging.warning(f"Dataset {dataset_id} not found when updating count")
         return
     
-    # Count files in dataset directory using utility functions
-    file_count = count_total_dataset_items(dataset_id)
-    
-    # Update database
-    stmt = (
-        update(Dataset)
-        .where(Dataset.id == dataset_id)
-        .values(num_items=file_count, updated_at=datetime.utcnow())
-    )
-    await db.execute(stmt)
-    await db.commit()
+    await add_files(db, dataset_id, paths, hashes)
 
 
 @router.post("/batch", response_model=List[FileUploadResponse])
@@ -342,20 +262,136 @@ async def get_supported_formats() -> dict:
     }
 
 
+@router.get("/extractions/{task_id}")
+async def get_extraction_status(task_id: str) -> dict:
+    """Get progress of a background archive extraction."""
+    task = extraction_tasks.get(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Extraction task not found")
+    return task.summary()
+
+
+def session_status(session: UploadSession) -> UploadSessionStatus:
+    return UploadSessionStatus(
+        upload_id=session.id,
+        filename=session.filename,
+        offset=session.offset,
+        size=session.size,
+    )
+
+
+def get_session_or_404(upload_id: str) -> UploadSession:
+    session = load_session(upload_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+
+@router.post("/sessions", response_model=UploadSessionStatus)
+async def create_upload_session(payload: UploadSessionCreate) -> UploadSessionStatus:
+    """
+    Start a resumable upload.
+    
+    Send the file with PUT /uploads/sessions/{upload_id}?offset=N (raw body,
+    any number of chunks), then POST /uploads/sessions/{upload_id}/complete.
+    After a dropped connection, GET the session to find the offset to resume from.
+    """
+    check_file_type(payload.filename)
+    settings = get_settings()
+    expire_sessions(settings.upload_session_ttl_hours * 3600)
+    try:
+        session = create_session(
+            Path(payload.filename).name,
+            payload.size,
+            payload.dataset_id,
+            payload.extract_archives,
+            settings.max_upload_mb * 1024 * 1024,
+        )
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return session_status(session)
+
+
+@router.get("/sessions/{upload_id}", response_model=UploadSessionStatus)
+async def get_upload_session(upload_id: str) -> UploadSessionStatus:
+    """Get the number of bytes received so far."""
+    return session_status(get_session_or_404(upload_id))
+
+
+@router.put("/sessions/{upload_id}", response_model=UploadSessionStatus)
+async def append_upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0, description="Byte offset of this chunk; must equal the bytes received so far"),
+) -> UploadSessionStatus:
+    """Append the request body to a resumable upload."""
+    session = get_session_or_404(upload_id)
+    try:
+        await append_chunk(session, offset, request.stream(), get_settings().max_upload_mb * 1024 * 1024)
+    except OffsetMismatchError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "offset": e.expected})
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return session_status(session)
+
+
+@router.post("/sessions/{upload_id}/complete", response_model=FileUploadResponse)
+async def complete_upload_session(
+    upload_id: str,
+    sha256: Optional[str] = Query(None, description="Expected SHA-256 of the whole file"),
+    db: AsyncSession = Depends(get_db)
+) -> FileUploadResponse:
+    """Finish a resumable upload and process it like a regular upload."""
+    session = get_session_or_404(upload_id)
+    try:
+        stored = await complete_session(session, sha256)
+    except UploadIncompleteError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    file_type = get_file_type(session.filename)
+    type_dir = get_type_dir(file_type, session.dataset_id)
+    return await finish_upload(
+        session.filename, stored, file_type, type_dir, session.extract_archives, session.dataset_id, db
+    )
+
+
+@router.delete("/sessions/{upload_id}")
+async def abort_upload_session(upload_id: str) -> dict:
+    """Abort a resumable upload and discard the received data."""
+    get_session_or_404(upload_id)
+    abort_session(upload_id)
+    return {"status": "aborted", "upload_id": upload_id}
+
+
 @router.delete("/{file_path:path}")
-async def delete_file(file_path: str) -> dict:
+async def delete_file(file_path: str, db: AsyncSession = Depends(get_db)) -> dict:
     """Delete an uploaded file."""
+    # Hidden entries (partial uploads, label stores) and ".." are not the client's to delete
+    relative = Path(file_path)
+    if not file_path or relative.is_absolute() or any(part.startswith(".") for part in relative.parts):
+        raise HTTPException(status_code=400, detail="Invalid file path")
     full_path = UPLOAD_DIR / file_path
     
     if not full_path.exists():
         raise HTTPException(status_code=404, detail="File not found")
     
+    # Store content only this path links to, released once it is gone
+    blobs = await asyncio.to_thread(linked_blobs, [full_path])
+    
     try:
         if full_path.is_file():
             full_path.unlink()
+            if full_path.suffix.lower() in SUPPORTED_CSV_FORMATS:
+                labels_db_path(full_path).unlink(missing_ok=True)
         elif full_path.is_dir():
             shutil.rmtree(full_path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete file: {str(e)}")
     
+    # Keep the dataset index and counters in step
+    await remove_paths(db, [full_path])
+    
+    # Drop stored content that is no longer linked from anywhere
+    await asyncio.to_thread(release_blobs, blobs)
+    
     return {"status": "deleted", "path": file_path}
@@ -0,0 +1,64 @@
+"""
+Scheduler registry for diffusion pipelines.
+
+Maps the ``scheduler`` names accepted by the generation API to diffusers
+scheduler classes, and resolves the "fast" quality tier to a few-step solver
+configuration for interactive previews.
+"""
+from typing import Any, Dict, Tuple
+
+# name -> (diffusers class name, extra config overrides)
+SCHEDULER_REGISTRY: Dict[str, Tuple[str, Dict[str, Any]]] = {
+    "ddim": ("DDIMScheduler", {}),
+    "pndm": ("PNDMScheduler", {}),
+    "lms": ("LMSDiscreteScheduler", {}),
+    "euler": ("EulerDiscreteScheduler", {}),
+    "euler_a": ("EulerAncestralDiscreteScheduler", {}),
+    "heun": ("HeunDiscreteScheduler", {}),
+    "dpmpp_2m": ("DPMSolverMultistepScheduler", {}),
+    "dpmpp_2m_karras": ("DPMSolverMultistepScheduler", {"use_karras_sigmas": True}),
+    "dpmpp_sde": ("DPMSolverMultistepScheduler", {"algorithm_type": "sde-dpmsolver++"}),
+    "dpm_singlestep": ("DPMSolverSinglestepScheduler", {}),
+    "unipc": ("UniPCMultistepScheduler", {}),
+}
+
+DEFAULT_SCHEDULER = "dpmpp_2m"
+
+# Few-step solver used by the "fast" tier and its step budget
+FAST_SCHEDULER = "dpmpp_2m_karras"
+FAST_STEP_RATIO = 0.3
+FAST_MIN_STEPS = 6
+FAST_MAX_STEPS = 12
+
+
+def normalize_scheduler_name(name: str | None) -> str:
+    """Return the registry key for a scheduler name, or raise ValueError."""
+    if not name:
+        return DEFAULT_SCHEDULER
+    key = name.strip().lower().replace("-", "_").replace("+", "p")
+    if key not in SCHEDULER_REGISTRY:
+        raise ValueError(
+            f"Unknown scheduler: {name}. Available: {', '.join(sorted(SCHEDULER_REGISTRY))}"
+        )
+    return key
+
+
+def resolve_sampling(scheduler: str | None, steps: int, quality: str = "standard") -> Tuple[str, int]:
+    """Pick the scheduler and step count for a request.
+
+    The "fast" tier swaps in a multistep solver that converges in few steps
+    and scales the requested step count down to that solver's budget.
+    """
+    if quality == "fast":
+        fast_steps = round(steps * FAST_STEP_RATIO)
+        return FAST_SCHEDULER, min(steps, max(FAST_MIN_STEPS, min(FAST_MAX_STEPS, fast_steps)))
+    return normalize_scheduler_name(scheduler), steps
+
+
+def build_scheduler(name: str, base_config):
+    """Instantiate a registered scheduler from a pipeline's scheduler config."""
+    import diffusers
+
+    class_name, overrides = SCHEDULER_REGISTRY[name]
+    scheduler_cls = getattr(diffusers, class_name)
+    return scheduler_cls.from_config(base_config, **overrides)
@@ -4,6 +4,8 @@ from typing import Dict, List, Optional, Any
 
 from pydantic import BaseModel, Field, validator
 
+from .schedulers import normalize_scheduler_name
+
 
 # ============= Enums =============
 
@@ -15,11 +17,13 @@ class JobType(str, Enum):
     inpainting = "inpainting"
     outpainting = "outpainting"
     upscale = "upscale"
+    preview_refine = "preview_refine"
 
 
 class JobStatus(str, Enum):
     pending = "pending"
     running = "running"
+    preview_ready = "preview_ready"
     done = "done"
     failed = "failed"
 
@@ -42,6 +46,11 @@ class StylePreset(str, Enum):
     music_video = "music_video"
 
 
+class QualityTier(str, Enum):
+    standard = "standard"
+    fast = "fast"
+
+
 class CameraMovement(str, Enum):
     static = "static"
     pan_left = "pan_left"
@@ -67,6 +76,9 @@ class TextToImageRequest(BaseModel):
     cfg_scale: float = Field(7.5, ge=0.0, le=20.0)
     steps: int = Field(30, ge=1, le=200)
     scheduler: Optional[str] = Field("ddim", description="Sampling scheduler name")
+    quality: QualityTier = Field(
+        QualityTier.standard, description="'fast' uses a few-step solver for quick previews"
+    )
     seed: Optional[int] = Field(None, ge=0)
     model: str = Field("stable-diffusion-1.5", description="Model identifier")
     style_preset: Optional[StylePreset] = Field(None, description="Named style preset")
@@ -80,6 +92,25 @@ class TextToImageRequest(BaseModel):
             raise ValueError("prompt must not be empty")
         return cleaned
 
+    @validator("scheduler")
+    def validate_scheduler(cls, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return value
+        return normalize_scheduler_name(value)
+
+
+class PreviewRefineRequest(TextToImageRequest):
+    preview_scale: float = Field(0.5, ge=0.125, le=1.0, description="Preview size relative to width/height")
+    auto_refine_after: Optional[float] = Field(
+        10.0, ge=0.0, le=3600.0,
+        description="Seconds before the first preview is refined automatically; null waits for confirmation",
+    )
+    refine_strength: float = Field(0.5, ge=0.05, le=1.0, description="img2img strength of the refine pass")
+
+
+class RefineRequest(BaseModel):
+    index: int = Field(0, ge=0, description="Index of the preview to refine")
+
 
 class TextToVideoRequest(BaseModel):
     prompt: str = Field(..., description="Main text prompt for video")
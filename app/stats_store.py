@@ -0,0 +1,198 @@
+"""
+Incrementally maintained monitoring aggregates.
+
+The monitoring dashboard used to recompute everything from the ``jobs`` table
+on every request. ``StatsStore`` keeps the same numbers as running totals,
+updated on each job state transition and on dataset/training job creation,
+plus per-minute and per-hour rollup buckets. Reading the dashboard is O(1)
+regardless of history size; the database is only scanned once, at startup,
+to pick up history recorded before the process started.
+"""
+import logging
+from collections import Counter, deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MINUTE_BUCKETS = 24 * 60  # last 24 hours at 1-minute resolution
+HOUR_BUCKETS = 7 * 24  # last 7 days at 1-hour resolution
+RECENT_ACTIVITY = 10
+
+# JobQueue statuses mapped to the names used by the monitoring API
+STATUS_ALIASES = {"done": "completed"}
+
+
+def job_category(job_type: str) -> str:
+    """Classify a job type as image, video or workflow (dashboard grouping)."""
+    if "video" in job_type:
+        return "video"
+    if "image" in job_type or job_type in ("inpainting", "outpainting", "upscale", "preview_refine"):
+        return "image"
+    return "workflow"
+
+
+class RollupBucket:
+    """Aggregates for one time bucket."""
+
+    __slots__ = ("start", "created", "completed", "failed", "duration_sum", "duration_count", "presets")
+
+    def __init__(self, start: datetime):
+        self.start = start
+        self.created = 0
+        self.completed = 0
+        self.failed = 0
+        self.duration_sum = 0.0
+        self.duration_count = 0
+        self.presets: Counter = Counter()
+
+    def to_dict(self) -> dict:
+        return {
+            "start": self.start.isoformat(),
+            "created": self.created,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_duration": self.duration_sum / self.duration_count if self.duration_count else 0.0,
+            "presets": dict(self.presets),
+        }
+
+
+class StatsStore:
+    """Running totals and rollup buckets for jobs and platform entities."""
+
+    def __init__(self, minute_buckets: int = MINUTE_BUCKETS, hour_buckets: int = HOUR_BUCKETS):
+        self.version = 0  # bumped on every change; used to invalidate cached responses
+        self.status_counts: Counter = Counter()
+        self.total_jobs = 0
+        self.duration_sum = 0.0
+        self.duration_count = 0
+        self.preset_counts: Counter = Counter()
+        self.entity_counts: Counter = Counter()
+        self.recent: Deque[dict] = deque(maxlen=RECENT_ACTIVITY)
+        self.minutes: Deque[RollupBucket] = deque(maxlen=minute_buckets)
+        self.hours: Deque[RollupBucket] = deque(maxlen=hour_buckets)
+
+    def _buckets(self, when: datetime) -> List[RollupBucket]:
+        buckets = []
+        for series, start in (
+            (self.minutes, when.replace(second=0, microsecond=0)),
+            (self.hours, when.replace(minute=0, second=0, microsecond=0)),
+        ):
+            if not series or series[-1].start < start:
+                series.append(RollupBucket(start))
+            buckets.append(series[-1])
+        return buckets
+
+    def record_transition(
+        self,
+        job_type: str,
+        old_status: Optional[str],
+        new_status: str,
+        duration: Optional[float] = None,
+        preset: Optional[str] = None,
+        when: Optional[datetime] = None,
+    ) -> None:
+        """Apply a job status change (``old_status`` is None for new jobs)."""
+        when = when or datetime.utcnow()
+        self.version += 1
+        old_status = STATUS_ALIASES.get(old_status, old_status)
+        new_status = STATUS_ALIASES.get(new_status, new_status)
+
+        if old_status is not None and self.status_counts[old_status] > 0:
+            self.status_counts[old_status] -= 1
+        self.status_counts[new_status] += 1
+
+        buckets = self._buckets(when)
+        if old_status is None:
+            self.total_jobs += 1
+            if "workflow" in job_type:
+                self.entity_counts["workflows"] += 1
+            for bucket in buckets:
+                bucket.created += 1
+        elif new_status == "completed":
+            preset = preset or "Custom"
+            self.preset_counts[preset] += 1
+            if duration is not None and duration > 0:
+                self.duration_sum += duration
+                self.duration_count += 1
+            for bucket in buckets:
+                bucket.completed += 1
+                bucket.presets[preset] += 1
+                if duration is not None and duration > 0:
+                    bucket.duration_sum += duration
+                    bucket.duration_count += 1
+        elif new_status == "failed":
+            for bucket in buckets:
+                bucket.failed += 1
+
+        self.recent.appendleft({"type": job_category(job_type), "status": new_status, "updated_at": when})
+
+    def adjust(self, entity: str, delta: int = 1) -> None:
+        """Change an entity counter (datasets, training_jobs, assets_image, ...)."""
+        self.version += 1
+        self.entity_counts[entity] = max(0, self.entity_counts[entity] + delta)
+
+    @property
+    def avg_generation_time(self) -> float:
+        return self.duration_sum / self.duration_count if self.duration_count else 0.0
+
+    def popular_presets(self, limit: int = 5) -> List[dict]:
+        return [{"name": name, "usage": count} for name, count in self.preset_counts.most_common(limit)]
+
+    def series(self, resolution: str = "minute", limit: int = 60) -> List[dict]:
+        buckets = self.minutes if resolution == "minute" else self.hours
+        return [bucket.to_dict() for bucket in list(buckets)[-limit:]]
+
+    async def bootstrap(self, db) -> None:
+        """Load totals for history already in the database (one pass at startup)."""
+        from sqlalchemy import func, select
+
+        from .models import Asset, Dataset, Job, TrainingJob
+
+        rows = await db.execute(select(Job.status, func.count(Job.id)).group_by(Job.status))
+        for status, count in rows.all():
+            status = STATUS_ALIASES.get(status, status)
+            self.status_counts[status] += count
+            self.total_jobs += count
+
+        duration = func.sum((func.julianday(Job.updated_at) - func.julianday(Job.created_at)) * 86400.0)
+        row = (await db.execute(
+            select(duration, func.count(Job.id)).where(
+                Job.status.in_(("completed", "done")), Job.updated_at > Job.created_at
+            )
+        )).one()
+        self.duration_sum += row[0] or 0.0
+        self.duration_count += row[1] or 0
+
+        preset = func.coalesce(func.json_extract(Job.params, "$.preset"), "Custom")
+        rows = await db.execute(
+            select(preset, func.count(Job.id)).where(Job.status.in_(("completed", "done"))).group_by(preset)
+        )
+        for name, count in rows.all():
+            self.preset_counts[name] += count
+
+        for entity, query in (
+            ("assets", select(func.count(Asset.id))),
+            ("assets_image", select(func.count(Asset.id)).where(Asset.type == "image")),
+            ("assets_video", select(func.count(Asset.id)).where(Asset.type == "video")),
+            ("workflows", select(func.count(Job.id)).where(Job.type.like("%workflow%"))),
+            ("datasets", select(func.count(Dataset.id))),
+            ("training_jobs", select(func.count(TrainingJob.id))),
+        ):
+            self.entity_counts[entity] += (await db.execute(query)).scalar() or 0
+
+        recent = await db.execute(
+            select(Job.type, Job.status, Job.updated_at).order_by(Job.updated_at.desc()).limit(RECENT_ACTIVITY)
+        )
+        for job_type, status, updated_at in reversed(recent.all()):
+            self.recent.appendleft({
+                "type": job_category(job_type),
+                "status": STATUS_ALIASES.get(status, status),
+                "updated_at": updated_at,
+            })
+
+        self.version += 1
+        logger.info(f"Monitoring aggregates loaded: {self.total_jobs} job(s) in history")
+
+
+stats_store = StatsStore()
@@ -0,0 +1,216 @@
+"""
+Embedded time-series store for monitoring history.
+
+Fixed-resolution buckets (one minute by default) live in a ring buffer of
+float64 records backed by a memory-mapped file, so memory and disk usage are
+bounded by ``capacity`` and history survives restarts. Each bucket holds job
+throughput and error counters, queue depth samples and two latency
+histograms (HTTP requests and job durations) from which percentiles are
+estimated at query time.
+"""
+import logging
+import mmap
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MAGIC = 0x5453_4442  # "TSDB"
+LAYOUT_VERSION = 1
+HEADER_FIELDS = 4  # magic, layout version, resolution, capacity
+
+# Upper edges (seconds) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_EDGES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+HIST_SIZE = len(LATENCY_EDGES) + 1
+
+COUNTER_FIELDS = (
+    "slot",  # absolute bucket number (epoch // resolution) currently stored in this record
+    "jobs_created",
+    "jobs_completed",
+    "jobs_failed",
+    "requests",
+    "request_errors",
+    "queue_depth_sum",
+    "queue_depth_samples",
+    "queue_depth_max",
+)
+FIELD = {name: idx for idx, name in enumerate(COUNTER_FIELDS)}
+REQUEST_HIST = len(COUNTER_FIELDS)
+JOB_HIST = REQUEST_HIST + HIST_SIZE
+RECORD_SIZE = JOB_HIST + HIST_SIZE
+
+
+def _bucket_index(value: float) -> int:
+    for idx, edge in enumerate(LATENCY_EDGES):
+        if value <= edge:
+            return idx
+    return len(LATENCY_EDGES)
+
+
+def histogram_percentile(counts: List[float], pct: float) -> Optional[float]:
+    """Estimate a percentile (seconds) from histogram counts by linear interpolation."""
+    total = sum(counts)
+    if total <= 0:
+        return None
+    target = total * pct / 100
+    seen = 0.0
+    for idx, count in enumerate(counts):
+        if count and seen + count >= target:
+            lower = LATENCY_EDGES[idx - 1] if idx > 0 else 0.0
+            upper = LATENCY_EDGES[idx] if idx < len(LATENCY_EDGES) else LATENCY_EDGES[-1] * 2
+            return lower + (upper - lower) * (target - seen) / count
+        seen += count
+    return LATENCY_EDGES[-1]
+
+
+class TimeSeriesStore:
+    """Ring buffer of fixed-resolution metric buckets in a memory-mapped file."""
+
+    def __init__(self, path: Path, resolution: int = 60, capacity: int = 7 * 24 * 60):
+        self.path = Path(path)
+        self.resolution = resolution
+        self.capacity = capacity
+        self._open()
+
+    def _open(self) -> None:
+        size = (HEADER_FIELDS + self.capacity * RECORD_SIZE) * 8
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fresh = not self.path.exists() or self.path.stat().st_size != size
+        with open(self.path, "a+b") as f:
+            f.truncate(size)
+        self._file = open(self.path, "r+b")
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        self._data = memoryview(self._mmap).cast("d")
+
+        header = (MAGIC, LAYOUT_VERSION, self.resolution, self.capacity)
+        if fresh or tuple(self._data[:HEADER_FIELDS]) != tuple(float(v) for v in header):
+            # New file or incompatible layout/resolution: start an empty history
+            if not fresh:
+                logger.warning(f"Time-series file {self.path} has a different layout, resetting it")
+            self._data[:] = memoryview(bytes(size)).cast("d")
+            for idx, value in enumerate(header):
+                self._data[idx] = float(value)
+
+    def _offset(self, slot: int) -> int:
+        return HEADER_FIELDS + (slot % self.capacity) * RECORD_SIZE
+
+    def _record(self, now: Optional[float] = None) -> int:
+        """Offset of the current bucket, clearing it if it holds an older slot."""
+        slot = int((now if now is not None else time.time()) // self.resolution)
+        offset = self._offset(slot)
+        if self._data[offset + FIELD["slot"]] != slot:
+            for idx in range(RECORD_SIZE):
+                self._data[offset + idx] = 0.0
+            self._data[offset + FIELD["slot"]] = slot
+        return offset
+
+    # ---- recording -------------------------------------------------------
+
+    def record_request(self, duration: float, status_code: int) -> None:
+        offset = self._record()
+        self._data[offset + FIELD["requests"]] += 1
+        if status_code >= 500:
+            self._data[offset + FIELD["request_errors"]] += 1
+        self._data[offset + REQUEST_HIST + _bucket_index(duration)] += 1
+
+    def record_job(self, status: str, duration: Optional[float] = None) -> None:
+        """Record a job event: "created", "completed" (with duration) or "failed"."""
+        offset = self._record()
+        field = FIELD.get(f"jobs_{status}")
+        if field is not None:
+            self._data[offset + field] += 1
+        if status == "completed" and duration is not None:
+            self._data[offset + JOB_HIST + _bucket_index(duration)] += 1
+
+    def record_queue_depth(self, depth: int) -> None:
+        offset = self._record()
+        self._data[offset + FIELD["queue_depth_sum"]] += depth
+        self._data[offset + FIELD["queue_depth_samples"]] += 1
+        if depth > self._data[offset + FIELD["queue_depth_max"]]:
+            self._data[offset + FIELD["queue_depth_max"]] = depth
+
+    # ---- querying --------------------------------------------------------
+
+    def query(self, start: float, end: float, step: Optional[int] = None) -> List[Dict]:
+        """Return points between ``start`` and ``end`` (epoch seconds).
+
+        ``step`` (seconds, rounded to a multiple of the resolution) merges
+        consecutive buckets; buckets that were never written read as zero.
+        """
+        step_slots = max(1, int((step or self.resolution) // self.resolution))
+        first = int(start // self.resolution)
+        last = int(end // self.resolution)
+        # Only the most recent ``capacity`` slots are retained
+        current = int(time.time() // self.resolution)
+        first = max(first, current - self.capacity + 1)
+
+        points = []
+        for group_start in range(first, last + 1, step_slots):
+            merged = [0.0] * RECORD_SIZE
+            for slot in range(group_start, min(group_start + step_slots, last + 1)):
+                offset = self._offset(slot)
+                if self._data[offset + FIELD["slot"]] != slot:
+                    continue
+                for idx in range(1, RECORD_SIZE):
+                    if idx == FIELD["queue_depth_max"]:
+                        merged[idx] = max(merged[idx], self._data[offset + idx])
+                    else:
+                        merged[idx] += self._data[offset + idx]
+            points.append(self._point(group_start * self.resolution, step_slots * self.resolution, merged))
+        return points
+
+    @staticmethod
+    def _point(timestamp: float, duration: float, values: List[float]) -> Dict:
+        requests = values[FIELD["requests"]]
+        jobs_done = values[FIELD["jobs_completed"]] + values[FIELD["jobs_failed"]]
+        samples = values[FIELD["queue_depth_samples"]]
+        request_hist = values[REQUEST_HIST:JOB_HIST]
+        job_hist = values[JOB_HIST:RECORD_SIZE]
+
+        def ms(value: Optional[float]) -> Optional[float]:
+            return None if value is None else round(value * 1000, 2)
+
+        return {
+            "timestamp": timestamp,
+            "jobs_created": int(values[FIELD["jobs_created"]]),
+            "jobs_completed": int(values[FIELD["jobs_completed"]]),
+            "jobs_failed": int(values[FIELD["jobs_failed"]]),
+            "jobs_per_minute": round(values[FIELD["jobs_completed"]] * 60 / duration, 3),
+            "job_error_rate": round(values[FIELD["jobs_failed"]] / jobs_done, 4) if jobs_done else 0.0,
+            "job_duration_p50_ms": ms(histogram_percentile(job_hist, 50)),
+            "job_duration_p95_ms": ms(histogram_percentile(job_hist, 95)),
+            "requests": int(requests),
+            "request_error_rate": round(values[FIELD["request_errors"]] / requests, 4) if requests else 0.0,
+            "latency_p50_ms": ms(histogram_percentile(request_hist, 50)),
+            "latency_p95_ms": ms(histogram_percentile(request_hist, 95)),
+            "latency_p99_ms": ms(histogram_percentile(request_hist, 99)),
+            "queue_depth_avg": round(values[FIELD["queue_depth_sum"]] / samples, 2) if samples else 0.0,
+            "queue_depth_max": int(values[FIELD["queue_depth_max"]]),
+        }
+
+    def flush(self) -> None:
+        self._mmap.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self._data.release()
+        self._mmap.close()
+        self._file.close()
+
+
+_store: Optional[TimeSeriesStore] = None
+
+
+def get_timeseries_store() -> TimeSeriesStore:
+    """Get or create the global time-series store."""
+    global _store
+    if _store is None:
+        from .config import get_settings
+        settings = get_settings()
+        _store = TimeSeriesStore(
+            Path(settings.timeseries_path),
+            resolution=settings.timeseries_resolution,
+            capacity=max(1, settings.timeseries_retention_hours * 3600 // settings.timeseries_resolution),
+        )
+    return _store
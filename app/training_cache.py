@@ -0,0 +1,293 @@
+"""
+Preprocessed training cache.
+
+Decoding, resizing and VAE-encoding every image again on every epoch
+dominates the input cost of diffusion fine-tuning. This module runs that
+work once per (dataset, base model, resolution) and stores the results as
+``.npy`` arrays that training memory-maps:
+
+- ``pixels.npy``: center-cropped, resized images, uint8 (N, 3, R, R)
+- ``latents.npy``: scaled VAE latents, float16 (N, 4, R/8, R/8) for the SD VAEs
+- ``input_ids.npy``: tokenized captions, int32 (N, 77)
+
+A cache is keyed by a fingerprint of the dataset file index (paths and
+content hashes of its images) and of its CSV label stores, so any upload,
+deletion or relabelling invalidates it and the next run rebuilds it.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .csv_labels import LabelStore, find_label_stores
+from .dataset_utils import dataset_dirs
+from .models import DatasetFile
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_VERSION = 1
+MANIFEST = "manifest.json"
+TRAINABLE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+TOKEN_LENGTH = 77
+ENCODE_BATCH = 8
+
+_build_locks: Dict[str, asyncio.Lock] = {}
+
+
+def cache_root() -> Path:
+    from .config import get_settings
+
+    return Path(get_settings().training_cache_dir)
+
+
+def cache_dir(dataset_id: int, base_model: str, resolution: int) -> Path:
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "_", Path(base_model).name).strip("_") or "model"
+    digest = hashlib.sha1(base_model.encode()).hexdigest()[:8]
+    return cache_root() / f"dataset_{dataset_id}" / f"{slug}-{digest}_{resolution}"
+
+
+def drop_dataset_caches(dataset_id: int) -> None:
+    shutil.rmtree(cache_root() / f"dataset_{dataset_id}", ignore_errors=True)
+
+
+def read_manifest(directory: Path) -> Optional[dict]:
+    try:
+        return json.loads((directory / MANIFEST).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+async def dataset_fingerprint(db: AsyncSession, dataset_id: int, key: str) -> Tuple[str, List[str], List[Path]]:
+    """Fingerprint of a dataset's trainable images and labels, salted with ``key``.
+
+    Returns (fingerprint, image paths, label stores).
+    """
+    result = await db.execute(
+        select(DatasetFile.path, DatasetFile.sha256)
+        .where(
+            DatasetFile.dataset_id == dataset_id,
+            DatasetFile.file_type == "image",
+            DatasetFile.extension.in_(TRAINABLE_EXTENSIONS),
+            DatasetFile.is_corrupt.isnot(True),
+        )
+        .order_by(DatasetFile.path)
+    )
+    rows = result.all()
+    label_stores = find_label_stores(dataset_dirs(dataset_id))
+
+    digest = hashlib.sha256(f"{key}\n".encode())
+    for path, sha256 in rows:
+        digest.update(f"{path}\0{sha256}\n".encode())
+    for store in label_stores:
+        st = store.stat()
+        digest.update(f"{store}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return digest.hexdigest(), [path for path, _ in rows], label_stores
+
+
+def load_resized(path: str, resolution: int):
+    """Decode an image upright as RGB, center-crop it square and resize it; (3, R, R) uint8."""
+    import numpy as np
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as image:
+        image.draft("RGB", (resolution, resolution))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image = ImageOps.fit(image, (resolution, resolution), Image.BICUBIC)
+        return np.asarray(image, dtype=np.uint8).transpose(2, 0, 1)
+
+
+def _tokenize(base_model: str, captions: Sequence[str], out) -> bool:
+    try:
+        from transformers import CLIPTokenizer
+
+        tokenizer = CLIPTokenizer.from_pretrained(base_model, subfolder="tokenizer")
+    except Exception as e:
+        logger.warning(f"No tokenizer for {base_model}, caching captions as text only: {e}")
+        return False
+    for start in range(0, len(captions), 256):
+        batch = list(captions[start:start + 256])
+        out[start:start + len(batch)] = tokenizer(
+            batch, padding="max_length", truncation=True, max_length=TOKEN_LENGTH, return_tensors="np"
+        ).input_ids
+    return True
+
+
+def _encode_latents(base_model: str, pixels, path: Path, device: Optional[str]) -> Optional[Tuple[float, List[int]]]:
+    """VAE-encode cached pixels into a new array at ``path``.
+
+    Returns the VAE scaling factor and the latents shape, or None if no VAE is available.
+    """
+    try:
+        import torch
+        from diffusers import AutoencoderKL
+        from numpy.lib.format import open_memmap
+
+        device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        dtype = torch.float16 if device == "cuda" else torch.float32
+        vae = AutoencoderKL.from_pretrained(base_model, subfolder="vae", torch_dtype=dtype).to(device).eval()
+    except Exception as e:
+        logger.warning(f"No VAE for {base_model}, caching pixels only: {e}")
+        return None
+
+    scaling = float(getattr(vae.config, "scaling_factor", 0.18215))
+    # Each encoder block but the last halves the resolution (8x for the SD VAEs)
+    side = pixels.shape[-1] // 2 ** (len(vae.config.block_out_channels) - 1)
+    shape = [len(pixels), vae.config.latent_channels, side, side]
+    out = open_memmap(path, mode="w+", dtype="float16", shape=tuple(shape))
+    with torch.inference_mode():
+        for start in range(0, len(pixels), ENCODE_BATCH):
+            batch = torch.from_numpy(pixels[start:start + ENCODE_BATCH].copy()).to(device, dtype)
+            batch = batch / 127.5 - 1.0
+            latents = vae.encode(batch).latent_dist.mode() * scaling
+            out[start:start + len(batch)] = latents.to("cpu", torch.float16).numpy()
+    out.flush()
+    del vae, out
+    return scaling, shape
+
+
+def build_cache(directory: Path, paths: Sequence[str], captions: Sequence[str], base_model: str,
+                resolution: int, fingerprint: str, device: Optional[str] = None) -> dict:
+    """Preprocess ``paths`` into a cache at ``directory`` (blocking).
+
+    The cache is written next to its final location and swapped in once
+    complete, so a reader never sees a half-built cache.
+    """
+    import numpy as np
+    from numpy.lib.format import open_memmap
+
+    started = time.perf_counter()
+    building = directory.with_name(directory.name + ".building")
+    shutil.rmtree(building, ignore_errors=True)
+    building.mkdir(parents=True)
+
+    count = len(paths)
+    pixels = open_memmap(building / "pixels.npy", mode="w+", dtype=np.uint8,
+                         shape=(count, 3, resolution, resolution))
+    kept, kept_captions = [], []
+    for path, caption in zip(paths, captions):
+        try:
+            pixels[len(kept)] = load_resized(path, resolution)
+        except Exception as e:
+            logger.warning(f"Skipping {path} in training cache: {e}")
+            continue
+        kept.append(path)
+        kept_captions.append(caption)
+    pixels.flush()
+    del pixels
+    if not kept:
+        shutil.rmtree(building, ignore_errors=True)
+        raise ValueError("None of the dataset images could be decoded")
+    if len(kept) < count:
+        # Shrink to the images that decoded
+        full = np.load(building / "pixels.npy", mmap_mode="r")
+        trimmed = open_memmap(building / "pixels.tmp.npy", mode="w+", dtype=np.uint8,
+                              shape=(len(kept), 3, resolution, resolution))
+        trimmed[:] = full[:len(kept)]
+        trimmed.flush()
+        del full, trimmed
+        os.replace(building / "pixels.tmp.npy", building / "pixels.npy")
+
+    arrays = {"pixels": [len(kept), 3, resolution, resolution]}
+    input_ids = open_memmap(building / "input_ids.npy", mode="w+", dtype=np.int32, shape=(len(kept), TOKEN_LENGTH))
+    if _tokenize(base_model, kept_captions, input_ids):
+        input_ids.flush()
+        arrays["input_ids"] = [len(kept), TOKEN_LENGTH]
+        del input_ids
+    else:
+        del input_ids
+        (building / "input_ids.npy").unlink()
+
+    encoded = _encode_latents(base_model, np.load(building / "pixels.npy", mmap_mode="r"),
+                              building / "latents.npy", device)
+    scaling = None
+    if encoded is not None:
+        scaling, arrays["latents"] = encoded
+
+    manifest = {
+        "version": LAYOUT_VERSION,
+        "fingerprint": fingerprint,
+        "base_model": base_model,
+        "resolution": resolution,
+        "count": len(kept),
+        "paths": kept,
+        "captions": kept_captions,
+        "arrays": arrays,
+        "vae_scaling_factor": scaling,
+        "created_at": time.time(),
+    }
+    (building / MANIFEST).write_text(json.dumps(manifest))
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(building, directory)
+    logger.info(
+        f"Built training cache {directory} with {len(kept)} image(s) "
+        f"in {time.perf_counter() - started:.1f}s (latents: {'yes' if scaling else 'no'})"
+    )
+    return manifest
+
+
+class TrainingCache:
+    """Memory-mapped view of a built cache; indexing reads only the requested rows."""
+
+    def __init__(self, directory: Path):
+        import numpy as np
+
+        self.directory = directory
+        self.manifest = read_manifest(directory) or {}
+        self.paths: List[str] = self.manifest.get("paths", [])
+        self.captions: List[str] = self.manifest.get("captions", [])
+        arrays = self.manifest.get("arrays", {})
+        self.pixels = np.load(directory / "pixels.npy", mmap_mode="r")
+        self.latents = np.load(directory / "latents.npy", mmap_mode="r") if "latents" in arrays else None
+        self.input_ids = np.load(directory / "input_ids.npy", mmap_mode="r") if "input_ids" in arrays else None
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __getitem__(self, index: int) -> dict:
+        item = {"path": self.paths[index], "caption": self.captions[index], "pixel_values": self.pixels[index]}
+        if self.latents is not None:
+            item["latents"] = self.latents[index]
+        if self.input_ids is not None:
+            item["input_ids"] = self.input_ids[index]
+        return item
+
+
+def lookup_captions(paths: Sequence[str], label_stores: Sequence[Path], default: str = "") -> List[str]:
+    """CSV labels of ``paths`` by file name (blocking)."""
+    store = LabelStore(label_stores)
+    try:
+        return [store.get(Path(path).name) or default for path in paths]
+    finally:
+        store.close()
+
+
+async def prepare_training_cache(db: AsyncSession, dataset_id: int, base_model: str, resolution: int,
+                                 default_caption: str = "") -> Tuple[TrainingCache, bool]:
+    """Open the cache for a dataset/model/resolution, building it if missing or stale.
+
+    Returns (cache, rebuilt).
+    """
+    fingerprint, paths, label_stores = await dataset_fingerprint(
+        db, dataset_id, f"cache-v{LAYOUT_VERSION}\0{base_model}\0{resolution}"
+    )
+    if not paths:
+        raise ValueError(f"Dataset {dataset_id} has no indexed trainable images")
+    directory = cache_dir(dataset_id, base_model, resolution)
+    lock = _build_locks.setdefault(str(directory), asyncio.Lock())
+    async with lock:
+        manifest = read_manifest(directory)
+        rebuilt = not manifest or manifest.get("fingerprint") != fingerprint
+        if rebuilt:
+            captions = await asyncio.to_thread(lookup_captions, paths, label_stores, default_caption)
+            await asyncio.to_thread(build_cache, directory, paths, captions, base_model, resolution, fingerprint)
+        return TrainingCache(directory), rebuilt
@@ -0,0 +1,212 @@
+"""
+LoRA training checkpoints.
+
+A checkpoint is a directory ``checkpoint-<step>`` under the job's
+checkpoint root holding:
+
+- ``lora_weights.safetensors``: the adapter weights, loadable by diffusers
+- ``training_state.safetensors``: adapter weights in PEFT layout, optimizer
+  moments and the torch RNG state, everything needed to resume
+- ``checkpoint.json``: step, epoch, loss and the non-tensor state
+
+The training loop only snapshots tensors to CPU memory; ``CheckpointWriter``
+serializes and writes them on a background thread, so disk I/O overlaps
+with the next optimizer steps. Each checkpoint is written to a temporary
+directory and renamed into place, so a crash never leaves a partial one.
+After each write, the retention policy keeps the ``keep_last`` most recent
+and the ``keep_best`` lowest-loss checkpoints and deletes the rest.
+"""
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PATTERN = re.compile(r"^checkpoint-(\d+)$")
+LORA_FILE = "lora_weights.safetensors"
+STATE_FILE = "training_state.safetensors"
+META_FILE = "checkpoint.json"
+
+
+def checkpoint_name(step: int) -> str:
+    return f"checkpoint-{step:07d}"
+
+
+def list_checkpoints(root: Path) -> List[dict]:
+    """Complete checkpoints under ``root``, oldest first, with their metadata."""
+    checkpoints = []
+    if not root.is_dir():
+        return checkpoints
+    for entry in root.iterdir():
+        if not CHECKPOINT_PATTERN.match(entry.name):
+            continue
+        try:
+            meta = json.loads((entry / META_FILE).read_text())
+        except (OSError, ValueError):
+            continue  # incomplete or foreign directory
+        checkpoints.append({
+            "name": entry.name,
+            "path": str(entry),
+            "step": meta["step"],
+            "epoch": meta["epoch"],
+            "loss": meta.get("loss"),
+            "created_at": meta.get("created_at"),
+        })
+    checkpoints.sort(key=lambda checkpoint: checkpoint["step"])
+    return checkpoints
+
+
+def find_checkpoint(root: Path, name: Optional[str] = None) -> Optional[Path]:
+    """A checkpoint by name, or the latest one when ``name`` is None."""
+    checkpoints = list_checkpoints(root)
+    if name is None:
+        return Path(checkpoints[-1]["path"]) if checkpoints else None
+    for checkpoint in checkpoints:
+        if checkpoint["name"] == name:
+            return Path(checkpoint["path"])
+    return None
+
+
+def apply_retention(root: Path, keep_last: int, keep_best: int) -> List[str]:
+    """Delete checkpoints that are neither among the last ``keep_last`` nor the best ``keep_best``."""
+    checkpoints = list_checkpoints(root)
+    keep = {checkpoint["name"] for checkpoint in checkpoints[-max(1, keep_last):]}
+    ranked = sorted(
+        (checkpoint for checkpoint in checkpoints if checkpoint["loss"] is not None),
+        key=lambda checkpoint: checkpoint["loss"],
+    )
+    keep.update(checkpoint["name"] for checkpoint in ranked[:max(0, keep_best)])
+    removed = []
+    for checkpoint in checkpoints:
+        if checkpoint["name"] not in keep:
+            shutil.rmtree(checkpoint["path"], ignore_errors=True)
+            removed.append(checkpoint["name"])
+    return removed
+
+
+def snapshot_training_state(adapter_state: Dict[str, Any], optimizer, scaler=None) -> Tuple[Dict[str, Any], dict]:
+    """CPU copies of the resumable state: (tensors, JSON-serializable state).
+
+    Runs on the training thread; the copies are what make it safe for the
+    writer thread to serialize them while training continues.
+    """
+    import torch
+
+    def copy(tensor):
+        return tensor.detach().to("cpu", copy=True).contiguous()
+
+    tensors = {f"adapter.{key}": copy(value) for key, value in adapter_state.items()}
+    optimizer_state = optimizer.state_dict()
+    scalars: Dict[str, Dict[str, Any]] = {}
+    for index, state in optimizer_state["state"].items():
+        for name, value in state.items():
+            if torch.is_tensor(value):
+                tensors[f"optimizer.{index}.{name}"] = copy(value)
+            else:
+                scalars.setdefault(str(index), {})[name] = value
+    tensors["rng.torch"] = torch.get_rng_state()
+    state = {
+        "param_groups": optimizer_state["param_groups"],
+        "optimizer_scalars": scalars,
+        "scaler": scaler.state_dict() if scaler is not None and scaler.is_enabled() else None,
+    }
+    return tensors, state
+
+
+def load_training_state(directory: Path) -> Tuple[Dict[str, Any], dict, dict]:
+    """(adapter state, optimizer state dict, checkpoint metadata) of a checkpoint."""
+    from safetensors.torch import load_file
+
+    meta = json.loads((directory / META_FILE).read_text())
+    tensors = load_file(str(directory / STATE_FILE))
+    adapter = {key[len("adapter."):]: value for key, value in tensors.items() if key.startswith("adapter.")}
+    optimizer_state: Dict[int, Dict[str, Any]] = {}
+    for key, value in tensors.items():
+        if key.startswith("optimizer."):
+            _, index, name = key.split(".", 2)
+            optimizer_state.setdefault(int(index), {})[name] = value
+    for index, values in meta["state"]["optimizer_scalars"].items():
+        optimizer_state.setdefault(int(index), {}).update(values)
+    if "rng.torch" in tensors:
+        meta["rng_torch"] = tensors["rng.torch"]
+    return adapter, {"state": optimizer_state, "param_groups": meta["state"]["param_groups"]}, meta
+
+
+_CLOSE = object()
+
+
+class CheckpointWriter:
+    """Writes checkpoints on a background thread and applies the retention policy."""
+
+    def __init__(self, root: Path, keep_last: int = 3, keep_best: int = 1,
+                 on_saved: Optional[Callable[[dict], None]] = None):
+        self.root = Path(root)
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.on_saved = on_saved
+        self.errors: List[str] = []
+        # One checkpoint in flight: a slow disk applies back-pressure instead of piling up copies
+        self._queue: "queue.Queue" = queue.Queue(maxsize=1)
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def save(self, step: int, epoch: int, loss: Optional[float], lora: Dict[str, Any],
+             tensors: Dict[str, Any], state: dict, meta: dict) -> None:
+        """Queue a checkpoint of already-snapshotted tensors (blocks only while the previous one is written)."""
+        self._queue.put((step, epoch, loss, lora, tensors, state, meta))
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _CLOSE:
+                return
+            try:
+                self._write(*item)
+            except Exception as e:
+                logger.error(f"Writing checkpoint at step {item[0]} failed: {e}", exc_info=True)
+                self.errors.append(f"step {item[0]}: {e}")
+
+    def _write(self, step: int, epoch: int, loss: Optional[float], lora: Dict[str, Any],
+               tensors: Dict[str, Any], state: dict, meta: dict) -> None:
+        from safetensors.torch import save_file
+
+        started = time.perf_counter()
+        name = checkpoint_name(step)
+        target = self.root / name
+        partial = self.root / f".{name}.tmp"
+        shutil.rmtree(partial, ignore_errors=True)
+        partial.mkdir(parents=True)
+        save_file(lora, str(partial / LORA_FILE), metadata={"format": "pt"})
+        save_file(tensors, str(partial / STATE_FILE), metadata={"format": "pt"})
+        (partial / META_FILE).write_text(json.dumps({
+            "step": step,
+            "epoch": epoch,
+            "loss": loss,
+            "created_at": time.time(),
+            "state": state,
+            **meta,
+        }))
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(partial, target)
+        removed = apply_retention(self.root, self.keep_last, self.keep_best)
+        if self.on_saved is not None:
+            self.on_saved({
+                "name": name,
+                "path": str(target),
+                "step": step,
+                "loss": loss,
+                "seconds": time.perf_counter() - started,
+                "removed": removed,
+            })
+
+    def close(self) -> None:
+        """Wait for queued checkpoints to be written and stop the thread."""
+        self._queue.put(_CLOSE)
+        self._thread.join()
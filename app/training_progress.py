@@ -0,0 +1,137 @@
+"""
+Coalesced training progress and log persistence.
+
+The training loop reports progress and log lines to a ``ProgressPublisher``
+without touching the database. A background task writes what accumulated
+at most once per interval, in a single transaction on its own session:
+log lines are bulk-inserted into the append-only ``training_logs`` table,
+and only the latest progress snapshot is written to the job row. Progress
+updates in between are coalesced (last one wins).
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import TrainingJob, TrainingLog
+
+logger = logging.getLogger(__name__)
+
+URGENT_LEVELS = {"error", "success"}  # flushed right away
+
+
+class ProgressPublisher:
+    """Buffers one training job's progress and logs and persists them periodically."""
+
+    def __init__(self, job_id: str, interval: Optional[float] = None, session_factory=None):
+        if interval is None:
+            from .config import get_settings
+            interval = get_settings().training_progress_interval
+        if session_factory is None:
+            from .database import AsyncSessionLocal as session_factory
+
+        self.job_id = job_id
+        self.interval = interval
+        self.session_factory = session_factory
+        self._logs: List[Dict[str, Any]] = []
+        self._progress: Optional[Dict[str, Any]] = None
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._closed = False
+        self.writes = 0  # transactions issued, for diagnostics
+
+    def _ensure_running(self) -> None:
+        if not self._closed and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    def log(self, message: str, level: str = "info") -> None:
+        self._logs.append({
+            "job_id": self.job_id,
+            "timestamp": datetime.utcnow(),
+            "level": level,
+            "message": message,
+        })
+        self._ensure_running()
+        if level in URGENT_LEVELS:
+            self._wake.set()
+
+    def update(self, progress: float, metrics: Dict[str, Any]) -> None:
+        self._progress = {"progress": progress, "metrics": metrics}
+        self._ensure_running()
+
+    async def _run(self) -> None:
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Persisting progress of training {self.job_id} failed: {e}", exc_info=True)
+
+    async def flush(self) -> None:
+        """Write buffered logs and the latest progress in one transaction."""
+        async with self._lock:
+            logs, self._logs = self._logs, []
+            progress, self._progress = self._progress, None
+            if not logs and progress is None:
+                return
+            try:
+                async with self.session_factory() as db:
+                    if logs:
+                        await db.execute(insert(TrainingLog), logs)
+                    if progress is not None:
+                        await db.execute(
+                            update(TrainingJob)
+                            .where(TrainingJob.id == self.job_id)
+                            .values(updated_at=datetime.utcnow(), **progress)
+                        )
+                    await db.commit()
+                self.writes += 1
+            except Exception:
+                # Keep the data for the next attempt
+                self._logs = logs + self._logs
+                if self._progress is None:
+                    self._progress = progress
+                raise
+
+    async def close(self) -> None:
+        """Stop the background writer and persist whatever is still buffered."""
+        # Stopped by flag rather than cancellation, so an in-flight write is never cut short
+        self._closed = True
+        self._wake.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Final progress write of training {self.job_id} failed: {e}", exc_info=True)
+
+
+async def read_logs(db: AsyncSession, job_id: str, limit: int = 50,
+                    after_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """A job's log lines, oldest first: the last ``limit`` or, with ``after_id``, the next ``limit`` after it."""
+    query = select(TrainingLog).where(TrainingLog.job_id == job_id)
+    if after_id is not None:
+        query = query.where(TrainingLog.id > after_id).order_by(TrainingLog.id).limit(limit)
+        rows = list((await db.execute(query)).scalars())
+    else:
+        query = query.order_by(TrainingLog.id.desc()).limit(limit)
+        rows = list((await db.execute(query)).scalars())[::-1]
+    return [
+        {"id": row.id, "timestamp": row.timestamp.isoformat(), "level": row.level, "message": row.message}
+        for row in rows
+    ]
+
+
+async def count_logs(db: AsyncSession, job_id: str) -> int:
+    return (await db.execute(
+        select(func.count(TrainingLog.id)).where(TrainingLog.job_id == job_id)
+    )).scalar_one()
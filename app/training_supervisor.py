@@ -0,0 +1,273 @@
+"""
+Supervision of background training runs.
+
+Trainings are started through the ``TrainingSupervisor`` rather than as
+bare tasks: it keeps a strong reference to every run's task (the event loop
+only holds weak ones), gives each run its own database session from the
+training connection pool instead of the request's session, and lets at
+most ``training_slots`` runs train at once. Further runs wait in FIFO order
+for a slot. Hyperparameter sweeps (``training_sweeps``) submit their
+trials here as well and are themselves held as tasks of the supervisor.
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def training_output_dir(job_id: str) -> str:
+    return f"./outputs/training/{job_id}"
+
+
+def checkpoints_root(job_id: str) -> Path:
+    return Path(training_output_dir(job_id)) / "checkpoints"
+
+
+@dataclass
+class TrainingRun:
+    job_id: str
+    training_type: str
+    config: Dict[str, Any]
+    dataset_path: str
+    model_path: str
+    output_dir: str
+    output_name: Optional[str] = None
+    resume_from: Optional[str] = None
+    register_model: bool = True
+    state: str = "queued"  # queued -> running
+    queued_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    task: Optional[asyncio.Task] = None
+    engine: Any = None  # TrainingEngine while running
+    _queued_clock: float = field(default_factory=time.monotonic)
+    _started_clock: Optional[float] = None
+
+    def summary(self) -> dict:
+        now = time.monotonic()
+        info = {
+            "job_id": self.job_id,
+            "type": self.training_type,
+            "state": self.state,
+            "queued_at": self.queued_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "queue_seconds": round((self._started_clock or now) - self._queued_clock, 1),
+            "running_seconds": round(now - self._started_clock, 1) if self._started_clock else 0.0,
+            "resume_from": self.resume_from,
+        }
+        if self.engine is not None:
+            info.update({
+                "epoch": self.engine.current_epoch,
+                "step": self.engine.current_step,
+                "loss": self.engine.current_loss,
+                "stop_requested": self.engine.stop_requested,
+            })
+            worker = getattr(self.engine, "worker", None)
+            if worker is not None:
+                info["workers"] = [worker_resources(pid) or {"pid": pid} for pid in worker.pids]
+        return info
+
+
+def worker_resources(pid: int) -> Optional[dict]:
+    """CPU time and resident memory of a training worker process (Linux /proc only)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Fields after the parenthesised command name; utime and stime are fields 14 and 15
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    return {
+        "pid": pid,
+        "cpu_seconds": round((int(fields[11]) + int(fields[12])) / ticks, 1),
+        "rss_mb": round(resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1),
+    }
+
+
+def process_resources() -> dict:
+    """Memory and CPU use of this process, plus GPU memory if torch is already loaded."""
+    usage: Dict[str, Any] = {"pid": os.getpid()}
+    times = os.times()
+    usage["cpu_seconds"] = round(times.user + times.system, 1)
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        usage["rss_mb"] = round(resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        # Peak rather than current RSS; kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage["max_rss_mb"] = round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+    torch = sys.modules.get("torch")  # never import torch just to report on it
+    if torch is not None and torch.cuda.is_available():
+        usage["gpus"] = [
+            {
+                "device": index,
+                "name": torch.cuda.get_device_name(index),
+                "allocated_mb": round(torch.cuda.memory_allocated(index) / (1024 * 1024), 1),
+                "reserved_mb": round(torch.cuda.memory_reserved(index) / (1024 * 1024), 1),
+                "peak_allocated_mb": round(torch.cuda.max_memory_allocated(index) / (1024 * 1024), 1),
+            }
+            for index in range(torch.cuda.device_count())
+        ]
+    return usage
+
+
+class TrainingSupervisor:
+    """Runs training jobs in the background with bounded concurrency."""
+
+    def __init__(self, slots: int = 1, session_factory=None):
+        if session_factory is None:
+            from .database import TrainingSessionLocal as session_factory
+
+        self.slots = max(1, slots)
+        self.session_factory = session_factory
+        self.runs: Dict[str, TrainingRun] = {}  # strong refs until each run finishes
+        self.sweeps: Dict[str, asyncio.Task] = {}  # sweep schedulers, likewise
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def is_active(self, job_id: str) -> bool:
+        return job_id in self.runs
+
+    def submit(self, job_id: str, training_type: str, config: Dict[str, Any], dataset_path: str,
+               model_path: str, output_dir: str, output_name: Optional[str] = None,
+               resume_from: Optional[str] = None, register_model: bool = True) -> TrainingRun:
+        """Queue a training run; it starts as soon as a slot is free."""
+        if job_id in self.runs:
+            raise ValueError(f"Training {job_id} is already {self.runs[job_id].state}")
+        if self._semaphore is None:
+            # Created lazily so it binds to the running event loop
+            self._semaphore = asyncio.Semaphore(self.slots)
+        run = TrainingRun(job_id, training_type, config, dataset_path, model_path, output_dir, output_name,
+                          resume_from, register_model)
+        self.runs[job_id] = run
+        run.task = asyncio.create_task(self._run(run), name=f"training-{job_id}")
+        run.task.add_done_callback(lambda task: self._finished(run, task))
+        return run
+
+    async def _run(self, run: TrainingRun) -> None:
+        from .ml_training import TrainingEngine, start_training_background
+
+        async with self._semaphore:
+            run.state = "running"
+            run.started_at = datetime.utcnow()
+            run._started_clock = time.monotonic()
+            async with self.session_factory() as db:
+                run.engine = TrainingEngine(run.job_id, run.config, db, session_factory=self.session_factory)
+                await start_training_background(
+                    job_id=run.job_id,
+                    training_type=run.training_type,
+                    config=run.config,
+                    dataset_path=run.dataset_path,
+                    model_path=run.model_path,
+                    output_dir=run.output_dir,
+                    db_session=db,
+                    output_name=run.output_name,
+                    engine=run.engine,
+                    resume_from=run.resume_from,
+                    register_model=run.register_model,
+                )
+
+    def _finished(self, run: TrainingRun, task: asyncio.Task) -> None:
+        self.runs.pop(run.job_id, None)
+        if task.cancelled():
+            logger.info(f"Training {run.job_id} was cancelled while {run.state}")
+        elif task.exception() is not None:
+            logger.error(f"Training {run.job_id} crashed", exc_info=task.exception())
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """1-based position among waiting runs, or None if the run isn't waiting."""
+        queued = [run.job_id for run in self.runs.values() if run.state == "queued"]
+        return queued.index(job_id) + 1 if job_id in queued else None
+
+    def cancel(self, job_id: str) -> bool:
+        """Drop a waiting run, or ask a running one to stop after its current step."""
+        run = self.runs.get(job_id)
+        if run is None:
+            return False
+        if run.state == "queued":
+            run.task.cancel()
+        elif run.engine is not None:
+            run.engine.stop()
+        return True
+
+    def start_sweep(self, sweep_id: str, scheduler) -> asyncio.Task:
+        """Run a sweep's scheduler coroutine in the background."""
+        if sweep_id in self.sweeps:
+            raise ValueError(f"Sweep {sweep_id} is already running")
+        task = asyncio.create_task(scheduler, name=f"sweep-{sweep_id}")
+        self.sweeps[sweep_id] = task
+        task.add_done_callback(lambda done: self._sweep_finished(sweep_id, done))
+        return task
+
+    def _sweep_finished(self, sweep_id: str, task: asyncio.Task) -> None:
+        self.sweeps.pop(sweep_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Sweep {sweep_id} crashed", exc_info=task.exception())
+
+    def cancel_sweep(self, sweep_id: str, job_ids: List[str]) -> bool:
+        """Stop scheduling a sweep and stop its trials that are queued or running."""
+        task = self.sweeps.get(sweep_id)
+        if task is None:
+            return False
+        task.cancel()
+        for job_id in job_ids:
+            self.cancel(job_id)
+        return True
+
+    def snapshot(self) -> dict:
+        runs = [run.summary() for run in self.runs.values()]
+        running = [run for run in runs if run["state"] == "running"]
+        queued = [run for run in runs if run["state"] == "queued"]
+        for position, run in enumerate(queued, start=1):
+            run["queue_position"] = position
+        return {
+            "slots": self.slots,
+            "free_slots": max(0, self.slots - len(running)),
+            "running": running,
+            "queued": queued,
+            "sweeps": list(self.sweeps),
+            "resources": process_resources(),
+        }
+
+    async def shutdown(self, timeout: float = 30.0) -> None:
+        """Stop all runs: queued ones are dropped, running ones get ``timeout`` seconds to wind down."""
+        # Sweeps first, so they don't submit further trials
+        sweeps = list(self.sweeps.values())
+        for task in sweeps:
+            task.cancel()
+        if sweeps:
+            await asyncio.wait(sweeps)
+        tasks = []
+        for run in list(self.runs.values()):
+            self.cancel(run.job_id)
+            tasks.append(run.task)
+        if not tasks:
+            return
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+
+
+_supervisor: Optional[TrainingSupervisor] = None
+
+
+def get_training_supervisor() -> TrainingSupervisor:
+    """Get or create the global training supervisor."""
+    global _supervisor
+    if _supervisor is None:
+        from .config import get_settings
+        _supervisor = TrainingSupervisor(slots=get_settings().training_slots)
+    return _supervisor
@@ -0,0 +1,293 @@
+"""
+Hyperparameter sweeps over training jobs, pruned by successive halving.
+
+A sweep samples ``num_trials`` configurations from a search space (a grid
+when every parameter lists its values, random sampling otherwise) and
+creates one training job per trial. Trials then run in rungs: every
+surviving trial trains up to the rung's step budget, the trials are ranked
+by training loss, and only the best ``1 / reduction_factor`` of them go on
+to the next rung, whose budget is ``reduction_factor`` times larger. A
+promoted trial resumes from its own latest checkpoint instead of starting
+over, so the sweep costs about ``num_trials * min_steps`` per rung.
+
+Trials are submitted to the training supervisor like any other job, so they
+share its slots with regular trainings, and they all read the same
+preprocessed training cache, which the sweep builds once before the first
+rung. Only the winning trial is registered as a model.
+
+Datasets have no validation split, so trials are ranked by their training
+loss averaged over all of the rung's steps. Trials checkpoint only at rung
+boundaries (``checkpoint_steps`` is the rung budget), so that average is
+exactly the loss recorded in the checkpoint written at the end of the rung.
+"""
+import asyncio
+import itertools
+import logging
+import math
+import random
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import select, update
+
+from .models import Dataset, Model, TrainingJob, TrainingSweep
+from .training_checkpoints import list_checkpoints
+from .training_supervisor import TrainingSupervisor, checkpoints_root, get_training_supervisor, training_output_dir
+
+logger = logging.getLogger(__name__)
+
+# Controlled by the sweep itself, never searched over
+RESERVED_PARAMS = {"max_steps", "checkpoint_steps", "num_processes", "num_nodes", "output_name",
+                   "use_cache", "use_shards"}
+
+
+def validate_search_space(search_space: Dict[str, Any], fields: Iterable[str]) -> None:
+    """Raise ValueError unless every entry is a list of values or a {"min", "max", "log"} range of a known field."""
+    fields = set(fields)
+    if not search_space:
+        raise ValueError("Search space is empty")
+    for name, values in search_space.items():
+        if name in RESERVED_PARAMS or name not in fields:
+            raise ValueError(f"{name} can't be searched over")
+        if isinstance(values, list):
+            if not values:
+                raise ValueError(f"{name}: no values to choose from")
+        elif isinstance(values, dict):
+            low, high = values.get("min"), values.get("max")
+            if not isinstance(low, (int, float)) or not isinstance(high, (int, float)) or low > high:
+                raise ValueError(f"{name}: a range needs numeric min <= max")
+            if values.get("log") and low <= 0:
+                raise ValueError(f"{name}: a log range needs min > 0")
+        else:
+            raise ValueError(f"{name}: expected a list of values or a range")
+
+
+def _sample_value(spec: Any, rng: random.Random) -> Any:
+    if isinstance(spec, list):
+        return rng.choice(spec)
+    low, high = spec["min"], spec["max"]
+    if spec.get("log"):
+        value = math.exp(rng.uniform(math.log(low), math.log(high)))
+    else:
+        value = rng.uniform(low, high)
+    if isinstance(low, int) and isinstance(high, int):
+        return int(round(value))
+    return value
+
+
+def sample_trials(search_space: Dict[str, Any], num_trials: int, seed: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Parameter sets for the trials: the full grid if it has at most ``num_trials`` points, else a random sample."""
+    rng = random.Random(seed)
+    names = sorted(search_space)
+    if all(isinstance(search_space[name], list) for name in names):
+        grid = [dict(zip(names, values)) for values in itertools.product(*(search_space[name] for name in names))]
+        return grid if len(grid) <= num_trials else rng.sample(grid, num_trials)
+    return [{name: _sample_value(search_space[name], rng) for name in names} for _ in range(num_trials)]
+
+
+def rung_schedule(num_trials: int, min_steps: int, reduction_factor: int,
+                  max_steps: Optional[int] = None) -> List[Dict[str, int]]:
+    """Step budget and trial count of each rung, e.g. 9 trials x 50, 3 x 150, 1 x 450."""
+    rungs = []
+    trials, budget = num_trials, min_steps
+    while True:
+        if max_steps is not None:
+            budget = min(budget, max_steps)
+        rungs.append({"budget": budget, "trials": trials})
+        if trials <= 1 or (max_steps is not None and budget >= max_steps):
+            return rungs
+        trials = max(1, trials // reduction_factor)
+        budget *= reduction_factor
+
+
+def trial_loss(job_id: str, status: str) -> float:
+    """A trial's ranking loss: the mean over the rung, from its latest checkpoint; inf if there is none."""
+    if status != "completed":
+        return math.inf
+    checkpoints = list_checkpoints(checkpoints_root(job_id))
+    loss = checkpoints[-1]["loss"] if checkpoints else None
+    if loss is None or math.isnan(loss):
+        logger.warning(f"Trial {job_id} has no checkpoint loss; ranked last")
+        return math.inf
+    return float(loss)
+
+
+def sweep_leaderboard(sweep: TrainingSweep, trials: List[TrainingJob]) -> List[Dict[str, Any]]:
+    """Trials ranked by the furthest rung reached, then by their loss there."""
+    params = list(sweep.config.get("search_space", {}))
+    rows = []
+    for trial in trials:
+        rung, loss = -1, None
+        for index, record in enumerate(sweep.rungs or []):
+            if trial.id in record["losses"]:
+                rung, loss = index, record["losses"][trial.id]
+        metrics = trial.metrics or {}
+        rows.append({
+            "job_id": trial.id,
+            "params": {name: trial.config.get(name) for name in params},
+            "status": trial.status,
+            "rung": rung,
+            "loss": loss,
+            "steps": metrics.get("current_step"),
+            "samples_per_second": metrics.get("samples_per_second"),
+            "best": trial.id == sweep.best_job_id,
+        })
+    rows.sort(key=lambda row: (-row["rung"], math.inf if row["loss"] is None else row["loss"], row["job_id"]))
+    for position, row in enumerate(rows, start=1):
+        row["rank"] = position
+    return rows
+
+
+async def _set_sweep(session_factory, sweep_id: str, **values) -> None:
+    async with session_factory() as db:
+        await db.execute(
+            update(TrainingSweep)
+            .where(TrainingSweep.id == sweep_id)
+            .values(updated_at=datetime.utcnow(), **values)
+        )
+        await db.commit()
+
+
+async def _log(message: str, level: str = "info") -> None:
+    logger.log(logging.WARNING if level == "warning" else logging.INFO, message)
+
+
+async def run_sweep(sweep_id: str, supervisor: Optional[TrainingSupervisor] = None) -> None:
+    """Schedule a sweep's rungs to completion; run as a supervisor task."""
+    supervisor = supervisor or get_training_supervisor()
+    session_factory = supervisor.session_factory
+    try:
+        async with session_factory() as db:
+            await _run_rungs(db, sweep_id, supervisor)
+    except asyncio.CancelledError:
+        await _set_sweep(session_factory, sweep_id, status="cancelled")
+        logger.info(f"Sweep {sweep_id} cancelled")
+        raise
+    except Exception as e:
+        logger.error(f"Sweep {sweep_id} failed: {e}", exc_info=True)
+        await _set_sweep(session_factory, sweep_id, status="failed", error=str(e))
+
+
+async def fail_interrupted_sweeps(session_factory) -> None:
+    """Fail sweeps left pending or running by a crash, and cancel their unfinished trials (run at startup)."""
+    async with session_factory() as db:
+        sweep_ids = list((await db.execute(
+            select(TrainingSweep.id).where(TrainingSweep.status.in_(["pending", "running"]))
+        )).scalars())
+        if not sweep_ids:
+            return
+        await db.execute(
+            update(TrainingSweep)
+            .where(TrainingSweep.id.in_(sweep_ids))
+            .values(status="failed", error="Interrupted by a server restart", updated_at=datetime.utcnow())
+        )
+        await db.execute(
+            update(TrainingJob)
+            .where(TrainingJob.sweep_id.in_(sweep_ids), TrainingJob.status.in_(["pending", "running"]))
+            .values(status="cancelled", updated_at=datetime.utcnow())
+        )
+        await db.commit()
+    logger.warning(f"Marked {len(sweep_ids)} sweep(s) interrupted by a restart as failed")
+
+
+async def _run_rungs(db, sweep_id: str, supervisor: TrainingSupervisor) -> None:
+    sweep = await db.get(TrainingSweep, sweep_id)
+    dataset = await db.get(Dataset, sweep.dataset_id)
+    model = await db.get(Model, sweep.base_model_id)
+    trials = list((await db.execute(
+        select(TrainingJob).where(TrainingJob.sweep_id == sweep_id).order_by(TrainingJob.id)
+    )).scalars())
+    configs = {trial.id: dict(trial.config) for trial in trials}
+    await _set_sweep(supervisor.session_factory, sweep_id, status="running")
+
+    # Build the shared cache up front; otherwise the first trials of rung 0 would all wait on its lock.
+    # Without latents and token ids trials would run the simulated loop, which can't stop at a
+    # rung budget or resume from a checkpoint, so the sweep fails here instead of in rung 1.
+    from .training_cache import prepare_training_cache
+
+    for resolution in sorted({config.get("resolution", 512) for config in configs.values()}):
+        try:
+            cache, rebuilt = await prepare_training_cache(db, dataset.id, model.path, resolution)
+        except Exception as e:
+            raise RuntimeError(f"Training cache at {resolution}px unavailable: {e}") from e
+        if cache.latents is None or cache.input_ids is None:
+            raise RuntimeError(
+                f"Training cache at {resolution}px has no latents or token ids "
+                f"(does {model.path} include a VAE and tokenizer?); sweeps need real training"
+            )
+        logger.info(f"Sweep {sweep_id}: {'built' if rebuilt else 'reusing'} training cache at {resolution}px "
+                    f"({len(cache)} image(s))")
+
+    schedule = sweep.config["schedule"]
+    alive = [trial.id for trial in trials]
+    rungs: List[Dict[str, Any]] = []
+    for index, rung in enumerate(schedule):
+        budget = rung["budget"]
+        for job_id in alive:
+            # One checkpoint per rung, at its end: its loss then averages exactly this rung's steps
+            configs[job_id].update(max_steps=budget, checkpoint_steps=budget)
+            await db.execute(
+                update(TrainingJob)
+                .where(TrainingJob.id == job_id)
+                .values(config=configs[job_id], status="pending", updated_at=datetime.utcnow())
+            )
+        await db.commit()
+
+        runs = []
+        for job_id in alive:
+            # Promoted trials continue from where the previous rung stopped
+            checkpoints = list_checkpoints(checkpoints_root(job_id)) if index else []
+            runs.append(supervisor.submit(
+                job_id=job_id,
+                training_type=sweep.type,
+                config=configs[job_id],
+                dataset_path=dataset.path,
+                model_path=model.path,
+                output_dir=training_output_dir(job_id),
+                resume_from=checkpoints[-1]["path"] if checkpoints else None,
+                register_model=False,
+            ))
+        # asyncio.wait, unlike gather, leaves the trials running if the sweep itself is cancelled
+        await asyncio.wait([run.task for run in runs])
+
+        rows = (await db.execute(
+            select(TrainingJob.id, TrainingJob.status).where(TrainingJob.id.in_(alive))
+        )).all()
+        losses = {row.id: trial_loss(row.id, row.status) for row in rows}
+        ranked = sorted(alive, key=lambda job_id: (losses.get(job_id, math.inf), job_id))
+        if all(math.isinf(losses.get(job_id, math.inf)) for job_id in ranked):
+            raise RuntimeError(f"Every trial of rung {index} failed")
+        keep = schedule[index + 1]["trials"] if index + 1 < len(schedule) else 1
+        promoted = [job_id for job_id in ranked[:keep] if not math.isinf(losses.get(job_id, math.inf))]
+        pruned = [job_id for job_id in alive
+                  if job_id not in promoted and not math.isinf(losses.get(job_id, math.inf))]
+        if pruned and index + 1 < len(schedule):
+            await db.execute(update(TrainingJob).where(TrainingJob.id.in_(pruned)).values(status="pruned"))
+        rungs.append({
+            "rung": index,
+            "budget": budget,
+            "losses": {job_id: None if math.isinf(loss) else loss for job_id, loss in losses.items()},
+            "promoted": promoted,
+        })
+        await db.execute(
+            update(TrainingSweep)
+            .where(TrainingSweep.id == sweep_id)
+            .values(rungs=list(rungs), updated_at=datetime.utcnow())
+        )
+        await db.commit()
+        logger.info(f"Sweep {sweep_id}: rung {index} ({budget} steps) done, "
+                    f"{len(promoted)} of {len(alive)} trial(s) promoted")
+        alive = promoted
+
+    from .ml_training import register_trained_model
+
+    best_id = alive[0]
+    output_path = (await db.execute(
+        select(TrainingJob.output_path).where(TrainingJob.id == best_id)
+    )).scalar_one()
+    if output_path:
+        output_name = sweep.config["base_config"].get("output_name") or f"sweep-{sweep.name}"
+        await register_trained_model(db, output_name, sweep.type, output_path, configs[best_id], best_id, _log)
+    await _set_sweep(supervisor.session_factory, sweep_id, status="completed", best_job_id=best_id)
+    logger.info(f"Sweep {sweep_id} completed; best trial {best_id}")
+
@@ -0,0 +1,423 @@
+"""
+Disk storage for uploaded files.
+
+Uploads are copied to disk in fixed-size chunks, hashed incrementally and
+checked against the size limit as they are written, so memory use per upload
+is bounded by the chunk size regardless of file size.
+
+File contents live once in a content-addressed store (``storage/blobs``,
+keyed by SHA-256) and are hard-linked into the type/dataset directories, so
+uploading identical content again costs no extra disk space. Large files can
+also be uploaded in resumable sessions: the client appends chunks at explicit
+offsets and, after a dropped connection, asks for the current offset and
+continues from there. The store and the in-progress sessions live outside
+``uploads/``, which is served publicly; hard links need them on the same
+filesystem (otherwise files are copied).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+UPLOAD_ROOT = Path("uploads")
+STORAGE_ROOT = Path("storage")  # never mounted as static files
+STORE_DIR = STORAGE_ROOT / "blobs"
+SESSIONS_DIR = STORAGE_ROOT / "upload_sessions"
+LEGACY_DIRS = {UPLOAD_ROOT / ".store": STORE_DIR, UPLOAD_ROOT / ".sessions": SESSIONS_DIR}
+SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+BLOB_GRACE_SECONDS = 300.0  # a freshly stored blob is never released, so it can still be linked
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured size limit."""
+
+    def __init__(self, limit: int):
+        super().__init__(f"File exceeds the maximum upload size of {limit // (1024 * 1024)} MB")
+        self.limit = limit
+
+
+class OffsetMismatchError(Exception):
+    """Raised when a chunk is appended at an offset other than the session's current size."""
+
+    def __init__(self, expected: int, received: int):
+        super().__init__(f"Upload offset mismatch: expected {expected}, got {received}")
+        self.expected = expected
+        self.received = received
+
+
+class UploadIncompleteError(Exception):
+    """Raised when completing a session whose data is missing or does not match its checksum."""
+
+
+@dataclass
+class StoredFile:
+    path: Path
+    size: int
+    sha256: str
+
+
+def _partial_path(dest: Path) -> Path:
+    return dest.with_name(f".{dest.name}.part")
+
+
+async def stream_upload_to_file(
+    upload: UploadFile,
+    dest: Path,
+    max_bytes: int,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> StoredFile:
+    """Copy ``upload`` to ``dest`` chunk by chunk.
+
+    Data goes to a hidden ``.part`` file that is renamed into place only once
+    the whole upload was written, so readers never see a truncated file. If
+    the size limit is crossed the partial file is removed and
+    ``UploadTooLargeError`` is raised.
+    """
+    # Reject early when the multipart parser already knows the size
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLargeError(max_bytes)
+
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    partial = _partial_path(dest)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(partial, "wb") as out:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                digest.update(chunk)
+                # Disk writes run off the event loop so concurrent uploads don't stall it
+                await asyncio.to_thread(out.write, chunk)
+        os.replace(partial, dest)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+
+    return StoredFile(path=dest, size=size, sha256=digest.hexdigest())
+
+
+# ---- content-addressed store ---------------------------------------------
+
+def migrate_legacy_dirs() -> None:
+    """Move a store or session directory left inside ``uploads/`` by older versions out of it.
+
+    A rename on the same filesystem, so existing hard links stay intact.
+    """
+    for legacy, target in LEGACY_DIRS.items():
+        if legacy.is_dir() and not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(legacy, target)
+            logger.info(f"Moved {legacy} to {target}")
+        elif legacy.is_dir():
+            logger.warning(f"Both {legacy} and {target} exist; {legacy} is publicly served, remove it")
+
+
+def blob_path(sha256: str) -> Path:
+    return STORE_DIR / sha256[:2] / sha256
+
+
+# Serializes storing, linking and releasing blobs. Blobs stored in the last
+# BLOB_GRACE_SECONDS (sha256 -> monotonic time) are also kept, which covers the
+# gap between store_blob and place_blob of one upload.
+_store_lock = threading.Lock()
+_recent_blobs: Dict[str, float] = {}
+
+
+def store_blob(temp_path: Path, sha256: str) -> Path:
+    """Move a fully written file into the store, or drop it if the content is already there."""
+    blob = blob_path(sha256)
+    with _store_lock:
+        _recent_blobs[sha256] = time.monotonic()
+        if blob.exists():
+            temp_path.unlink(missing_ok=True)
+        else:
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(temp_path, blob)
+    return blob
+
+
+def place_blob(blob: Path, directory: Path, filename: str) -> Path:
+    """Link ``blob`` into ``directory`` as ``filename``.
+
+    Returns the existing path when that name (or a ``name_N`` variant)
+    already links to the same content; otherwise picks the first free name.
+    Falls back to copying when hard links are not supported.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    original = directory / filename
+    candidate = original
+    counter = 1
+    while candidate.exists():
+        if os.path.samefile(candidate, blob):
+            return candidate
+        candidate = directory / f"{original.stem}_{counter}{original.suffix}"
+        counter += 1
+    with _store_lock:
+        try:
+            os.link(blob, candidate)
+        except OSError:
+            shutil.copy2(blob, candidate)
+    return candidate
+
+
+async def store_upload(upload: UploadFile, max_bytes: int) -> StoredFile:
+    """Stream an upload into the content-addressed store."""
+    temp = STORE_DIR / "tmp" / uuid.uuid4().hex
+    stored = await stream_upload_to_file(upload, temp, max_bytes)
+    stored.path = store_blob(temp, stored.sha256)
+    return stored
+
+
+def linked_blobs(paths: Iterable[Path]) -> List[Path]:
+    """Blobs that deleting ``paths`` (files or directories) leaves without any upload link.
+
+    Call before deleting and pass the result to ``release_blobs`` afterwards.
+    Only files whose remaining links are all among ``paths`` are hashed.
+    """
+    groups: Dict[tuple, List[Path]] = {}
+    for path in paths:
+        files = [path] if path.is_file() else [child for child in path.rglob("*") if child.is_file()]
+        for file in files:
+            try:
+                st = file.stat()
+            except OSError:
+                continue
+            if st.st_nlink > 1:
+                groups.setdefault((st.st_dev, st.st_ino, st.st_nlink), []).append(file)
+    blobs = []
+    for (_, _, nlink), files in groups.items():
+        if nlink != len(files) + 1:
+            continue  # still linked from elsewhere
+        try:
+            blob = blob_path(_hash_file(files[0]))
+            if blob.exists() and os.path.samefile(blob, files[0]):
+                blobs.append(blob)
+        except OSError:
+            continue
+    return blobs
+
+
+def _forget_old_blobs(now: float) -> None:
+    for sha256, stored_at in list(_recent_blobs.items()):
+        if now - stored_at > BLOB_GRACE_SECONDS:
+            del _recent_blobs[sha256]
+
+
+def release_blobs(blobs: Iterable[Path]) -> int:
+    """Delete the given blobs if nothing links to them any more."""
+    removed = 0
+    with _store_lock:
+        _forget_old_blobs(time.monotonic())
+        for blob in blobs:
+            if blob.name in _recent_blobs:
+                continue
+            try:
+                if blob.stat().st_nlink <= 1:
+                    blob.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+    return removed
+
+
+def prune_store() -> int:
+    """Delete every blob no longer linked from any upload directory.
+
+    Scans the whole store, so it runs once at startup to catch blobs
+    orphaned by a crash; deletions release their own blobs.
+    """
+    removed = 0
+    if not STORE_DIR.exists():
+        return removed
+    for shard in STORE_DIR.iterdir():
+        if not shard.is_dir() or shard.name == "tmp":
+            continue
+        removed += release_blobs(list(shard.iterdir()))
+    if removed:
+        logger.info(f"Pruned {removed} unreferenced upload blob(s)")
+    return removed
+
+
+# ---- resumable sessions ----------------------------------------------------
+
+@dataclass
+class UploadSession:
+    id: str
+    filename: str
+    size: Optional[int]
+    dataset_id: Optional[int]
+    extract_archives: bool
+    created_at: float
+    offset: int = 0
+
+    @property
+    def data_path(self) -> Path:
+        return SESSIONS_DIR / f"{self.id}.part"
+
+    @property
+    def meta_path(self) -> Path:
+        return SESSIONS_DIR / f"{self.id}.json"
+
+
+# Running hashes of in-progress sessions, keyed by id: (hash object, bytes hashed).
+# Lost on restart, in which case the data is re-hashed on completion.
+_session_hashes: Dict[str, tuple] = {}
+_session_locks: Dict[str, asyncio.Lock] = {}
+
+
+def _session_lock(session_id: str) -> asyncio.Lock:
+    return _session_locks.setdefault(session_id, asyncio.Lock())
+
+
+def create_session(
+    filename: str,
+    size: Optional[int],
+    dataset_id: Optional[int],
+    extract_archives: bool,
+    max_bytes: int,
+) -> UploadSession:
+    if size is not None and size > max_bytes:
+        raise UploadTooLargeError(max_bytes)
+    SESSIONS_DIR.mkdir(parents=True, exist_ok=True)
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        filename=filename,
+        size=size,
+        dataset_id=dataset_id,
+        extract_archives=extract_archives,
+        created_at=time.time(),
+    )
+    session.data_path.touch()
+    meta = asdict(session)
+    meta.pop("offset")
+    session.meta_path.write_text(json.dumps(meta))
+    _session_hashes[session.id] = (hashlib.sha256(), 0)
+    return session
+
+
+def load_session(session_id: str) -> Optional[UploadSession]:
+    """Load a session; its offset is the number of bytes received so far."""
+    if not SESSION_ID_PATTERN.match(session_id):
+        return None
+    meta_path = SESSIONS_DIR / f"{session_id}.json"
+    if not meta_path.exists():
+        return None
+    session = UploadSession(**json.loads(meta_path.read_text()))
+    session.offset = session.data_path.stat().st_size if session.data_path.exists() else 0
+    return session
+
+
+async def append_chunk(
+    session: UploadSession,
+    offset: int,
+    chunks: AsyncIterator[bytes],
+    max_bytes: int,
+) -> int:
+    """Append a request body at ``offset`` and return the new offset.
+
+    The offset must equal the bytes already received; a client that lost a
+    response can re-query the offset and resend only the missing part.
+    """
+    limit = min(max_bytes, session.size) if session.size is not None else max_bytes
+    async with _session_lock(session.id):
+        current = session.data_path.stat().st_size
+        if offset != current:
+            raise OffsetMismatchError(current, offset)
+
+        hasher, hashed = _session_hashes.get(session.id, (None, 0))
+        if hashed != current:
+            hasher = None  # state lost (restart); re-hash on completion
+        try:
+            with open(session.data_path, "ab") as out:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    if current + len(chunk) > limit:
+                        raise UploadTooLargeError(limit)
+                    await asyncio.to_thread(out.write, chunk)
+                    current += len(chunk)
+                    if hasher is not None:
+                        hasher.update(chunk)
+        finally:
+            # Keep whatever arrived before a disconnect; the client resumes from there
+            if hasher is not None:
+                _session_hashes[session.id] = (hasher, current)
+            session.offset = current
+        return current
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def complete_session(session: UploadSession, expected_sha256: Optional[str] = None) -> StoredFile:
+    """Verify a finished session and move its data into the content-addressed store."""
+    async with _session_lock(session.id):
+        size = session.data_path.stat().st_size
+        if session.size is not None and size != session.size:
+            raise UploadIncompleteError(f"Received {size} of {session.size} bytes")
+
+        hasher, hashed = _session_hashes.get(session.id, (None, 0))
+        if hasher is not None and hashed == size:
+            sha256 = hasher.hexdigest()
+        else:
+            sha256 = await asyncio.to_thread(_hash_file, session.data_path)
+        if expected_sha256 and expected_sha256.lower() != sha256:
+            raise UploadIncompleteError(f"Checksum mismatch: expected {expected_sha256}, got {sha256}")
+
+        blob = store_blob(session.data_path, sha256)
+        _discard_session(session.id)
+        return StoredFile(path=blob, size=size, sha256=sha256)
+
+
+def _discard_session(session_id: str) -> None:
+    (SESSIONS_DIR / f"{session_id}.part").unlink(missing_ok=True)
+    (SESSIONS_DIR / f"{session_id}.json").unlink(missing_ok=True)
+    _session_hashes.pop(session_id, None)
+    _session_locks.pop(session_id, None)
+
+
+def abort_session(session_id: str) -> None:
+    _discard_session(session_id)
+
+
+def expire_sessions(max_age_seconds: float) -> int:
+    """Remove sessions that were started more than ``max_age_seconds`` ago."""
+    removed = 0
+    if not SESSIONS_DIR.exists():
+        return removed
+    cutoff = time.time() - max_age_seconds
+    for meta_path in SESSIONS_DIR.glob("*.json"):
+        try:
+            created_at = json.loads(meta_path.read_text()).get("created_at", 0)
+        except (OSError, ValueError):
+            created_at = 0
+        if created_at < cutoff:
+            _discard_session(meta_path.stem)
+            removed += 1
+    if removed:
+        logger.info(f"Expired {removed} stale upload session(s)")
+    return removed
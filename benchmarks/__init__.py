@@ -0,0 +1 @@
+"""Performance benchmarks runnable on CPU with tiny random-weight models."""
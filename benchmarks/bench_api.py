@@ -0,0 +1,54 @@
+"""
+API latency under concurrent load, measured in-process with an ASGI client.
+
+Job submission only enqueues (queue workers are not started), so the numbers
+reflect request handling overhead rather than generation time.
+"""
+import asyncio
+import time
+from typing import Dict, List
+
+from benchmarks.bench_generation import percentile
+
+API_SCENARIOS = [
+    ("GET", "/health", None),
+    ("GET", "/api/monitoring/health", None),
+    ("GET", "/api/generate/", None),
+    ("POST", "/api/generate/text-to-image", {"prompt": "a benchmark prompt", "steps": 10}),
+]
+
+
+async def bench_api_latency(concurrency: int = 16, requests_per_worker: int = 25) -> Dict[str, float]:
+    """Fire concurrent requests at the app and report latency percentiles."""
+    import httpx
+
+    from app.database import init_db
+    from app.main import app
+
+    await init_db()
+    transport = httpx.ASGITransport(app=app)
+    latencies: List[float] = []
+    errors = 0
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker(worker_id: int) -> None:
+            nonlocal errors
+            for i in range(requests_per_worker):
+                method, path, body = API_SCENARIOS[(worker_id + i) % len(API_SCENARIOS)]
+                start = time.perf_counter()
+                response = await client.request(method, path, json=body)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "api_requests_per_second": round(len(latencies) / elapsed, 2),
+        "api_latency_ms_p50": round(percentile(latencies, 50) * 1000, 3),
+        "api_latency_ms_p95": round(percentile(latencies, 95) * 1000, 3),
+        "api_latency_ms_p99": round(percentile(latencies, 99) * 1000, 3),
+        "api_error_rate": round(errors / len(latencies), 4),
+    }
@@ -0,0 +1,91 @@
+"""
+Compare denoising throughput (steps/second) of the inference backends on CPU.
+
+Usage:
+    python -m benchmarks.bench_backends --steps 20 --runs 3
+    python -m benchmarks.bench_backends --backends eager cpu_bf16 onnx
+
+The first run of each backend is a warm-up and pays the one-off preparation
+cost (compilation or ONNX export), which is reported separately.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.inference_backends import INFERENCE_BACKENDS  # noqa: E402
+from benchmarks.tiny_models import TINY_IMAGE_SIZE, build_tiny_pipeline  # noqa: E402
+
+
+async def bench_backend(backend: str, model_dir: Path, cache_dir: Path, steps: int, runs: int) -> dict:
+    """Time warm-up and steady-state generation for one backend."""
+    from app.ai_generator import AIImageGenerator
+
+    generator = AIImageGenerator(cache_dir=str(cache_dir), backend=backend, device="cpu")
+    kwargs = dict(
+        prompt="a benchmark prompt",
+        model_name=f"tiny-{backend}",
+        model_path=str(model_dir),
+        width=TINY_IMAGE_SIZE,
+        height=TINY_IMAGE_SIZE,
+        num_inference_steps=steps,
+        seed=0,
+    )
+
+    start = time.perf_counter()
+    await generator.generate_images(**kwargs)
+    warmup_seconds = time.perf_counter() - start
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await generator.generate_images(**kwargs)
+        timings.append(time.perf_counter() - start)
+    generator.cleanup()
+
+    best = min(timings)
+    return {
+        "backend": backend,
+        "warmup_seconds": round(warmup_seconds, 4),
+        "best_seconds": round(best, 4),
+        "mean_seconds": round(sum(timings) / len(timings), 4),
+        "steps_per_second": round(steps / best, 2),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=list(INFERENCE_BACKENDS), choices=INFERENCE_BACKENDS)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--work-dir", type=Path, default=None, help="Reuse a directory for the tiny model and caches")
+    args = parser.parse_args()
+
+    os.environ["DISABLE_SAFETY_CHECKER"] = "true"
+    work_dir = args.work_dir or Path(tempfile.mkdtemp(prefix="bench_backends_"))
+    model_dir = build_tiny_pipeline(work_dir / "tiny-sd")
+
+    results = []
+    for backend in args.backends:
+        try:
+            results.append(await bench_backend(backend, model_dir, work_dir / "cache", args.steps, args.runs))
+        except Exception as e:
+            results.append({"backend": backend, "error": str(e)})
+
+    baseline = next((r for r in results if r.get("backend") == "eager" and "error" not in r), None)
+    if baseline:
+        for result in results:
+            if "steps_per_second" in result:
+                result["speedup_vs_eager"] = round(result["steps_per_second"] / baseline["steps_per_second"], 2)
+
+    print(json.dumps({"steps": args.steps, "runs": args.runs, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+"""
+Generation benchmarks: pipeline load time, per-step latency and end-to-end
+images/second through ``JobQueue``, using the tiny random-weight pipeline.
+"""
+import asyncio
+import statistics
+import time
+from pathlib import Path
+from typing import Dict
+
+from benchmarks.tiny_models import TINY_IMAGE_SIZE
+
+TINY_MODEL_NAME = "tiny-sd"
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def bench_pipeline_load(model_dir: Path, cache_dir: Path, backend: str = "eager") -> Dict[str, float]:
+    """Time a cold ``_load_pipeline`` of the tiny model."""
+    from app.ai_generator import AIImageGenerator
+
+    generator = AIImageGenerator(cache_dir=str(cache_dir), backend=backend, device="cpu")
+    start = time.perf_counter()
+    generator._load_pipeline(TINY_MODEL_NAME, str(model_dir))
+    elapsed = time.perf_counter() - start
+    generator.cleanup()
+    return {"pipeline_load_seconds": round(elapsed, 4)}
+
+
+def bench_step_latency(generator, steps: int = 20, runs: int = 3) -> Dict[str, float]:
+    """Measure per-denoising-step latency of the loaded pipeline."""
+    import torch
+
+    from app.schedulers import DEFAULT_SCHEDULER
+
+    pipeline = generator.current_pipeline
+    pipeline.scheduler = generator._get_scheduler(DEFAULT_SCHEDULER)
+    step_times = []
+
+    for run in range(runs + 1):
+        marks = [time.perf_counter()]
+
+        def on_step_end(pipe, step, timestep, callback_kwargs):
+            marks.append(time.perf_counter())
+            return callback_kwargs
+
+        pipeline(
+            prompt="a benchmark prompt",
+            width=TINY_IMAGE_SIZE,
+            height=TINY_IMAGE_SIZE,
+            num_inference_steps=steps,
+            generator=torch.Generator(device="cpu").manual_seed(run),
+            callback_on_step_end=on_step_end,
+            output_type="latent",
+        )
+        if run == 0:
+            continue  # warm-up
+        # The first interval includes prompt encoding and latent setup
+        step_times.extend(b - a for a, b in zip(marks[1:], marks[2:]))
+
+    return {
+        "step_latency_ms_mean": round(statistics.mean(step_times) * 1000, 3),
+        "step_latency_ms_p50": round(percentile(step_times, 50) * 1000, 3),
+        "step_latency_ms_p95": round(percentile(step_times, 95) * 1000, 3),
+        "steps_per_second": round(1 / statistics.mean(step_times), 2),
+    }
+
+
+async def bench_job_queue(generator, output_dir: Path, num_jobs: int = 8, steps: int = 10,
+                          workers: int = 1) -> Dict[str, float]:
+    """Submit text-to-image jobs to a ``JobQueue`` and measure images/second."""
+    import app.ai_generator as ai_generator
+    from app.jobs import JobQueue
+    from app.schemas import JobStatus, TextToImageRequest
+
+    # Route the queue's global generator to the already loaded tiny model
+    ai_generator._generator = generator
+    queue = JobQueue(output_dir=output_dir, max_parallel_jobs=workers, delay=0.0)
+    queue.start()
+
+    request = TextToImageRequest(
+        prompt="a benchmark prompt",
+        width=TINY_IMAGE_SIZE,
+        height=TINY_IMAGE_SIZE,
+        steps=steps,
+        scheduler="dpmpp_2m",
+        model=TINY_MODEL_NAME,
+        seed=0,
+    )
+    # Warm-up job so the first measured job does not pay one-off costs
+    queue.create_text_to_image_job(request)
+    await queue.queue.join()
+
+    start = time.perf_counter()
+    jobs = [queue.create_text_to_image_job(request) for _ in range(num_jobs)]
+    await queue.queue.join()
+    elapsed = time.perf_counter() - start
+
+    for worker in queue.workers:
+        worker.cancel()
+    failed = [job for job in jobs if job.status != JobStatus.done]
+    if failed:
+        raise RuntimeError(f"{len(failed)} benchmark job(s) failed: {failed[0].error}")
+
+    images = sum(len(job.outputs) for job in jobs)
+    latencies = [(job.updated_at - job.created_at).total_seconds() for job in jobs]
+    return {
+        "jobqueue_images_per_second": round(images / elapsed, 3),
+        "jobqueue_job_latency_s_p50": round(percentile(latencies, 50), 4),
+    }
+
+
+def run_generation_benchmarks(model_dir: Path, work_dir: Path, steps: int, num_jobs: int) -> Dict[str, float]:
+    """Run all generation benchmarks and return a flat metrics dict."""
+    from app.ai_generator import AIImageGenerator
+
+    metrics = {}
+    metrics.update(bench_pipeline_load(model_dir, work_dir / "cache"))
+
+    generator = AIImageGenerator(cache_dir=str(work_dir / "cache"), device="cpu")
+    generator._load_pipeline(TINY_MODEL_NAME, str(model_dir))
+    metrics.update(bench_step_latency(generator, steps=steps))
+    metrics.update(asyncio.run(bench_job_queue(generator, work_dir / "outputs", num_jobs=num_jobs, steps=steps)))
+    generator.cleanup()
+    return metrics
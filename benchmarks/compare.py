@@ -0,0 +1,32 @@
+"""Compare benchmark results against a stored baseline."""
+from typing import Dict, List
+
+# Metrics where a larger value is better; everything else is lower-is-better
+HIGHER_IS_BETTER = {
+    "steps_per_second",
+    "jobqueue_images_per_second",
+    "api_requests_per_second",
+}
+
+
+def find_regressions(metrics: Dict[str, float], baseline: Dict[str, float], tolerance: float = 0.15) -> List[dict]:
+    """Return metrics that got worse than the baseline by more than ``tolerance``.
+
+    ``tolerance`` is relative: 0.15 flags a 15% drop in throughput or a 15%
+    increase in latency, load time or memory.
+    """
+    regressions = []
+    for name, base_value in baseline.items():
+        value = metrics.get(name)
+        if value is None or not base_value:
+            continue
+        change = (value - base_value) / abs(base_value)
+        worse = -change if name in HIGHER_IS_BETTER else change
+        if worse > tolerance:
+            regressions.append({
+                "metric": name,
+                "baseline": base_value,
+                "current": value,
+                "change_pct": round(change * 100, 1),
+            })
+    return regressions
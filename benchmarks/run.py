@@ -0,0 +1,105 @@
+"""
+Run the generation throughput benchmark suite on CPU.
+
+Usage:
+    python -m benchmarks.run                                   # print results
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json --tolerance 0.15
+
+With ``--baseline`` the process exits with status 1 when any metric is worse
+than the baseline by more than the tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def peak_rss_mb() -> float | None:
+    """Peak resident set size of this process in MB (None where unsupported)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 1)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, default=10, help="Denoising steps per image")
+    parser.add_argument("--jobs", type=int, default=8, help="Jobs submitted to the JobQueue")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent API clients")
+    parser.add_argument("--skip-api", action="store_true")
+    parser.add_argument("--skip-generation", action="store_true")
+    parser.add_argument("--output", type=Path, help="Write results JSON to this file")
+    parser.add_argument("--baseline", type=Path, help="Compare against this baseline JSON")
+    parser.add_argument("--save-baseline", type=Path, help="Store the metrics as a new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Relative regression tolerance")
+    args = parser.parse_args()
+
+    baseline_path = args.baseline.resolve() if args.baseline else None
+    save_baseline_path = args.save_baseline.resolve() if args.save_baseline else None
+    output_path = args.output.resolve() if args.output else None
+
+    # The app uses relative paths (database, uploads, outputs): run in a scratch directory
+    work_dir = Path(tempfile.mkdtemp(prefix="ai_generator_bench_"))
+    os.chdir(work_dir)
+    os.environ["USE_REAL_AI"] = "true"
+    os.environ["DISABLE_SAFETY_CHECKER"] = "true"
+    os.environ["OUTPUT_DIR"] = str(work_dir / "outputs")
+
+    from benchmarks.bench_api import bench_api_latency
+    from benchmarks.bench_generation import run_generation_benchmarks
+    from benchmarks.compare import find_regressions
+    from benchmarks.tiny_models import build_tiny_pipeline
+
+    metrics = {}
+    if not args.skip_generation:
+        model_dir = build_tiny_pipeline(work_dir / "tiny-sd")
+        metrics.update(run_generation_benchmarks(model_dir, work_dir, steps=args.steps, num_jobs=args.jobs))
+    if not args.skip_api:
+        metrics.update(asyncio.run(bench_api_latency(concurrency=args.concurrency)))
+    metrics["peak_rss_mb"] = peak_rss_mb()
+
+    results = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "steps": args.steps,
+            "jobs": args.jobs,
+            "concurrency": args.concurrency,
+        },
+        "metrics": metrics,
+    }
+
+    exit_code = 0
+    if baseline_path:
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+        regressions = find_regressions(metrics, baseline.get("metrics", baseline), args.tolerance)
+        results["regressions"] = regressions
+        exit_code = 1 if regressions else 0
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if output_path:
+        output_path.write_text(output, encoding="utf-8")
+    if save_baseline_path:
+        save_baseline_path.write_text(output, encoding="utf-8")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Tiny random-weight Stable Diffusion pipeline for CPU benchmarks.
+
+The pipeline has the same structure as SD 1.5 (CLIP text encoder, UNet with
+cross-attention, KL VAE) but only a few thousand parameters per block, so it
+runs on any machine without downloading weights. The tokenizer vocabulary is
+generated locally from the byte-level alphabet.
+"""
+import json
+from pathlib import Path
+
+TINY_SAMPLE_SIZE = 32
+TINY_IMAGE_SIZE = 64  # VAE downsamples by 2 with two blocks
+
+
+def _write_byte_level_tokenizer(tokenizer_dir: Path) -> int:
+    """Write a minimal CLIP tokenizer (no merges) and return its vocab size."""
+    from transformers.models.clip.tokenization_clip import bytes_to_unicode
+
+    tokenizer_dir.mkdir(parents=True, exist_ok=True)
+    alphabet = list(bytes_to_unicode().values())
+    tokens = alphabet + [f"{char}</w>" for char in alphabet] + ["<|startoftext|>", "<|endoftext|>"]
+    vocab = {token: idx for idx, token in enumerate(tokens)}
+    (tokenizer_dir / "vocab.json").write_text(json.dumps(vocab), encoding="utf-8")
+    (tokenizer_dir / "merges.txt").write_text("#version: 0.2\n", encoding="utf-8")
+    return len(vocab)
+
+
+def build_tiny_pipeline(target_dir: Path) -> Path:
+    """Create and save a tiny SD pipeline to ``target_dir`` (idempotent)."""
+    target_dir = Path(target_dir)
+    if (target_dir / "model_index.json").exists():
+        return target_dir
+
+    import torch
+    from diffusers import AutoencoderKL, DDIMScheduler, StableDiffusionPipeline, UNet2DConditionModel
+    from transformers import CLIPTextConfig, CLIPTextModel, CLIPTokenizer
+
+    torch.manual_seed(0)
+    vocab_size = _write_byte_level_tokenizer(target_dir / "_tokenizer_src")
+    tokenizer = CLIPTokenizer(
+        vocab_file=str(target_dir / "_tokenizer_src" / "vocab.json"),
+        merges_file=str(target_dir / "_tokenizer_src" / "merges.txt"),
+        model_max_length=77,
+    )
+    text_encoder = CLIPTextModel(CLIPTextConfig(
+        bos_token_id=vocab_size - 2,
+        eos_token_id=vocab_size - 1,
+        pad_token_id=vocab_size - 1,
+        hidden_size=32,
+        intermediate_size=37,
+        num_attention_heads=4,
+        num_hidden_layers=2,
+        vocab_size=vocab_size,
+    ))
+    unet = UNet2DConditionModel(
+        block_out_channels=(32, 64),
+        layers_per_block=2,
+        sample_size=TINY_SAMPLE_SIZE,
+        in_channels=4,
+        out_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"),
+        cross_attention_dim=32,
+    )
+    vae = AutoencoderKL(
+        block_out_channels=[32, 64],
+        in_channels=3,
+        out_channels=3,
+        down_block_types=["DownEncoderBlock2D", "DownEncoderBlock2D"],
+        up_block_types=["UpDecoderBlock2D", "UpDecoderBlock2D"],
+        latent_channels=4,
+        sample_size=TINY_IMAGE_SIZE,
+    )
+    scheduler = DDIMScheduler(
+        beta_start=0.00085,
+        beta_end=0.012,
+        beta_schedule="scaled_linear",
+        clip_sample=False,
+        set_alpha_to_one=False,
+    )
+    pipeline = StableDiffusionPipeline(
+        vae=vae,
+        text_encoder=text_encoder,
+        tokenizer=tokenizer,
+        unet=unet,
+        scheduler=scheduler,
+        safety_checker=None,
+        feature_extractor=None,
+        requires_safety_checker=False,
+    )
+    pipeline.save_pretrained(str(target_dir))
+    return target_dir
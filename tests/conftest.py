@@ -0,0 +1,30 @@
+"""Shared fixtures: a throwaway SQLite database with the app's schema."""
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    """Session factory over a fresh database holding dataset 1; the working directory is ``tmp_path``."""
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.database import Base
+    from app.models import Dataset
+
+    monkeypatch.chdir(tmp_path)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        async with factory() as db:
+            db.add(Dataset(id=1, name="test", type="mixed", path="uploads"))
+            await db.commit()
+        return factory
+
+    yield asyncio.run(setup())
+    asyncio.run(engine.dispose())
@@ -0,0 +1,51 @@
+"""Dataset index counters under concurrent updates."""
+import asyncio
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.dataset_index import add_files, remove_paths  # noqa: E402
+from app.models import Dataset, DatasetStats  # noqa: E402
+
+
+def _write_files(count):
+    directory = Path("uploads") / "documents" / "dataset_1"
+    directory.mkdir(parents=True)
+    paths = []
+    for i in range(count):
+        path = directory / f"file_{i}.csv"
+        path.write_text("x" * (i + 1))
+        paths.append(path)
+    return paths
+
+
+def test_concurrent_add_and_remove_keep_every_delta(session_factory):
+    paths = _write_files(12)
+
+    async def upload(path):
+        async with session_factory() as db:
+            await add_files(db, 1, [path])
+
+    async def delete(path):
+        async with session_factory() as db:
+            await remove_paths(db, [path])
+
+    async def counters():
+        async with session_factory() as db:
+            stats = await db.get(DatasetStats, 1)
+            dataset = await db.get(Dataset, 1)
+            return stats.num_files, stats.total_bytes, sum(stats.type_counts.values()), dataset.num_items
+
+    async def scenario():
+        # The first uploads race to create the counters row as well as to update it
+        await asyncio.gather(*(upload(path) for path in paths))
+        added = await counters()
+        # Removing the same file twice at once must only subtract it once
+        await asyncio.gather(*(delete(path) for path in paths[:4] + paths[:4]))
+        return added, await counters()
+
+    added, removed = asyncio.run(scenario())
+    assert added == (12, sum(range(1, 13)), 12, 12)
+    assert removed == (8, sum(range(5, 13)), 8, 8)
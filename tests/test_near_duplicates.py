@@ -0,0 +1,29 @@
+"""Near-duplicate grouping."""
+import asyncio
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("numpy")
+
+from app.models import DatasetFile  # noqa: E402
+from app.near_duplicates import find_near_duplicates  # noqa: E402
+
+
+def _image(file_id, phash, side):
+    return DatasetFile(id=file_id, dataset_id=1, path=f"uploads/images/dataset_1/{file_id}.png", file_type="image",
+                       extension=".png", size_bytes=side * side, width=side, height=side, phash=phash)
+
+
+def test_chain_keeps_images_far_from_the_kept_one(session_factory):
+    # A~B and B~C within 4 bits, but A and C are 6 bits apart
+    a, b, c = 0b000000, 0b000111, 0b111111
+
+    async def scenario():
+        async with session_factory() as db:
+            db.add_all([_image(1, a, 1024), _image(2, b, 512), _image(3, c, 256)])
+            await db.commit()
+            return await find_near_duplicates(db, 1, threshold=4)
+
+    groups = asyncio.run(scenario())
+    assert [(group.keep.id, [row.id for row in group.duplicates]) for group in groups] == [(1, [2])]